@@ -0,0 +1,289 @@
+"""Ordering
+
+Constraints saying one number is less than another, for urconstraintkanren.
+
+Working out what a pile of `lt` constraints means, say that `x` has to be at
+least 5 because `3 < y` and `y < x`, by looking through every one of them each
+time another is added gets slow once there are a lot of them. So they're kept
+as a graph instead, an edge from each number to each one it's less than, or
+less than or equal to, weighted by how much more the bigger one has to be: 1
+for `lt`, 0 for `le`. Every variable also has the smallest and largest values
+it could still have, which are pushed along the edges whenever one changes, so
+finding them is a single lookup.
+
+A new constraint fails if:
+    It would make a variable's smallest value more than its largest.
+    It would close a loop with a weight, eg. `x < y` when `y <= x`.
+
+Loops are found without searching the graph. Every variable has a potential,
+a number with no meaning of its own, kept so that along every edge the bigger
+variable's potential is at least the smaller one's plus the weight. Going
+round a loop with a weight would need a potential bigger than itself, so an
+edge that already fits the potentials can't close one, and is added straight
+away. Otherwise the potentials above the new edge are raised to fit, and if
+that comes back round to raise the edge's own smaller end, that's a loop. Only
+the variables whose potentials have to move are looked at, and when the new
+edge's smaller end has nothing below it, it's lowered instead and nothing has
+to move, so a chain of constraints costs the same however it's added.
+
+If a variable's smallest and largest values meet, then that's its value, and
+it's bound to it.
+
+The numbers are assumed to be integers, `x < 5` means `x` is at most 4.
+
+The graph lives in the `lt` constraint, as an Ordering, which reads as the set
+of `(less, more)` pairs `lt` was given, like any other constraint. Variables
+bound since their edges were added keep them, they still hold, but their `lt`
+and `le` constraints are woken and add edges for their new values.
+"""
+from collections.abc import Set
+from microkanren.persistent import PMap, PSet
+from microkanren.urconstraintkanren import State, walk, varq, make_constraint, generate, eq, bind, unit, mzero
+
+_NOWHERE = PMap()
+
+class Ordering(Set):
+    """The `lt` constraints of a State, and the graph made from them.
+    """
+    __slots__ = ('_pairs', '_above', '_under', '_lower', '_upper', '_potential')
+
+    def __init__(self):
+        self._pairs = PSet()
+        # The variables each variable is less than, with how much less, the
+        # same the other way round, and the smallest and largest value of each
+        # variable.
+        self._above = PMap()
+        self._under = PMap()
+        self._lower = PMap()
+        self._upper = PMap()
+        # See the module's docstring, a variable without one has 0.
+        self._potential = PMap()
+
+    @classmethod
+    def _from_iterable(cls, pairs):
+        """The set operators, eg. `|`, give a PSet, without the graph."""
+        return PSet(pairs)
+
+    def __contains__(self, pair):
+        return pair in self._pairs
+
+    def __iter__(self):
+        return iter(self._pairs)
+
+    def __len__(self):
+        return len(self._pairs)
+
+    __hash__ = Set._hash
+
+    def __repr__(self):
+        return "Ordering({%s})" % ", ".join([repr(pair) for pair in self])
+
+    def _copy(self):
+        ordering = Ordering.__new__(Ordering)
+        ordering._pairs = self._pairs
+        ordering._above = self._above
+        ordering._under = self._under
+        ordering._lower = self._lower
+        ordering._upper = self._upper
+        ordering._potential = self._potential
+        return ordering
+
+    def add(self, pair):
+        """@return: A new Ordering with `pair` in it, and the same graph."""
+        if pair in self._pairs:
+            return self
+        ordering = self._copy()
+        ordering._pairs = self._pairs.add(pair)
+        return ordering
+
+    def remove(self, pair):
+        """@return: A new Ordering without `pair`, and the same graph."""
+        if pair not in self._pairs:
+            return self
+        ordering = self._copy()
+        ordering._pairs = self._pairs.remove(pair)
+        return ordering
+
+    def bounds(self, variable):
+        """@return: The smallest and largest values `variable` could have,
+        either of which is None if there isn't one."""
+        return (self._lower.get(variable), self._upper.get(variable))
+
+    def order(self, less, more, weight):
+        """Add an edge saying `more` is at least `weight` more than `less`.
+
+        @param less: A walked term, a LogicVariable or a number.
+        @param more: Another, they can't both be numbers.
+        @param weight: 1 for less than, 0 for less than or equal to.
+        @return: The new Ordering and a list of the variables whose smallest or
+        largest value changed, or None if the edge can't be added.
+        """
+        ordering = self._copy()
+        raised = []
+        lowered = []
+        if varq(less) and varq(more):
+            if less == more:
+                return None if weight else (self, [])
+            edges = self._above.get(less, _NOWHERE)
+            if edges.get(more, -1) >= weight:
+                return (self, [])
+            potential = self._fit(less, more, weight)
+            if potential is None:
+                return None
+            ordering._potential = potential
+            ordering._above = self._above.set(less, edges.set(more, weight))
+            ordering._under = self._under.set(more, self._under.get(more, _NOWHERE).set(less, weight))
+            (lessLower, moreUpper) = (self._lower.get(less), self._upper.get(more))
+            if lessLower is not None:
+                raised.append((more, lessLower + weight))
+            if moreUpper is not None:
+                lowered.append((less, moreUpper - weight))
+        elif varq(more):
+            raised.append((more, less + weight))
+        else:
+            lowered.append((less, more - weight))
+        changed = []
+        if not ordering._raise(raised, changed) or not ordering._drop(lowered, changed):
+            return None
+        return (ordering, changed)
+
+    def _fit(self, less, more, weight):
+        """Move the potentials to fit a new edge from `less` to `more`.
+
+        @return: The new potentials, or None if the edge would close a loop
+        with a weight.
+        """
+        potential = self._potential
+        lessPotential = potential.get(less, 0)
+        morePotential = potential.get(more, 0)
+        if morePotential >= lessPotential + weight:
+            return potential
+        elif less not in self._under:
+            return potential.set(less, morePotential - weight)
+        pending = [(more, lessPotential + weight)]
+        while pending:
+            (variable, value) = pending.pop()
+            if potential.get(variable, 0) >= value:
+                continue
+            elif variable == less:
+                return None
+            potential = potential.set(variable, value)
+            for (above, edge) in self._above.get(variable, _NOWHERE).items():
+                pending.append((above, value + edge))
+        return potential
+
+    def _raise(self, pending, changed):
+        """Raise the smallest value of each variable in `pending`, and of
+        every variable above it in turn.
+
+        @param pending: `(variable, smallest)` pairs.
+        @param changed: A list each variable raised is added to.
+        @return: False if a variable's smallest value passes its largest.
+        """
+        lower = self._lower
+        while pending:
+            (variable, bound) = pending.pop()
+            current = lower.get(variable)
+            if current is not None and current >= bound:
+                continue
+            upper = self._upper.get(variable)
+            if upper is not None and bound > upper:
+                return False
+            lower = lower.set(variable, bound)
+            changed.append(variable)
+            for (above, weight) in self._above.get(variable, _NOWHERE).items():
+                pending.append((above, bound + weight))
+        self._lower = lower
+        return True
+
+    def _drop(self, pending, changed):
+        """The other way round from `_raise`, for the largest values of the
+        variables below each in `pending`."""
+        upper = self._upper
+        while pending:
+            (variable, bound) = pending.pop()
+            current = upper.get(variable)
+            if current is not None and current <= bound:
+                continue
+            lower = self._lower.get(variable)
+            if lower is not None and bound < lower:
+                return False
+            upper = upper.set(variable, bound)
+            changed.append(variable)
+            for (below, weight) in self._under.get(variable, _NOWHERE).items():
+                pending.append((below, bound - weight))
+        self._upper = upper
+        return True
+
+def ordering_of(state):
+    """The Ordering in `state`. A State made from a dictionary of constraints
+    won't have one, just the pairs, so it's made from those.
+
+    @return: An Ordering, or None if the constraints in `state` can't all be
+    met.
+    """
+    store = state.constraints.get("lt")
+    if isinstance(store, Ordering):
+        return store
+    result = Ordering()
+    substitution = state.constraints.get("eq", frozenset())
+    for (name, weight) in (("lt", 1), ("le", 0)):
+        for (less, more) in state.constraints.get(name, ()):
+            (lessValue, moreValue) = (walk(less, substitution), walk(more, substitution))
+            if varq(lessValue) or varq(moreValue):
+                ordered = result.order(lessValue, moreValue, weight)
+                if ordered is None:
+                    return None
+                result = ordered[0]
+            elif lessValue + weight > moreValue:
+                return None
+            if name == "lt":
+                result = result.add((less, more))
+    return result
+
+def _ordered(function, weight, less, more):
+    """The goal for `lt` or `le`."""
+    def ordered_help(state):
+        substitution = state.constraints.get("eq", frozenset())
+        lessValue = walk(less, substitution)
+        moreValue = walk(more, substitution)
+        if not(varq(lessValue) or varq(moreValue)):
+            return unit(state) if lessValue + weight <= moreValue else mzero
+        store = ordering_of(state)
+        ordered = None if store is None else store.order(lessValue, moreValue, weight)
+        if ordered is None:
+            return mzero
+        (store, changed) = ordered
+        constraints = state.constraints.set("lt", store)
+        state = State(constraints, state.constraintFunctions, state.count, state.id, state.watchers, state.woken)
+        goal = unit
+        for variable in set(changed):
+            (lower, upper) = store.bounds(variable)
+            if lower == upper:
+                goal = bind(goal, eq(variable, lower))
+        state = next(make_constraint(state, False, function, less, more))
+        return unit(state) if goal is unit else goal(state)
+    return generate(ordered_help)
+
+def lt(less, more):
+    """Asserts that `less` is less than `more`.
+
+    @param less: A number or LogicVariable.
+    @param more: A number or LogicVariable.
+    @return: A function that takes a state and returns a stream of states.
+    """
+    return _ordered(lt, 1, less, more)
+
+def gt(more, less):
+    """Asserts that `more` is more than `less`, which is `lt` the other way
+    round."""
+    return lt(less, more)
+
+def le(less, more):
+    """Asserts that `less` is less than or equal to `more`.
+
+    @param less: A number or LogicVariable.
+    @param more: A number or LogicVariable.
+    @return: A function that takes a state and returns a stream of states.
+    """
+    return _ordered(le, 0, less, more)
@@ -0,0 +1,582 @@
+"""Parallel
+
+The branches of a disjunction don't share anything, each carries on from its
+own state, so there's no reason they can't be searched at the same time on
+different cores. Python threads won't do that, so this runs them in a pool of
+processes.
+
+Splitting the search once at the start doesn't share the work out well though.
+In most searches nearly every branch dies straight away, and one or two go on
+for ages, so the process that gets those is still going long after the others
+have finished. So the work is shared out as it goes instead: a worker that has
+run out asks for a branch from the frontier of one that's still busy, which
+hands over the one nearest the root, where there's likely the most left to do.
+
+The goals are full of lambdas, which can't be pickled, so a branch can't be
+sent from one process to another as it is. What's sent instead is its path:
+which branch was taken at each disjunction, and which state from each leaf,
+on the way down to it from the root. The worker that takes it runs the search
+again from the root along that path to get to it, which is quick since it
+doesn't need to look at anything either side. That only works if running a
+goal in a state always gives the same thing, which a kanren's goals should.
+
+The processes are forked once the search has been set up, so each starts with
+its own copy of the root goal, and answers are the only other thing that gets
+pickled, on their way back. That means this needs the 'fork' start method, so
+it runs on Linux and the like, but not Windows.
+
+A run goes like this:
+
+    1. The first worker is given the root to search. All the others are
+       idle.
+    2. For each idle worker, the parent picks a busy one at random and asks it
+       for a branch. The busy one looks for requests every so often, and
+       hands over the path of the oldest Task in its frontier, if it has one,
+       through the parent. If it runs out first, it says so, and the idle one
+       asks someone else.
+    3. Answers are put on a queue as soon as they're found, `finish` getting a
+       chance to turn the states into something that can be pickled first, and
+       handed out in whatever order they come off it.
+    4. When every worker is idle, the search is over.
+
+If the caller stops asking for answers, the workers are told to stop, and do
+so the next time they look for requests. Either way, each sends back its
+WorkerStats as it finishes.
+
+Which strategy is quickest depends on the problem: interleaving for a relation
+with endless answers, depth first for a puzzle with few, and for either, the
+order the goals of a conjunction are written in can matter more than anything.
+When there's no telling in advance, a Portfolio runs several of them at once,
+each in a process of its own, and keeps the answers of whichever gets there
+first, handing them out as it finds them. The rest are killed, since they may
+never finish.
+
+Either can be given a Budget. The parent keeps an eye on the clock and for a
+cancellation, and stops the workers when either comes. Each worker has its own
+copy of the budget, so steps and waiting branches are counted for each worker
+on its own, and one that runs out stops the rest.
+"""
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import random
+import time
+from microkanren.search import Search, Task, Stream, Suspension, Exhausted, DEADLINE, CONJ, DISJ, FRESH, DEPTH_FIRST, PRIORITY, BEST_FIRST
+
+class Stopped(Exception):
+    """Raised in a worker once the caller has stopped asking for answers."""
+    pass
+
+class WorkerStats(object):
+    """What one worker of a ParallelSearch got up to.
+    """
+    __slots__ = ('expanded', 'answers', 'taken', 'given', 'recomputed', 'idle')
+
+    def __init__(self):
+        # Goals expanded while searching, not counting those recomputed.
+        self.expanded = 0
+        self.answers = 0
+        # Branches taken from other workers, and given to them.
+        self.taken = 0
+        self.given = 0
+        # Goals expanded to get back to the branches taken.
+        self.recomputed = 0
+        # Seconds spent waiting for something to do.
+        self.idle = 0.0
+
+    def __repr__(self):
+        return "WorkerStats(expanded=%i, answers=%i, taken=%i, given=%i, recomputed=%i, idle=%.3f)" % (
+            self.expanded, self.answers, self.taken, self.given, self.recomputed, self.idle)
+
+class Branch(Task):
+    """A Task that knows its way from the root, as a Lisp style list of
+    `(choice, rest)` pairs, the last choice first.
+    """
+    __slots__ = ('path',)
+
+    def __init__(self, state, goal, continuation, depth, path):
+        Task.__init__(self, state, goal, continuation, depth)
+        self.path = path
+
+class Branches(Stream):
+    """A Stream that knows its way from the root, and how many of its states
+    have been taken.
+    """
+    __slots__ = ('path', 'taken')
+
+    def __init__(self, states, continuation, depth, state, path):
+        Stream.__init__(self, states, continuation, depth, state)
+        self.path = path
+        self.taken = 1
+
+def unwind(path):
+    """The choices in a Lisp style path, root first."""
+    choices = []
+    while path is not None:
+        (choice, path) = path
+        choices.append(choice)
+    choices.reverse()
+    return tuple(choices)
+
+# How many goals a worker expands between looking for requests.
+_CHECK_EVERY = 32
+# How long to wait for a message before checking the workers are still alive.
+_WAIT = 0.5
+
+class Worker(object):
+    """Searches whatever branches it's given in one process of a
+    ParallelSearch, handing over branches of its own when asked.
+    """
+    def __init__(self, search, index, messages, inbox, wanted, stop):
+        """
+        @param search: The Search whose strategy, depth and cost to search with.
+        @param index: Which worker this is.
+        @param messages: The queue to the parent.
+        @param inbox: The queue from the parent, which sends `('root', ())`,
+        `('work', choices)` or `('stop', None)`.
+        @param wanted: A shared array, which holds one more than the index of
+        the worker wanting a branch from each worker, or 0.
+        @param stop: An Event set when the caller stops asking for answers.
+        """
+        self.search = search
+        self.index = index
+        self.messages = messages
+        self.inbox = inbox
+        self.wanted = wanted
+        self.stop = stop
+        self.stats = WorkerStats()
+        self.frontier = None
+
+    def run(self):
+        """Search branches until told to stop.
+
+        @return: A generator of every state found in the branches searched.
+        """
+        while True:
+            waited = time.time()
+            (kind, choices) = self.inbox.get()
+            self.stats.idle += time.time() - waited
+            if kind == 'stop':
+                return
+            elif kind == 'work':
+                self.stats.taken += 1
+            self.frontier = self.search.frontier = self.search.newFrontier()
+            for (state, depth) in self.explore(self.recompute(choices)):
+                yield state
+            self.messages.put(('idle', self.index, None))
+
+    def check(self):
+        """Stops if the caller has, and hands over a branch if one's wanted."""
+        if self.stop.is_set():
+            raise Stopped()
+        thief = self.wanted[self.index]
+        if thief:
+            branch = self.frontier.steal()
+            if branch is not None:
+                self.wanted[self.index] = 0
+                self.stats.given += 1
+                self.messages.put(('work', self.index, (thief - 1, unwind(branch.path))))
+
+    def recompute(self, choices):
+        """Get back to the branch at the end of `choices` from the root, making
+        each choice along the way.
+
+        @param choices: Which disjunct of each disjunction, and which state of
+        each leaf, root first.
+        @return: The Branch that was taken out of another worker's frontier.
+        """
+        search = self.search
+        expand = search.expand
+        inline = self.frontier.inline
+        (state, goal, continuation, depth, path) = (search.state, search.goal, None, 0, None)
+        for choice in choices:
+            # Run until the next choice.
+            while True:
+                if goal is None:
+                    (goal, continuation) = continuation
+                self.stats.recomputed += 1
+                (kind, value, state) = expand(goal, state)
+                if kind is CONJ:
+                    goal = None
+                    for conjunct in reversed(value):
+                        continuation = (conjunct, continuation)
+                elif kind is FRESH:
+                    (goal, depth) = (value, depth + 1)
+                elif kind is DISJ:
+                    (goal, depth) = (value[choice], depth + 1)
+                    break
+                elif type(value) is Suspension:
+                    (goal, state) = (value.goal, value.state)
+                else:
+                    state = next(itertools.islice(value, choice, None))
+                    goal = None
+                    if not inline:
+                        depth += choice
+                    break
+            path = (choice, path)
+        return Branch(state, goal, continuation, depth, path)
+
+    def explore(self, start):
+        """`Search.runFrontier`, but keeping track of the path to each branch,
+        and looking for requests every so often.
+
+        @param start: The Branch to search from.
+        @return: A generator of `(state, depth)` for every answer.
+        """
+        search = self.search
+        expand = search.expand
+        valid = search.valid
+        bound = search.depth
+        stats = self.stats
+        frontier = self.frontier
+        inline = frontier.inline
+        frontier.push(start)
+        while len(frontier):
+            item = frontier.pop()
+            if type(item) is Branches:
+                state = next(item.states, None)
+                if state is None:
+                    continue
+                (goal, continuation, depth, path) = (None, item.continuation, item.depth, (item.taken, item.path))
+                item.state = state
+                item.taken += 1
+                if not inline:
+                    item.depth = depth + 1
+                frontier.push(item)
+            else:
+                (state, goal, continuation, depth, path) = (item.state, item.goal, item.continuation, item.depth, item.path)
+            while True:
+                if goal is None:
+                    if valid is not None and not valid(state):
+                        break
+                    elif continuation is None:
+                        yield (state, depth)
+                        break
+                    (goal, continuation) = continuation
+                stats.expanded += 1
+                if stats.expanded % _CHECK_EVERY == 0:
+                    self.check()
+                (kind, value, state) = expand(goal, state)
+                if kind is CONJ:
+                    goal = None
+                    for conjunct in reversed(value):
+                        continuation = (conjunct, continuation)
+                elif kind is DISJ or kind is FRESH:
+                    if bound is not None and depth >= bound:
+                        break
+                    elif kind is FRESH and inline:
+                        (goal, depth) = (value, depth + 1)
+                    elif kind is FRESH:
+                        frontier.push(Branch(state, value, continuation, depth + 1, path))
+                        break
+                    else:
+                        frontier.extend([Branch(state, disjunct, continuation, depth + 1, (choice, path))
+                                         for (choice, disjunct) in enumerate(value)])
+                        break
+                elif type(value) is Suspension:
+                    (goal, state) = (value.goal, value.state)
+                else:
+                    goal = None
+                    states = iter(value)
+                    state = next(states, None)
+                    if state is None:
+                        break
+                    frontier.push(Branches(states, continuation, depth if inline else depth + 1, state, path))
+                    path = (0, path)
+
+# Everything the workers of each run need, by run number. The workers are
+# forked after it's filled in, so they have their own copy.
+_runs = {}
+_runNumbers = itertools.count()
+
+def _work(run, index):
+    """Be worker `index` of run `run`, putting each answer on the run's queue,
+    then `('done', index, stats)`.
+    """
+    (search, finish, messages, inboxes, wanted, stop) = _runs[run]
+    worker = Worker(search, index, messages, inboxes[index], wanted, stop)
+    try:
+        for answer in finish(worker.run()):
+            worker.stats.answers += 1
+            messages.put(('answer', index, answer))
+    except Stopped:
+        pass
+    except Exhausted as exhausted:
+        messages.put(('exhausted', index, exhausted.reason))
+    finally:
+        messages.put(('done', index, worker.stats))
+
+class ParallelSearch(object):
+    """Runs a goal against a state in a pool of processes that share the
+    work out between them as they go.
+    """
+    def __init__(self, goal, state, expand, valid=None, workers=None, strategy=DEPTH_FIRST,
+                 depth=None, cost=None, finish=None, initializer=None, budget=None):
+        """
+        @param goal: The goal to run.
+        @param state: The state to start in.
+        @param expand: The kanren's expand function, see `microkanren.search`.
+        @param valid: As for a `Search`.
+        @param workers: How many processes to use, by default one for each core.
+        @param strategy: How each worker searches, DEPTH_FIRST, PRIORITY or
+        BEST_FIRST.
+        @param depth: As for a `Search`.
+        @param cost: As for a `Search`.
+        @param finish: A function run in the worker, taking a stream of states
+        and returning a stream of answers, each of which must be picklable. By
+        default the states themselves.
+        @param initializer: A function each worker runs when it starts.
+        @param budget: A Budget that stops the search early, or None.
+        """
+        assert strategy in (DEPTH_FIRST, PRIORITY, BEST_FIRST), "Workers need a frontier strategy: %s" % strategy
+        self.search = Search(goal, state, expand, valid, strategy, depth, cost=cost, budget=budget)
+        self.budget = budget
+        self.workers = workers or os.cpu_count() or 1
+        self.finish = finish or (lambda states: states)
+        self.initializer = initializer
+        # The WorkerStats of each worker, once it's finished.
+        self.stats = [None] * self.workers
+
+    def run(self):
+        """Run the search.
+
+        @return: A generator of answers, in the order they're found, until
+        the budget, if there is one, runs out.
+        """
+        budget = self.budget
+        wait = _WAIT if budget is None else _WAIT / 10
+        if budget is not None:
+            budget.start()
+        context = multiprocessing.get_context('fork')
+        messages = context.Queue()
+        inboxes = [context.SimpleQueue() for index in range(self.workers)]
+        wanted = context.RawArray('i', self.workers)
+        stop = context.Event()
+        number = next(_runNumbers)
+        _runs[number] = (self.search, self.finish, messages, inboxes, wanted, stop)
+        executor = concurrent.futures.ProcessPoolExecutor(self.workers, context, self.initializer)
+        futures = []
+        try:
+            for index in range(self.workers):
+                futures.append(executor.submit(_work, number, index))
+            # The workers have all been forked by now, so they've got what they need.
+            del _runs[number]
+            busy = {0}
+            # Which worker each busy worker's been asked for a branch by.
+            asked = {}
+            waiting = list(range(1, self.workers))
+            inboxes[0].put(('root', ()))
+            while busy:
+                if budget is not None:
+                    try:
+                        budget.check()
+                    except Exhausted:
+                        return
+                for thief in list(waiting):
+                    victims = [victim for victim in busy if victim not in asked]
+                    if not victims:
+                        break
+                    victim = random.choice(victims)
+                    asked[victim] = thief
+                    wanted[victim] = thief + 1
+                    waiting.remove(thief)
+                try:
+                    (kind, index, value) = messages.get(timeout=wait)
+                except queue.Empty:
+                    # A worker that died without a word, leaves its future broken.
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            future.result()
+                    continue
+                if kind == 'answer':
+                    yield value
+                elif kind == 'work':
+                    (thief, choices) = value
+                    del asked[index]
+                    busy.add(thief)
+                    inboxes[thief].put(('work', choices))
+                elif kind == 'idle':
+                    busy.discard(index)
+                    waiting.append(index)
+                    if index in asked:
+                        # It ran out before it had anything to hand over.
+                        wanted[index] = 0
+                        waiting.append(asked.pop(index))
+                elif kind == 'exhausted':
+                    if budget.exhausted is None:
+                        budget.exhausted = value
+                    return
+                else:
+                    # Only a worker that's gone wrong finishes before it's told
+                    # to, and this raises whatever it was.
+                    self.stats[index] = value
+                    futures[index].result()
+        finally:
+            stop.set()
+            _runs.pop(number, None)
+            for inbox in inboxes:
+                inbox.put(('stop', None))
+            # A worker can't exit until what it's put on the queue has been
+            # read, so keep reading until they've all said they're done.
+            done = set()
+            while len(done) < len(futures):
+                try:
+                    (kind, index, value) = messages.get(timeout=_WAIT / 10)
+                except queue.Empty:
+                    # Unless one died without a word, and took the pool with it.
+                    if all(future.done() for future in futures) and any(future.exception() for future in futures):
+                        break
+                    continue
+                if kind == 'done':
+                    done.add(index)
+                    self.stats[index] = value
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def run(goal, state, expand, valid=None, workers=None, strategy=DEPTH_FIRST, depth=None, cost=None,
+        finish=None, initializer=None, budget=None):
+    """Search for `goal` in `state` on `workers` processes, see
+    `ParallelSearch`.
+
+    @return: A generator of answers, in the order they're found.
+    """
+    return ParallelSearch(goal, state, expand, valid, workers, strategy, depth, cost, finish, initializer, budget).run()
+
+# What the processes of each Portfolio run, by run number.
+_races = {}
+
+def _race(run, index):
+    """Run entry `index` of race `run`, putting `('answer', index, answer)` on
+    the race's queue as each answer is found, then `('done', index, None)`, or
+    `('exhausted', index, reason)` if the budget ran out first, or
+    `('error', index, error)` if it goes wrong.
+    """
+    (runs, results, finish, initializer, budget, messages) = _races[run]
+    try:
+        if initializer is not None:
+            initializer()
+        for answer in itertools.islice(finish(iter(runs[index]())), results):
+            message = ('answer', index, answer)
+            pickle.dumps(message)
+            messages.put(message)
+        if budget is not None and budget.exhausted is not None:
+            message = ('exhausted', index, budget.exhausted)
+        else:
+            message = ('done', index, None)
+    except Exception as error:
+        message = ('error', index, error)
+        try:
+            pickle.dumps(message)
+        except Exception:
+            message = ('error', index, RuntimeError(repr(error)))
+    messages.put(message)
+
+class Portfolio(object):
+    """Races several ways of running the same search, each in a process of its
+    own, and keeps the answers of whichever gets there first: the first to find
+    an answer, or to finish without finding any. The rest are killed as soon as
+    there's a winner, and the winner's answers are handed out as it finds them,
+    so a race over a relation with endless answers still gets going.
+    """
+    def __init__(self, runs, results=None, finish=None, initializer=None, budget=None):
+        """
+        @param runs: Functions that take nothing and return a stream of states.
+        Each is run in a forked process, so they can be lambdas.
+        @param results: The most answers to take from the winner, None for all
+        of them.
+        @param finish: As for a `ParallelSearch`.
+        @param initializer: A function each process runs when it starts.
+        @param budget: The Budget the runs were given, or None. Each process
+        has its own copy, and if the winner's runs out, the answers it found
+        by then are all there is. If every run's budget runs out before any
+        finds an answer there's no winner, nor is there one if the race is
+        cancelled first.
+        """
+        assert runs, "A race needs at least one runner."
+        self.runs = runs
+        self.results = results
+        self.finish = finish or (lambda states: states)
+        self.initializer = initializer
+        self.budget = budget
+        # The index of the run whose answers were kept, once there is one.
+        self.winner = None
+
+    def run(self):
+        """Run the race.
+
+        @return: A generator of the winner's answers, as it finds them. If
+        every run goes wrong before finding one, or the winner goes wrong
+        after, its error is raised.
+        """
+        budget = self.budget
+        wait = _WAIT if budget is None else _WAIT / 10
+        if budget is not None:
+            budget.start()
+        context = multiprocessing.get_context('fork')
+        messages = context.Queue()
+        number = next(_runNumbers)
+        _races[number] = (self.runs, self.results, self.finish, self.initializer, budget, messages)
+        processes = [context.Process(target=_race, args=(number, index), daemon=True) for index in range(len(self.runs))]
+        # How each run that's stopped did so, `(kind, value)` by index.
+        ended = {}
+        try:
+            for process in processes:
+                process.start()
+            del _races[number]
+            while (len(ended) < len(processes)) if self.winner is None else (self.winner not in ended):
+                if budget is not None:
+                    # The runs watch the clock themselves, and only get a
+                    # little longer to say what they found.
+                    try:
+                        budget.check()
+                    except Exhausted as exhausted:
+                        if exhausted.reason != DEADLINE or time.time() > budget.deadline + _WAIT:
+                            break
+                try:
+                    (kind, index, value) = messages.get(timeout=wait)
+                except queue.Empty:
+                    # One that finishes always says so first, so one that's
+                    # gone without a word was killed.
+                    for (index, process) in enumerate(processes):
+                        if process.exitcode and index not in ended and self.winner in (None, index):
+                            ended[index] = ('error', RuntimeError("Run %i died with exit code %i" % (index, process.exitcode)))
+                    continue
+                if self.winner is not None and index != self.winner:
+                    # Sent before it was killed.
+                    continue
+                elif kind == 'answer' or kind == 'done':
+                    if self.winner is None:
+                        self.winner = index
+                        for (other, process) in enumerate(processes):
+                            if other != index and process.is_alive():
+                                process.terminate()
+                    if kind == 'answer':
+                        yield value
+                        continue
+                ended[index] = (kind, value)
+        finally:
+            _races.pop(number, None)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                if process.pid is not None:
+                    process.join()
+            messages.close()
+        if self.winner is not None:
+            (kind, value) = ended.get(self.winner, ('done', None))
+        else:
+            reasons = [value for (kind, value) in ended.values() if kind == 'exhausted']
+            errors = [ended[index][1] for index in sorted(ended) if ended[index][0] == 'error']
+            if reasons:
+                (kind, value) = ('exhausted', reasons[0])
+            elif budget is not None and budget.exhausted is not None:
+                return
+            else:
+                (kind, value) = ('error', errors[0])
+        if kind == 'exhausted':
+            budget.exhausted = value
+        elif kind == 'error':
+            raise value
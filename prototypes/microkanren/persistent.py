@@ -0,0 +1,472 @@
+"""Persistent Data Structures
+
+Every time a goal succeeds in micro-kanren it hands back a new state, and the
+state it was handed stays exactly as it was, because a sibling branch of a
+`Disj` may still need it. The obvious way to do that is to copy the
+substitution every time a variable is bound, which is simple, easy to read and
+O(n) for every single unification.
+
+The structures in this module are persistent, which is a fancy way of saying
+that 'changing' one of them returns a new version and leaves the old one alone,
+but the new version shares almost all of its storage with the old one. Adding
+a binding to a map with a million entries only allocates the handful of nodes
+on the path from the root to the new entry.
+
+The map is a Hash Array Mapped Trie, as described in:
+
+Ideal Hash Trees
+    https://infoscience.epfl.ch/record/64398/files/idealhashtrees.pdf
+
+The vector is the same idea with the hashing taken out, small non-negative
+integers are used directly as the path through the trie. The set is just the
+map, with each value kept as its own key.
+"""
+from collections.abc import Mapping, Set
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+_HASH_MASK = (1 << 64) - 1
+
+def _hash(key):
+    """Python hashes can be negative, the trie wants 64 nice positive bits."""
+    return hash(key) & _HASH_MASK
+
+def _bit_count(number):
+    return bin(number).count("1")
+
+class _BitmapNode(object):
+    """A node in the trie holds up to 32 entries. Rather than keeping a sparse
+    32 slot array, `bitmap` records which of the slots are used and `entries`
+    only holds the used ones, in order.
+
+    Each entry is either a leaf, the tuple `(hash, key, value)`, or another
+    node one level down.
+    """
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def get(self, shift, keyHash, key, default):
+        node = self
+        while True:
+            bit = 1 << ((keyHash >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return default
+            entry = node.entries[_bit_count(node.bitmap & (bit - 1))]
+            if type(entry) is tuple:
+                if entry[0] == keyHash and (entry[1] is key or entry[1] == key):
+                    return entry[2]
+                return default
+            elif type(entry) is _CollisionNode:
+                return entry.get(shift, keyHash, key, default)
+            node = entry
+            shift += _BITS
+
+    def set(self, shift, keyHash, key, value):
+        """@return: A tuple of the new node, and True if the map got bigger.
+        If nothing changed at all, the node returned is this node."""
+        bit = 1 << ((keyHash >> shift) & _MASK)
+        index = _bit_count(self.bitmap & (bit - 1))
+        if not self.bitmap & bit:
+            entries = self.entries[:index] + ((keyHash, key, value),) + self.entries[index:]
+            return (_BitmapNode(self.bitmap | bit, entries), True)
+        entry = self.entries[index]
+        if type(entry) is tuple:
+            if entry[0] == keyHash and (entry[1] is key or entry[1] == key):
+                if entry[2] is value:
+                    return (self, False)
+                return (self._replace(index, (keyHash, key, value)), False)
+            child = _merge(shift + _BITS, entry[0], entry, keyHash, (keyHash, key, value))
+            return (self._replace(index, child), True)
+        (child, added) = entry.set(shift + _BITS, keyHash, key, value)
+        if child is entry:
+            return (self, False)
+        return (self._replace(index, child), added)
+
+    def remove(self, shift, keyHash, key):
+        """@return: The new node, None if the node is now empty, or this node
+        if `key` wasn't there."""
+        bit = 1 << ((keyHash >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return self
+        index = _bit_count(self.bitmap & (bit - 1))
+        entry = self.entries[index]
+        if type(entry) is tuple:
+            if not (entry[0] == keyHash and (entry[1] is key or entry[1] == key)):
+                return self
+            child = None
+        else:
+            child = entry.remove(shift + _BITS, keyHash, key)
+            if child is entry:
+                return self
+        if child is None:
+            if self.bitmap == bit:
+                return None
+            return _BitmapNode(self.bitmap ^ bit, self.entries[:index] + self.entries[index + 1:])
+        if type(child) is not tuple and len(child.entries) == 1 and type(child.entries[0]) is tuple:
+            # Don't leave a chain of nodes with a single leaf at the bottom.
+            child = child.entries[0]
+        return self._replace(index, child)
+
+    def _replace(self, index, entry):
+        return _BitmapNode(self.bitmap, self.entries[:index] + (entry,) + self.entries[index + 1:])
+
+    def __iter__(self):
+        for entry in self.entries:
+            if type(entry) is tuple:
+                yield entry
+            else:
+                yield from entry
+
+class _CollisionNode(object):
+    """When two different keys have exactly the same hash there are no bits
+    left to tell them apart, so they just get stored side by side."""
+    __slots__ = ('keyHash', 'entries')
+
+    def __init__(self, keyHash, entries):
+        self.keyHash = keyHash
+        self.entries = entries
+
+    def get(self, shift, keyHash, key, default):
+        for entry in self.entries:
+            if entry[1] is key or entry[1] == key:
+                return entry[2]
+        return default
+
+    def set(self, shift, keyHash, key, value):
+        if keyHash != self.keyHash:
+            return (_merge(shift, self.keyHash, self, keyHash, (keyHash, key, value)), True)
+        for (index, entry) in enumerate(self.entries):
+            if entry[1] is key or entry[1] == key:
+                if entry[2] is value:
+                    return (self, False)
+                entries = self.entries[:index] + ((keyHash, key, value),) + self.entries[index + 1:]
+                return (_CollisionNode(keyHash, entries), False)
+        return (_CollisionNode(keyHash, self.entries + ((keyHash, key, value),)), True)
+
+    def remove(self, shift, keyHash, key):
+        for (index, entry) in enumerate(self.entries):
+            if entry[1] is key or entry[1] == key:
+                entries = self.entries[:index] + self.entries[index + 1:]
+                if len(entries) == 1:
+                    return _BitmapNode(1 << ((keyHash >> shift) & _MASK), entries)
+                return _CollisionNode(keyHash, entries)
+        return self
+
+    def __iter__(self):
+        return iter(self.entries)
+
+def _merge(shift, hash1, entry1, hash2, entry2):
+    """Build the smallest subtree that holds both entries."""
+    if hash1 == hash2:
+        return _CollisionNode(hash1, (entry1, entry2))
+    slot1 = (hash1 >> shift) & _MASK
+    slot2 = (hash2 >> shift) & _MASK
+    if slot1 == slot2:
+        return _BitmapNode(1 << slot1, (_merge(shift + _BITS, hash1, entry1, hash2, entry2),))
+    elif slot1 < slot2:
+        return _BitmapNode((1 << slot1) | (1 << slot2), (entry1, entry2))
+    else:
+        return _BitmapNode((1 << slot1) | (1 << slot2), (entry2, entry1))
+
+_EMPTY_NODE = _BitmapNode(0, ())
+
+class PMap(Mapping):
+    """A persistent dictionary. It reads exactly like a dictionary, but instead
+    of changing it in place `set`, `remove` and `merge` return a new PMap and
+    leave this one untouched.
+
+        >>> first = PMap({'Alice': 'small'})
+        >>> second = first.set('Alice', 'large')
+        >>> first['Alice'], second['Alice']
+        ('small', 'large')
+    """
+    __slots__ = ('_root', '_length')
+
+    def __init__(self, initial=None):
+        """@param initial: An optional mapping, or iterable of key/value pairs,
+        to start the map with.
+        """
+        self._root = _EMPTY_NODE
+        self._length = 0
+        if initial:
+            items = initial.items() if isinstance(initial, Mapping) else initial
+            for (key, value) in items:
+                keyHash = _hash(key)
+                (self._root, added) = self._root.set(0, keyHash, key, value)
+                self._length += added
+
+    @classmethod
+    def _make(cls, root, length):
+        pmap = cls.__new__(cls)
+        pmap._root = root
+        pmap._length = length
+        return pmap
+
+    def __getitem__(self, key):
+        value = self._root.get(0, _hash(key), key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        return self._root.get(0, _hash(key), key, default)
+
+    def __contains__(self, key):
+        return self._root.get(0, _hash(key), key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        for entry in self._root:
+            yield entry[1]
+
+    def items(self):
+        """Unlike `dict.items` this is a plain generator, not a view."""
+        for entry in self._root:
+            yield (entry[1], entry[2])
+
+    def values(self):
+        for entry in self._root:
+            yield entry[2]
+
+    def __len__(self):
+        return self._length
+
+    def __eq__(self, other):
+        if isinstance(other, PMap):
+            if self._root is other._root:
+                return True
+        elif not isinstance(other, Mapping):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        for (key, value) in self.items():
+            otherValue = other.get(key, _MISSING)
+            if otherValue is _MISSING or not (otherValue is value or otherValue == value):
+                return False
+        return True
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "PMap({%s})" % ", ".join(["%r: %r" % item for item in self.items()])
+
+    def set(self, key, value):
+        """@return: A new PMap with `key` set to `value`."""
+        (root, added) = self._root.set(0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return PMap._make(root, self._length + added)
+
+    def remove(self, key):
+        """@return: A new PMap without `key`, or this one if `key` isn't in it."""
+        root = self._root.remove(0, _hash(key), key)
+        if root is self._root:
+            return self
+        return PMap._make(_EMPTY_NODE if root is None else root, self._length - 1)
+
+    def merge(self, other):
+        """@param other: A mapping or iterable of key/value pairs.
+        @return: A new PMap with every pair in `other` added, the values in
+        `other` win if a key is in both."""
+        items = other.items() if isinstance(other, Mapping) else other
+        root = self._root
+        length = self._length
+        for (key, value) in items:
+            (root, added) = root.set(0, _hash(key), key, value)
+            length += added
+        if root is self._root:
+            return self
+        return PMap._make(root, length)
+
+class PSet(Set):
+    """A persistent set. It reads like a frozenset, and compares equal to one
+    with the same values, but `add` and `remove` return a new PSet that
+    shares almost everything with this one.
+
+        >>> first = PSet({'Dum'})
+        >>> second = first.add('Dee')
+        >>> len(first), len(second)
+        (1, 2)
+    """
+    __slots__ = ('_map',)
+
+    def __init__(self, initial=()):
+        """@param initial: An optional iterable of values to start the set with.
+        """
+        self._map = PMap((value, value) for value in initial)
+
+    @classmethod
+    def _make(cls, pmap):
+        pset = cls.__new__(cls)
+        pset._map = pmap
+        return pset
+
+    @classmethod
+    def _from_iterable(cls, values):
+        """Lets the set operators, eg. `|`, build a PSet."""
+        return cls(values)
+
+    def __contains__(self, value):
+        return value in self._map
+
+    def __iter__(self):
+        return iter(self._map)
+
+    def __len__(self):
+        return len(self._map)
+
+    __hash__ = Set._hash
+
+    def __repr__(self):
+        return "PSet({%s})" % ", ".join([repr(value) for value in self])
+
+    def add(self, value):
+        """@return: A new PSet with `value` in it, or this one if it already is."""
+        if value in self._map:
+            return self
+        return PSet._make(self._map.set(value, value))
+
+    def remove(self, value):
+        """@return: A new PSet without `value`, or this one if it isn't in it."""
+        pmap = self._map.remove(value)
+        return self if pmap is self._map else PSet._make(pmap)
+
+# A PVector's nodes are narrower than a PMap's. Setting an index copies every
+# node on the way down to it, and the nodes of a vector are never short of
+# slots, so a copy costs its full width whatever's in it.
+_VECTOR_BITS = 3
+_VECTOR_WIDTH = 1 << _VECTOR_BITS
+_VECTOR_MASK = _VECTOR_WIDTH - 1
+
+class PVector(object):
+    """A persistent, sparse vector indexed by non-negative integers. The
+    values are kept in chunks of 8, and the chunks are the leaves of a trie,
+    so setting an index copies one chunk and the few nodes above it, and
+    leaves everything else shared with the vector it came from. Small chunks
+    make for a deeper trie, but much less to copy each time.
+
+    It reads like a mapping from index to value, with the indexes that have
+    never been set simply missing, which is what you want when the indexes are
+    handed out in order and most of them get a value sooner or later.
+    """
+    __slots__ = ('_root', '_shift', '_length')
+
+    def __init__(self, initial=None):
+        """@param initial: An optional mapping, or iterable of index/value pairs.
+        """
+        self._root = _EMPTY_CHUNK
+        self._shift = 0
+        self._length = 0
+        if initial:
+            items = initial.items() if isinstance(initial, Mapping) else initial
+            vector = self
+            for (index, value) in items:
+                vector = vector.set(index, value)
+            (self._root, self._shift, self._length) = (vector._root, vector._shift, vector._length)
+
+    @classmethod
+    def _make(cls, root, shift, length):
+        vector = cls.__new__(cls)
+        vector._root = root
+        vector._shift = shift
+        vector._length = length
+        return vector
+
+    def get(self, index, default=None):
+        if index >> (self._shift + _VECTOR_BITS):
+            return default
+        node = self._root
+        shift = self._shift
+        while shift:
+            node = node[(index >> shift) & _VECTOR_MASK]
+            if node is None:
+                return default
+            shift -= _VECTOR_BITS
+        value = node[index & _VECTOR_MASK]
+        return default if value is _MISSING else value
+
+    def __getitem__(self, index):
+        value = self.get(index, _MISSING)
+        if value is _MISSING:
+            raise KeyError(index)
+        return value
+
+    def __contains__(self, index):
+        return self.get(index, _MISSING) is not _MISSING
+
+    def __len__(self):
+        """The number of indexes that have a value, not the highest index."""
+        return self._length
+
+    def set(self, index, value):
+        """@return: A new PVector with `index` set to `value`."""
+        assert index >= 0, "PVector indexes can't be negative."
+        root = self._root
+        shift = self._shift
+        while index >> (shift + _VECTOR_BITS):
+            root = (root,) + (None,) * (_VECTOR_WIDTH - 1)
+            shift += _VECTOR_BITS
+        (root, added) = _vector_set(root, shift, index, value)
+        if root is None:
+            return self
+        return PVector._make(root, shift, self._length + added)
+
+    def items(self):
+        """Yields each index/value pair in order of index."""
+        stack = [(self._root, self._shift, 0)]
+        while stack:
+            (node, shift, offset) = stack.pop()
+            if shift:
+                for slot in range(_VECTOR_WIDTH - 1, -1, -1):
+                    if node[slot] is not None:
+                        stack.append((node[slot], shift - _VECTOR_BITS, offset + (slot << shift)))
+            else:
+                for slot in range(_VECTOR_WIDTH):
+                    if node[slot] is not _MISSING:
+                        yield (offset + slot, node[slot])
+
+    def __iter__(self):
+        for (index, value) in self.items():
+            yield index
+
+    def values(self):
+        for (index, value) in self.items():
+            yield value
+
+    def __eq__(self, other):
+        if not isinstance(other, PVector):
+            return NotImplemented
+        return self._root is other._root or list(self.items()) == list(other.items())
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "PVector({%s})" % ", ".join(["%r: %r" % item for item in self.items()])
+
+def _vector_set(node, shift, index, value):
+    """@return: The new node and True if the vector got bigger, or `(None,
+    False)` if nothing changed."""
+    slot = (index >> shift) & _VECTOR_MASK
+    if shift == 0:
+        old = node[slot]
+        if old is value:
+            return (None, False)
+        return (node[:slot] + (value,) + node[slot + 1:], old is _MISSING)
+    child = node[slot]
+    if child is None:
+        child = _EMPTY_CHUNK if shift == _VECTOR_BITS else (None,) * _VECTOR_WIDTH
+    (child, added) = _vector_set(child, shift - _VECTOR_BITS, index, value)
+    if child is None:
+        return (None, False)
+    return (node[:slot] + (child,) + node[slot + 1:], added)
+
+class _Missing(object):
+    def __repr__(self):
+        return "MISSING"
+
+_MISSING = _Missing()
+
+_EMPTY_CHUNK = (_MISSING,) * _VECTOR_WIDTH
@@ -0,0 +1,748 @@
+"""Search
+
+In micro-kanren as it's usually written, every conjunction and disjunction is a
+generator wrapped around the generators of the goals inside it. That's lovely
+to read, but every answer has to climb up through every one of those
+generators to get out, a `yield from` at a time, and a recursive relation
+builds a new layer of them for every step it recurses, until Python's recursion
+limit puts a stop to it.
+
+This module runs the same search from a single loop. The streams of states are
+still there, arranged in the same tree as the generators were, but each one is
+a small object that remembers where it is, rather than a suspended Python
+frame:
+
+    Pending: A goal that's been handed a state, but not run yet.
+    Leaf: The states coming out of a goal that was run the ordinary way.
+    Mplus: Takes a state from each of a disjunction's streams in turn.
+    Bind: Feeds every state from the first goal of a conjunction into the
+        second, every state from those into the third, and so on, taking a
+        state from each of the resulting streams in turn, a level at a time.
+
+To get the next state the loop asks the root of the tree for one. A node that
+needs a state from one of its children says so, and the loop goes to that child
+next, keeping the way it came on a list rather than on Python's stack. When a
+state, or the news that a stream has run dry, comes back up the list, each node
+on the way picks up exactly where it left off. Since the nodes take their turns
+in the same order the generators did, the answers come out in the same order,
+with the same fairness: a stream that never ends can't stop the streams beside
+it from getting their turn.
+
+Nothing is run before it's needed, a Pending node is only expanded the first
+time a state is asked of it. That's where the engine finds out what a goal is,
+from the `expand` function it's handed, which knows the goals of a particular
+kanren. It takes a goal and a state and returns one of:
+
+    (CONJ, goals, state)
+    (DISJ, goals, state)
+    (FRESH, goal, state): `goal` is what the fresh goal built, `state` is the
+        state to run it in.
+    (LEAF, result, state): `result` is what running the goal gave back,
+        either a stream of states or a Suspension.
+
+Interleaving is fair, but it keeps every branch it has started alive until it
+runs dry. For a finite problem that's a lot of memory spent on branches that
+won't be looked at again for a long time, so there are other strategies to
+choose from:
+
+    INTERLEAVE: The fair interleaving described above, and the default.
+    DEPTH_FIRST: Follows one branch all the way to an answer or a dead end
+        before backing up to the most recent choice and trying the next
+        branch there. Only the branches not yet tried at each choice are kept,
+        but a branch that never ends will never be backed out of.
+    ITERATIVE_DEEPENING: Depth first, but giving up on any branch more than a
+        certain depth deep, then starting again one deeper, until a search
+        finishes without giving up on anything. Every answer is found
+        eventually, like interleaving, with the memory of depth first, at the
+        price of going over the shallow parts of the search again each time.
+    PRIORITY: Always carries on with whichever branch costs the least,
+        keeping the branches in a heap, so picking the next one takes time
+        proportional to the log of how many there are, where interleaving gives
+        every branch a turn. By default the cost is the depth, so the shallowest
+        branch goes first, and of those the oldest. Given a `cost` function
+        instead, it's called with a branch's state and depth. A cost of None
+        means the branch can't lead anywhere worth going, and it's dropped
+        rather than kept in the heap.
+    BEST_FIRST: For planning, where the `cost` is a guess at how far a state
+        is from an answer, plus how far it's come for A*. The cost only decides
+        between the branches of a disjunction, and between the states from a
+        leaf. Otherwise a branch carries straight on like depth first, so a
+        cost that takes a while to work out isn't worked out for every fresh
+        goal. Like depth first, a branch that never makes a choice never ends.
+
+The depth of a branch is the number of disjunctions and fresh goals it has
+gone through, and all but interleaving can be given a `depth` they'll never go
+beyond. Those keep their branches in a Frontier, a Stack for depth first or a
+PriorityQueue, which holds:
+
+    Task: A goal still to be run against a state, along with the goals to run
+        after it, kept as a Lisp style list of `(goal, rest)` pairs.
+    Stream: The rest of the states from a leaf, each of which carries on with
+        the goals after it. In a PriorityQueue each state after the first
+        counts as one deeper than the last, otherwise a leaf with endless
+        states would always be the shallowest branch, and nothing else would
+        ever get a turn. For the same reason, fresh goals go back in a
+        PriorityQueue rather than being carried straight on with. So long as
+        the cost goes up with depth, every answer is found eventually.
+
+A conjunction that interleaves starts a new stream for every state from its
+first goal, and keeps them all going. If the first goal can make states forever
+(`list_leno` on an unbound length, say) that's forever more memory. Given
+`maxStreams`, each level of a conjunction stops taking states from the streams
+it has while the next level already has that many going, and goes back to them
+as those run dry. That keeps memory down, but it's not fair any more: if the
+streams at the next level never run dry, the states the level before them
+hasn't made yet are never got to. How many
+streams are going, the most there have been, and how many times a conjunction
+put off taking another state, are counted in the search's SearchStats.
+
+Given a Budget, a search stops once it's taken as many steps as it's allowed,
+run out of time, has too many branches waiting, or been cancelled from another
+thread, whichever comes first. All but the time are checked before every step,
+so a search never takes a step with more branches waiting than it's allowed. The answers it found before then are all
+there is, and the budget says why it stopped. A step is a goal expanded, or a
+state taken from a leaf, so a goal making states forever uses it up as surely
+as one recursing forever. What a goal does inside a leaf before handing over
+its next state can't be stopped, though.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+CONJ = 'conj'
+DISJ = 'disj'
+FRESH = 'fresh'
+LEAF = 'leaf'
+
+INTERLEAVE = 'interleave'
+DEPTH_FIRST = 'depth-first'
+ITERATIVE_DEEPENING = 'iterative-deepening'
+PRIORITY = 'priority'
+BEST_FIRST = 'best-first'
+
+# Why a search stopped early, see Budget.
+STEPS = 'steps'
+DEADLINE = 'deadline'
+STATES = 'states'
+CANCELLED = 'cancelled'
+
+# What a node is handed when it's being asked for a state, rather than being
+# handed one by a child, and what it hands back when it has no more.
+_NEXT = object()
+_DONE = object()
+
+class Suspension(object):
+    """A goal that's been handed a state, but hasn't been run yet.
+
+    A goal that's run from inside a leaf, rather than being one of the goals in
+    a conjunction or disjunction, can return one of these instead of running a
+    search of its own. When the engine finds one coming out of a leaf it just
+    carries on with the goal inside, so there's still only the one loop.
+
+    Anything else that finds one can treat it as a stream of states, iterating
+    over it runs a search for it.
+    """
+    __slots__ = ('goal', 'state', 'expand')
+
+    def __init__(self, goal, state, expand):
+        self.goal = goal
+        self.state = state
+        self.expand = expand
+
+    def __iter__(self):
+        return Search(self.goal, self.state, self.expand).run()
+
+class Node(object):
+    """A stream of states in the search tree.
+    """
+    __slots__ = ()
+
+    def step(self, received):
+        """Move the stream along.
+
+        @param received: `_NEXT` if this node is being asked for a state,
+        otherwise what the child it last asked came back with, a state or
+        `_DONE`.
+        @return: A state, `_DONE` if there are no more, or a child Node that
+        has to be asked for a state first.
+        """
+        raise NotImplementedError
+
+class Pending(Node):
+    """A goal that hasn't been run against its state yet.
+    """
+    __slots__ = ('goal', 'state', 'search')
+
+    def __init__(self, goal, state, search):
+        self.goal = goal
+        self.state = state
+        self.search = search
+
+    def force(self):
+        """Run the goal, as far as finding out what kind of goal it is.
+
+        @return: The Node that streams its states, which is never a Pending.
+        """
+        (goal, state, search) = (self.goal, self.state, self.search)
+        while True:
+            (kind, value, state) = search.expand(goal, state)
+            if kind is CONJ:
+                if not value:
+                    return Leaf(iter((state,)))
+                elif len(value) > 1:
+                    return Bind(Pending(value[0], state, search), value[1:], search)
+                goal = value[0]
+            elif kind is DISJ:
+                return Mplus([Pending(disjunct, state, search) for disjunct in value])
+            elif kind is FRESH:
+                goal = value
+            elif type(value) is Suspension:
+                (goal, state) = (value.goal, value.state)
+            else:
+                return Leaf(iter(value))
+
+    def step(self, received):
+        return self.force().step(received)
+
+class Leaf(Node):
+    """The states from a goal that was run the ordinary way.
+    """
+    __slots__ = ('states',)
+
+    def __init__(self, states):
+        self.states = states
+
+    def step(self, received):
+        return next(self.states, _DONE)
+
+class Mplus(Node):
+    """A state from each stream in turn, until they've all run dry.
+    """
+    __slots__ = ('streams', 'kept', 'index')
+
+    def __init__(self, streams):
+        self.streams = streams
+        self.kept = []
+        self.index = 0
+
+    def step(self, received):
+        if received is not _NEXT:
+            stream = self.streams[self.index]
+            self.index += 1
+            if received is not _DONE:
+                self.kept.append(stream)
+                return received
+        if self.index == len(self.streams):
+            (self.streams, self.kept, self.index) = (self.kept, [], 0)
+            if not self.streams:
+                return _DONE
+        stream = self.streams[self.index]
+        if type(stream) is Pending:
+            stream = self.streams[self.index] = stream.force()
+        return stream
+
+class Bind(Node):
+    """Feeds the states from `source` through `goals`, a level at a time, the
+    way micro-kanren's conjunction did. Every state from a stream at one level
+    starts a stream of its own at the next, running the goal after it, and the
+    states from the last level are the answers. Each round, every stream at
+    every level, from the first to the last, takes a turn to produce a state,
+    including the streams started earlier in the same round. Once they've all
+    run dry, so has the Bind. While there are `maxStreams` streams going at the
+    next level, the streams at a level aren't asked for any more.
+    """
+    __slots__ = ('goals', 'search', 'levels', 'last', 'level', 'streams', 'kept', 'index', 'going')
+
+    def __init__(self, source, goals, search):
+        self.goals = goals
+        self.search = search
+        self.levels = [[source]] + [[] for goal in goals]
+        self.last = len(goals)
+        self.level = 0
+        # The streams at the level that's taking its turn.
+        self.streams = self.levels[0]
+        self.kept = []
+        self.index = 0
+        # Whether any stream has kept going this round.
+        self.going = False
+
+    def step(self, received):
+        if received is not _NEXT:
+            stream = self.streams[self.index]
+            self.index += 1
+            if received is not _DONE:
+                self.kept.append(stream)
+                level = self.level
+                if level == self.last:
+                    return received
+                search = self.search
+                if search.valid is None or search.valid(received):
+                    self.levels[level + 1].append(Pending(self.goals[level], received, search))
+                    search.stats.started()
+            elif self.level:
+                self.search.stats.live -= 1
+        while True:
+            streams = self.streams
+            index = self.index
+            if index < len(streams):
+                level = self.level
+                maxStreams = self.search.maxStreams
+                if maxStreams is None or level == self.last or len(self.levels[level + 1]) < maxStreams:
+                    stream = streams[index]
+                    if type(stream) is Pending:
+                        stream = streams[index] = stream.force()
+                    return stream
+                self.search.stats.deferred += 1
+                self.kept.extend(streams[index:])
+            # That's the level's turn over, on to the next.
+            levels = self.levels
+            level = self.level
+            kept = levels[level] = self.kept
+            if kept:
+                self.going = True
+            (self.kept, self.index) = ([], 0)
+            level += 1
+            if level > self.last:
+                if not self.going:
+                    return _DONE
+                (level, self.going) = (0, False)
+            self.level = level
+            self.streams = levels[level]
+
+class SearchStats(object):
+    """Counts the streams the conjunctions in an interleaving search have going.
+    """
+    __slots__ = ('live', 'peak', 'deferred')
+
+    def __init__(self):
+        self.live = 0
+        self.peak = 0
+        self.deferred = 0
+
+    def __repr__(self):
+        return "SearchStats(live=%i, peak=%i, deferred=%i)" % (self.live, self.peak, self.deferred)
+
+    def started(self):
+        self.live += 1
+        if self.live > self.peak:
+            self.peak = self.live
+
+class Exhausted(Exception):
+    """Raised from inside a search when its Budget has run out."""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+class Budget(object):
+    """How much work a search may do. One of these can be handed to several
+    searches, which share it.
+    """
+    # How many steps between looking at the clock, which is the only check
+    # that isn't made every step.
+    checkEvery = 64
+
+    def __init__(self, steps=None, seconds=None, states=None):
+        """
+        @param steps: The most goals expanded and states taken from leaves,
+        None for no limit.
+        @param seconds: How long the search may take from when it starts,
+        None for no limit.
+        @param states: The most branches a search may have waiting, in its
+        frontier or, when interleaving, as the streams of its conjunctions.
+        None for no limit.
+        """
+        self.steps = steps
+        self.seconds = seconds
+        self.states = states
+        # The time after which any search with this budget stops.
+        self.deadline = None
+        self.used = 0
+        # Why a search with this budget stopped early: STEPS, DEADLINE, STATES
+        # or CANCELLED, or None if none has.
+        self.exhausted = None
+        self._cancelled = threading.Event()
+
+    def __repr__(self):
+        return "Budget(steps=%r, seconds=%r, states=%r, used=%i, exhausted=%r)" % (
+            self.steps, self.seconds, self.states, self.used, self.exhausted)
+
+    def start(self):
+        """Start the clock, if it isn't already going."""
+        if self.deadline is None and self.seconds is not None:
+            self.deadline = time.time() + self.seconds
+
+    def cancel(self):
+        """Stop every search with this budget the next time it checks. Safe to
+        call from any thread.
+        """
+        self._cancelled.set()
+
+    def stop(self, reason):
+        if self.exhausted is None:
+            self.exhausted = reason
+        raise Exhausted(reason)
+
+    def check(self, live=None):
+        """Raise Exhausted if the time's up, the search has been cancelled, or
+        there are more than `states` of the `live` branches.
+        """
+        if self._cancelled.is_set():
+            self.stop(CANCELLED)
+        elif self.deadline is not None and time.time() > self.deadline:
+            self.stop(DEADLINE)
+        elif self.states is not None and live is not None and live > self.states:
+            self.stop(STATES)
+
+    def step(self, search):
+        """Count a step of `search`, and stop it if it has too many branches
+        waiting or has been cancelled. The clock is only looked at every
+        `checkEvery` steps.
+        """
+        self.used += 1
+        if self.steps is not None and self.used > self.steps:
+            self.stop(STEPS)
+        elif self.states is not None and search.live() > self.states:
+            self.stop(STATES)
+        elif self._cancelled.is_set():
+            self.stop(CANCELLED)
+        elif self.deadline is not None and self.used % self.checkEvery == 0 and time.time() > self.deadline:
+            self.stop(DEADLINE)
+
+    def meter(self, expand, search):
+        """`expand`, counting each goal it expands, and each state from a leaf,
+        as a step of `search`.
+        """
+        def meteredExpand(goal, state):
+            self.step(search)
+            (kind, value, state) = expand(goal, state)
+            if kind is LEAF and type(value) is not Suspension:
+                value = self.metered(value, search)
+            return (kind, value, state)
+        return meteredExpand
+
+    def metered(self, states, search):
+        """`states`, counting each as a step of `search`."""
+        for state in states:
+            self.step(search)
+            yield state
+
+class Task(object):
+    """A branch of the search waiting in a Frontier.
+    """
+    __slots__ = ('state', 'goal', 'continuation', 'depth')
+
+    def __init__(self, state, goal, continuation, depth):
+        self.state = state
+        self.goal = goal
+        self.continuation = continuation
+        self.depth = depth
+
+class Stream(object):
+    """The states still to come out of a leaf, each of which will carry on with
+    `continuation`.
+    """
+    __slots__ = ('states', 'continuation', 'depth', 'state')
+
+    def __init__(self, states, continuation, depth, state):
+        """
+        @param state: The last state out of `states`, which stands in for the
+        next one when it comes to working out a cost.
+        """
+        self.states = states
+        self.continuation = continuation
+        self.depth = depth
+        self.state = state
+
+class Frontier(object):
+    """Holds the Tasks and Streams a search hasn't got to yet, and decides
+    which comes next.
+    """
+    # Whether a branch can carry on with a fresh goal, or the next state from
+    # a stream, without going back in the frontier first.
+    inline = True
+
+    def push(self, item):
+        raise NotImplementedError
+
+    def extend(self, items):
+        """Adds the branches of a disjunction, given in the order they're
+        written.
+        """
+        for item in items:
+            self.push(item)
+
+    def pop(self):
+        raise NotImplementedError
+
+    def steal(self):
+        """Takes out a Task the search won't get to for a while, for some other
+        search to have instead.
+
+        @return: The Task, or None if there isn't one to spare.
+        """
+        return None
+
+    def __len__(self):
+        raise NotImplementedError
+
+class Stack(Frontier):
+    """Last in, first out: depth first search with chronological backtracking.
+    """
+    def __init__(self):
+        self.items = []
+
+    def push(self, item):
+        self.items.append(item)
+
+    def extend(self, items):
+        # Pushed backwards, so the first branch is the first to come off.
+        self.items.extend(reversed(items))
+
+    def pop(self):
+        return self.items.pop()
+
+    def steal(self):
+        # The Task at the bottom is the nearest the root, so likely the most
+        # work.
+        for (position, item) in enumerate(self.items):
+            if isinstance(item, Task):
+                del self.items[position]
+                return item
+        return None
+
+    def __len__(self):
+        return len(self.items)
+
+def byDepth(state, depth):
+    return depth
+
+class PriorityQueue(Frontier):
+    """Cheapest first, and oldest first of those that cost the same.
+    """
+    def __init__(self, cost=byDepth, inline=False):
+        """
+        @param cost: A function taking a branch's state and depth, returning a
+        number to compare it with the others by, or None to drop the branch.
+        For a Stream, the state standing in for its next one decides for all of
+        them.
+        @param inline: Whether branches carry on through fresh goals, and with
+        the next state from a stream, without going back in the queue.
+        """
+        self.cost = cost
+        self.inline = inline
+        self.heap = []
+        self.age = itertools.count()
+
+    def push(self, item):
+        cost = self.cost(item.state, item.depth)
+        if cost is not None:
+            heapq.heappush(self.heap, (cost, next(self.age), item))
+
+    def pop(self):
+        return heapq.heappop(self.heap)[2]
+
+    def steal(self):
+        # The most expensive Task, which would be the last to be got to.
+        tasks = [position for position in range(len(self.heap)) if isinstance(self.heap[position][2], Task)]
+        if not tasks:
+            return None
+        position = max(tasks, key=lambda position: self.heap[position][:2])
+        item = self.heap[position][2]
+        self.heap[position] = self.heap[-1]
+        self.heap.pop()
+        heapq.heapify(self.heap)
+        return item
+
+    def __len__(self):
+        return len(self.heap)
+
+class Search(object):
+    """Runs a goal against a state, yielding each state in which the goal
+    succeeds.
+    """
+    def __init__(self, goal, state, expand, valid=None, strategy=INTERLEAVE, depth=None, maxStreams=None, cost=None,
+                 budget=None):
+        """
+        @param goal: The goal to run.
+        @param state: The state to start in.
+        @param expand: A function taking a goal and a state that says what kind
+        of goal it is, as described above.
+        @param valid: If given, a function that takes a state and returns False
+        if it can't lead to an answer, so it can be dropped straight away.
+        @param strategy: INTERLEAVE, DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY
+        or BEST_FIRST.
+        @param depth: For anything but INTERLEAVE, the depth no branch will be
+        followed beyond. None to follow them as deep as they go.
+        @param maxStreams: For INTERLEAVE, the most streams any one conjunction
+        keeps going at once. None for no limit.
+        @param cost: For PRIORITY and BEST_FIRST, a function taking a state and
+        its depth and returning what it costs, or None if it's not worth going
+        on with. None to go by depth.
+        @param budget: A Budget that stops the search early, or None.
+        """
+        assert strategy in (INTERLEAVE, DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY, BEST_FIRST), "Unknown strategy: %s" % strategy
+        assert cost is None or strategy in (PRIORITY, BEST_FIRST), "Only a priority search has a cost."
+        assert depth is None or strategy != INTERLEAVE, "Interleaving can't be given a depth."
+        assert maxStreams is None or maxStreams >= 1, "A conjunction needs at least one stream."
+        self.goal = goal
+        self.state = state
+        self.expand = expand
+        self.valid = valid
+        self.strategy = strategy
+        self.depth = depth
+        self.maxStreams = maxStreams
+        self.cost = cost
+        self.budget = budget
+        if budget is not None:
+            self.expand = budget.meter(expand, self)
+        self.stats = SearchStats()
+        # Set when a depth bound stops a branch being followed.
+        self.cutOff = False
+        # The Frontier being searched, if there is one.
+        self.frontier = None
+
+    def run(self):
+        """Run the search with the chosen strategy.
+
+        @return: A generator of every state in which the goal succeeds, until
+        the budget, if there is one, runs out.
+        """
+        if self.strategy == ITERATIVE_DEEPENING:
+            states = self.runDeepening()
+        elif self.strategy == INTERLEAVE:
+            states = self.runInterleaved()
+        else:
+            states = (state for (state, depth) in self.runFrontier(self.newFrontier(), self.depth))
+        return states if self.budget is None else self.runBudgeted(states)
+
+    def runBudgeted(self, states):
+        """`states`, until the budget runs out."""
+        self.budget.start()
+        try:
+            yield from states
+        except Exhausted:
+            pass
+
+    def live(self):
+        """How many branches are waiting: what's in the frontier, or when
+        interleaving, the streams of the conjunctions."""
+        return self.stats.live if self.frontier is None else len(self.frontier)
+
+    def newFrontier(self):
+        """An empty Frontier for DEPTH_FIRST, PRIORITY or BEST_FIRST."""
+        if self.strategy == DEPTH_FIRST:
+            return Stack()
+        else:
+            return PriorityQueue(self.cost or byDepth, self.strategy == BEST_FIRST)
+
+    def runDeepening(self):
+        """Depth first searches to deeper and deeper bounds. Answers found at
+        or above the last bound were already handed out, so only the deeper
+        ones are each time.
+        """
+        previous = -1
+        for bound in itertools.count(0):
+            if self.depth is not None and bound > self.depth:
+                return
+            self.cutOff = False
+            for (state, depth) in self.runFrontier(Stack(), bound):
+                if depth > previous:
+                    yield state
+            if not self.cutOff:
+                return
+            previous = bound
+
+    def runFrontier(self, frontier, bound=None):
+        """Search by taking branches out of `frontier` one at a time. A
+        conjunction, the first state from a leaf, and if the frontier allows it
+        a fresh goal, carry on straight away without going back to the
+        frontier, but every other branch does.
+
+        @param frontier: An empty Frontier.
+        @param bound: The deepest a branch is followed, or None.
+        @return: A generator of `(state, depth)` for every answer.
+        """
+        expand = self.expand
+        valid = self.valid
+        inline = frontier.inline
+        self.frontier = frontier
+        frontier.push(Task(self.state, self.goal, None, 0))
+        while len(frontier):
+            item = frontier.pop()
+            if type(item) is Stream:
+                state = next(item.states, None)
+                if state is None:
+                    continue
+                (goal, continuation, depth) = (None, item.continuation, item.depth)
+                item.state = state
+                if not inline:
+                    item.depth = depth + 1
+                frontier.push(item)
+            else:
+                (state, goal, continuation, depth) = (item.state, item.goal, item.continuation, item.depth)
+            # Work on the branch until it's an answer, a dead end or has gone
+            # back in the frontier.
+            while True:
+                if goal is None:
+                    if valid is not None and not valid(state):
+                        break
+                    elif continuation is None:
+                        yield (state, depth)
+                        break
+                    (goal, continuation) = continuation
+                (kind, value, state) = expand(goal, state)
+                if kind is CONJ:
+                    goal = None
+                    for conjunct in reversed(value):
+                        continuation = (conjunct, continuation)
+                elif kind is DISJ or kind is FRESH:
+                    if bound is not None and depth >= bound:
+                        self.cutOff = True
+                        break
+                    elif kind is FRESH and inline:
+                        (goal, depth) = (value, depth + 1)
+                    elif kind is FRESH:
+                        frontier.push(Task(state, value, continuation, depth + 1))
+                        break
+                    else:
+                        frontier.extend([Task(state, disjunct, continuation, depth + 1) for disjunct in value])
+                        break
+                elif type(value) is Suspension:
+                    (goal, state) = (value.goal, value.state)
+                else:
+                    # The first state from a leaf carries straight on, the
+                    # rest wait their turn.
+                    goal = None
+                    states = iter(value)
+                    state = next(states, None)
+                    if state is None:
+                        break
+                    frontier.push(Stream(states, continuation, depth if inline else depth + 1, state))
+
+    def runInterleaved(self):
+        """The fair interleaving search, from a single loop.
+
+        @return: A generator of every state in which the goal succeeds.
+        """
+        valid = self.valid
+        root = Pending(self.goal, self.state, self).force()
+        path = []
+        while True:
+            # Ask the root for a state, following the nodes down to whichever
+            # has one to give, then handing it back up the way it came.
+            node = root
+            received = _NEXT
+            while True:
+                result = node.step(received)
+                if isinstance(result, Node):
+                    path.append(node)
+                    (node, received) = (result, _NEXT)
+                elif path:
+                    (node, received) = (path.pop(), result)
+                else:
+                    break
+            if result is _DONE:
+                return
+            if valid is None or valid(result):
+                yield result
@@ -0,0 +1,235 @@
+"""Tabling
+
+A recursive relation can end up being asked the same question over and over,
+working out the same answers every time, and if it calls itself before it's
+made any progress, say `patho(x, y)` trying `patho(x, z)` first, it never
+stops asking. Tabling a relation keeps a table of the answers to each call it's
+been given, so each question is only worked out once.
+
+Calls are the same question if they're the same but for the names of their
+variables, `patho(a, b)` and `patho(c, d)` say, but not `patho(a, a)`. So each
+call is looked up by its arguments with each variable swapped for a Slot,
+numbered in the order they turn up, and the answers are kept the same way.
+
+A call whose table isn't there yet runs the relation to get every answer. If it
+calls itself along the way, or anything else that's in the middle of being
+worked out, that call just gets whatever answers are in the table so far. Since
+those can't be all of them, the relation is run again, and again, until a run
+doesn't add any answers, by which time every call has had every answer.
+Relations that call each other are worked out together, the first to be called
+going round until none of them has anything new, and until then none of their
+tables are complete.
+
+The catch is that every answer is worked out before the first is handed back,
+so it only works for calls with a finite number of answers, and a relation that
+calls itself with ever bigger arguments never gets to finish one table before
+starting another.
+"""
+import functools
+from microkanren.ukanren import LVar, State, Relation, Eq, varq
+
+class Slot(object):
+    """Stands in for a variable in a tabled call or answer."""
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return "_%i" % self.index
+
+    def __eq__(self, other):
+        return isinstance(other, Slot) and self.index == other.index
+
+    def __hash__(self):
+        return hash((Slot, self.index))
+
+# Mark the lists and tuples in a canonical term, which are all made tuples.
+_LIST = object()
+_TUPLE = object()
+
+def canonical(term, state, slots):
+    """`term` as it is in `state`, with each variable swapped for a Slot.
+
+    @param slots: The Slot for each variable seen so far, which is added to.
+    @return: A hashable term.
+    """
+    term = state.walk(term)
+    if varq(term):
+        slot = slots.get(term)
+        if slot is None:
+            slot = slots[term] = Slot(len(slots))
+        return slot
+    elif isinstance(term, list):
+        return (_LIST,) + tuple([canonical(item, state, slots) for item in term])
+    elif isinstance(term, tuple):
+        return (_TUPLE,) + tuple([canonical(item, state, slots) for item in term])
+    return term
+
+def instantiate(term, variables):
+    """The other way round from `canonical`, a new variable for each Slot.
+
+    @param variables: The variable for each Slot index so far, which is added to.
+    """
+    if type(term) is Slot:
+        variable = variables.get(term.index)
+        if variable is None:
+            variable = variables[term.index] = LVar('_%i' % term.index)
+        return variable
+    elif type(term) is tuple and term and term[0] is _LIST:
+        return [instantiate(item, variables) for item in term[1:]]
+    elif type(term) is tuple and term and term[0] is _TUPLE:
+        return tuple([instantiate(item, variables) for item in term[1:]])
+    return term
+
+class TableStats(object):
+    """Counts how the tables of one tabled relation have been used.
+    """
+    __slots__ = ('calls', 'hits', 'tables', 'answers', 'runs')
+
+    def __init__(self):
+        self.calls = 0
+        # Calls answered from a complete table.
+        self.hits = 0
+        self.tables = 0
+        self.answers = 0
+        # Times the relation was run to fill in a table.
+        self.runs = 0
+
+    def __repr__(self):
+        return "TableStats(calls=%i, hits=%i, tables=%i, answers=%i, runs=%i)" % (
+            self.calls, self.hits, self.tables, self.answers, self.runs)
+
+    def hitRate(self):
+        return self.hits / self.calls if self.calls else 0.0
+
+class Table(object):
+    """The answers to one call."""
+    __slots__ = ('answers', 'known', 'complete', 'position', 'leader', 'consumed', 'members')
+
+    def __init__(self):
+        self.answers = []
+        self.known = set()
+        self.complete = False
+        # Where it is in `_evaluating` while it's being worked out, and the
+        # lowest place in it of anything its answers depend on.
+        self.position = None
+        self.leader = None
+        # Whether any answers were handed out before it was complete.
+        self.consumed = False
+        # The tables that can't be complete until this one is.
+        self.members = []
+
+# The tables being worked out, each called by the one before.
+_evaluating = []
+
+class Tables(object):
+    """Every table of one tabled relation, by call.
+    """
+    # How many answers have been added to any table, so the first of a group
+    # of relations can tell if another run would find any more.
+    added = 0
+
+    def __init__(self, relation):
+        """
+        @param relation: A function taking the relation's arguments and
+        returning a goal.
+        """
+        self.relation = relation
+        self.tables = {}
+        self.stats = TableStats()
+
+    def clear(self):
+        """Forget every answer, and start counting again."""
+        self.tables = {}
+        self.stats = TableStats()
+
+    def answers(self, key):
+        """The answers to the call whose arguments are `key`, as canonical terms.
+        """
+        self.stats.calls += 1
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = Table()
+            self.stats.tables += 1
+        if table.complete:
+            self.stats.hits += 1
+            return table.answers
+        elif table.position is not None:
+            # Called from inside its own run, so everything run since depends
+            # on it.
+            for waiting in _evaluating[table.position + 1:]:
+                waiting.leader = min(waiting.leader, table.position)
+            table.consumed = True
+            return list(table.answers)
+        self.evaluate(key, table)
+        return table.answers
+
+    def evaluate(self, key, table):
+        """Run the relation until it doesn't find any more answers."""
+        position = len(_evaluating)
+        (table.position, table.leader, table.consumed) = (position, position, False)
+        _evaluating.append(table)
+        try:
+            while True:
+                before = Tables.added
+                args = instantiate(key, {})
+                for state in self.relation(*args).run(State()):
+                    answer = canonical(args, state, {})
+                    if answer not in table.known:
+                        table.known.add(answer)
+                        table.answers.append(answer)
+                        self.stats.answers += 1
+                        Tables.added += 1
+                self.stats.runs += 1
+                # Only the first of a group goes round again, and only if
+                # someone might have missed out on an answer.
+                if table.leader < position or not table.consumed or Tables.added == before:
+                    break
+        finally:
+            _evaluating.pop()
+            table.position = None
+        if table.leader < position:
+            leader = _evaluating[table.leader]
+            leader.members.append(table)
+            leader.members.extend(table.members)
+        else:
+            table.complete = True
+            for member in table.members:
+                member.complete = True
+        table.members = []
+
+class Tabled(Relation):
+    """A call to a tabled relation, see `tabled`.
+    """
+    def __init__(self, tables, args):
+        super().__init__()
+        self.tables = tables
+        self.args = args
+
+    def __repr__(self):
+        return "%s%s" % (self.tables.relation.__name__, repr(tuple(self.args)))
+
+    def __run__(self, state):
+        key = canonical(self.args, state, {})
+        try:
+            hash(key)
+        except TypeError:
+            raise TypeError("A tabled relation can only be called with lists, tuples and hashable values: %r" % (key,))
+        for answer in self.tables.answers(key):
+            yield from Eq(self.args, instantiate(answer, {})).run(state)
+
+def tabled(relation):
+    """Decorator for a function, or Relation class, taking logic variables and
+    returning a goal, that tables its answers. The tables are kept in the
+    `tables` of what's returned, whose `stats` say how many there are and how
+    often they were used.
+    """
+    tables = Tables(relation)
+
+    @functools.wraps(relation)
+    def call(*args):
+        return Tabled(tables, list(args))
+
+    call.tables = tables
+    return call
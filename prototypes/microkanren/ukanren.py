@@ -5,12 +5,18 @@ import copy
 import traceback
 import sys
 import itertools
+import os
 from inspect import signature
+from microkanren import parallel
+from microkanren.persistent import PMap
+from microkanren.search import Search, Budget, CONJ, DISJ, FRESH, LEAF, INTERLEAVE, DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY, BEST_FIRST
+from microkanren.search import STEPS, DEADLINE, STATES, CANCELLED
 
 class LVar(object):
     """The objects instantiated by this class represent Logic Variables. Each should
     be unique across any given assertion.
     """
+    __slots__ = ('id', 'name')
     nextId = 0  # Ensures uniqueness
 
     def __init__(self, name=None):
@@ -36,6 +42,19 @@ class LVar(object):
         """
         return self.id
 
+    def __eq__(self, other):
+        """LVars are the same if their ids are. Within one process that's only
+        ever the same object, but an LVar that's been pickled, on its way back
+        from a parallel search, comes back as a new object.
+        """
+        return isinstance(other, LVar) and self.id == other.id
+
+def _separateIds():
+    """Start the ids of LVars made in a worker process where they won't run
+    into those made anywhere else, see `Goal.run`.
+    """
+    LVar.nextId = (os.getpid() + 1) << 32
+
 def varq(value):
     """Test if `value` is a Logic Variable.
     """
@@ -48,24 +67,79 @@ def lvars(count):
     """
     return [LVar() for n in range(0, count)]
 
+_EMPTY_MAP = PMap()
+
+class MemoStats(object):
+    """Counts how often a memoizing State found a reified term in its memo.
+    One of these is shared by every state derived from the first one.
+    """
+    __slots__ = ('hits', 'misses')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return "MemoStats(hits=%i, misses=%i)" % (self.hits, self.misses)
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
 class State(object):
     """Expresses the value of any given logic variables in a goal.
+
+    A search can make millions of these, so they're kept as small as possible
+    with `__slots__` rather than a dictionary per state.
     """
-    def __init__(self, substitution={}, valid=True):
+    __slots__ = ('substitution', 'valid', '_ranks', '_shortcuts', '_hash',
+                 'memoStats', '_memo', '_groundMemo')
+
+    def __init__(self, substitution={}, valid=True, memoize=False):
         """Instatiate a new state, which may or may not be valid. If a state
         is not valid, then it's substitution value is irrelevant.
 
-        @param substitution: The values of each Logic Variable in the State.
+        The substitution is kept in a persistent map, so states derived from this
+        one share its storage rather than copying it.
+
+        @param substitution: The values of each Logic Variable in the State, either
+                             as a dictionary or a PMap.
         @param valid: Whether the state is free of contradictions.  Generally even
                       if the state is not valid, it may not show in the substitution.
+        @param memoize: If True, `reify` remembers what it returned for each variable
+                        and list, and every state derived from this one does the same.
+                        Hits and misses are counted in `memoStats`. The lists handed back
+                        are shared, so don't change them.
         """
-        self.substitution = substitution
+        self.substitution = substitution if isinstance(substitution, PMap) else PMap(substitution)
         self.valid = valid
+        # Logic Variables bound to each other form a union-find forest inside the
+        # substitution. `_ranks` keeps the trees shallow and `_shortcuts` holds
+        # compressed paths, each Logic Variable pointing straight at the last
+        # variable on its chain. Neither changes what the state means.
+        self._ranks = _EMPTY_MAP
+        self._shortcuts = _EMPTY_MAP
+        # The memo is keyed by the id of the term reified, and is only good for this
+        # state. Results without any Logic Variables in them will never change, so
+        # they're also kept in `_groundMemo` which is handed on to derived states.
+        self.memoStats = MemoStats() if memoize else None
+        self._memo = None
+        self._groundMemo = _EMPTY_MAP
+        self._hash = None
 
     def __hash__(self):
         """Unique hash for any given State is needed for some portions of unit testing.
+        A state never changes, so it's only worked out once.
+        """
+        if self._hash is None:
+            self._hash = hash((self.valid, tuple(self.substitution.keys()), tuple(self.substitution.values())))
+        return self._hash
+
+    def __reduce__(self):
+        """A pickled State is just its substitution. The ranks, shortcuts and
+        memo are all things it can work out again.
         """
-        return hash((self.valid, tuple(self.substitution.keys()), tuple(self.substitution.values())))
+        return (State, (self.substitution, self.valid))
 
     def __eq__(self, other):
         """Test equality with another state, needed for unit testing.
@@ -105,14 +179,80 @@ class State(object):
     def update(self, substitution=None, valid=None):
         if valid == False:
             return State({}, valid=False)
+        elif substitution is None:
+            valid = self.valid if valid is None else valid
+            return self._extend(self.substitution, valid)
         else:
-            substitution = copy.copy(self.substitution) if substitution is None else substitution
             valid = self.valid if valid is None else valid
-            return State(substitution, valid)
+            state = State(substitution, valid)
+            state.memoStats = self.memoStats
+            return state
+
+    def _extend(self, substitution, valid, ranks=None):
+        """A new state whose substitution contains everything in this one, so the
+        variable ranks and compressed paths still hold for it."""
+        state = State(substitution, valid)
+        state._ranks = self._ranks if ranks is None else ranks
+        state._shortcuts = self._shortcuts
+        state.memoStats = self.memoStats
+        state._groundMemo = self._groundMemo
+        return state
 
     def ext_s(self, additionalSubstitutions):
-        """Add a value v to variable x for the substitution"""
-        return self.update(substitution={**additionalSubstitutions, **self.substitution})
+        """Add a value v to variable x for the substitution. Values already in the
+        substitution win over the additional ones."""
+        substitution = self.substitution
+        for (variable, value) in additionalSubstitutions.items():
+            if variable not in substitution:
+                substitution = substitution.set(variable, value)
+        return self._extend(substitution, self.valid)
+
+    def alias(self, left, right):
+        """Bind two unbound Logic Variables to each other. This is union by rank,
+        the variable with the shallower tree gets pointed at the other one, so no
+        chain of aliases gets longer than the log of the number of variables in it.
+        If they're the same rank, `left` points to `right`.
+        """
+        leftRank = self._ranks.get(left, 0)
+        rightRank = self._ranks.get(right, 0)
+        if leftRank > rightRank:
+            return self._extend(self.substitution.set(right, left), self.valid)
+        elif leftRank == rightRank:
+            ranks = self._ranks.set(right, rightRank + 1)
+            return self._extend(self.substitution.set(left, right), self.valid, ranks)
+        else:
+            return self._extend(self.substitution.set(left, right), self.valid)
+
+    def walk(self, term):
+        """Follow `term` through the substitution until reaching either a value that
+        isn't a Logic Variable, or a Logic Variable with no value.
+
+        Any variable that took more than one step to get through is given a
+        shortcut straight to the end of its chain, so the next walk is a single
+        step. Bindings are never removed, so a shortcut holds for every state
+        derived from this one as well.
+        @param term: Any term.
+        @return: The value of `term` in this state.
+        """
+        if not varq(term):
+            return term
+        substitution = self.substitution
+        visited = []
+        shortcut = self._shortcuts.get(term, term)
+        if shortcut is not term:
+            visited.append(term)
+            term = shortcut
+        value = substitution.get(term, term)
+        while varq(value) and value is not term:
+            visited.append(term)
+            term = value
+            value = substitution.get(term, term)
+        if len(visited) > 1:
+            shortcuts = self._shortcuts
+            for variable in visited:
+                shortcuts = shortcuts.set(variable, term)
+            self._shortcuts = shortcuts
+        return value
 
     def reify(self, term):
         """For a given term, search the state for that term.
@@ -120,14 +260,40 @@ class State(object):
              If the term is found, then applies reify to the value it finds.
         @param: A logical variable, a constant, or a collection of terms.
         """
-        newTerm = term
-        while varq(newTerm) and newTerm in self.substitution:
-            newTerm = self.substitution[newTerm]
+        if self.memoStats is None:
+            newTerm = self.walk(term)
+            if isinstance(newTerm, list):
+                newTerm = [self.reify(val) for val in newTerm]
+                return newTerm
+            else:
+                return newTerm
+        else:
+            return self._memoReify(term)[0]
+
+    def _memoReify(self, term):
+        """`reify` with the memo turned on.
+        @return: The reified term, and True if there are no Logic Variables in it.
+        """
+        if not (varq(term) or isinstance(term, list)):
+            return (term, True)
+        key = id(term)
+        if self._memo is None:
+            self._memo = {}
+        found = self._memo.get(key) or self._groundMemo.get(key)
+        if found is not None and found[0] is term:
+            self.memoStats.hits += 1
+            return found[1]
+        self.memoStats.misses += 1
+        newTerm = self.walk(term)
         if isinstance(newTerm, list):
-            newTerm = [self.reify(val) for val in newTerm]
-            return newTerm
+            reified = [self._memoReify(val) for val in newTerm]
+            result = ([val for (val, ground) in reified], all([ground for (val, ground) in reified]))
         else:
-            return newTerm
+            result = (newTerm, not varq(newTerm))
+        self._memo[key] = (term, result)
+        if result[1]:
+            self._groundMemo = self._groundMemo.set(key, (term, result))
+        return result
 
 # The null state, when no states are valid for the given goal.
 mzero = iter([])
@@ -144,9 +310,10 @@ class Goal(abc.ABC):
 
     def __init__(self):
         """The last state generated by a given goal is stored to make it
-        easier to debug.
+        easier to debug, along with the last Search that ran it.
         """
         self.lastState = None
+        self.lastSearch = None
 
     def __and__(self, other):
         """Allows two goals to be combined using `&`.
@@ -165,32 +332,94 @@ class Goal(abc.ABC):
         """
         return
 
-    def run(self, state=State(), results=None):
+    def run(self, state=State(), results=None, strategy=INTERLEAVE, depth=None, maxStreams=None, cost=None, workers=None,
+            portfolio=None, budget=None):
         """Execute the goal against the given `state` expecting up to a certain
         number of `results`.
+
+        The goal is run by a `Search`, which takes apart any `Conj`, `Disj` and
+        `Fresh` goals itself, so however deeply they're nested every state comes
+        straight out of one loop. Invalid states are dropped as soon as they turn
+        up rather than being carried through the rest of a `Conj`.
+
+        Depth first strategies only ever look at one branch at a time, so they're
+        run by a `TrailSearch`, which binds variables in place rather than making
+        a new State for every `Eq`. A `maxStreams` or `cost` that the strategy
+        wouldn't use is a ValueError, rather than being quietly ignored.
         @param state: If no state is given, then it will start on a valid, empty state.
         @param results: The maximum number of results to wait for.
+        @param strategy: How to search, one of INTERLEAVE (fair, and the
+        default), DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY or BEST_FIRST.
+        @param depth: The deepest, counted in `Disj` and `Fresh` goals, any
+        strategy but INTERLEAVE will look for results.
+        @param maxStreams: The most streams any one `Conj` keeps going at once
+        when interleaving, None for no limit. See `microkanren.search`. How many
+        there were is counted in `lastSearch.stats`. Only for INTERLEAVE without
+        `workers`.
+        @param cost: For PRIORITY and BEST_FIRST, a function taking a State and
+        its depth and returning what it costs to carry on from it. Cheapest goes
+        first. Only for those strategies.
+        @param workers: If given, the search is split between this many
+        processes, see `microkanren.parallel`, and the results come back in the
+        order they're found. Each searches with PRIORITY or BEST_FIRST if
+        that's the strategy, otherwise depth first. What each worker did is in
+        `lastSearch.stats`.
+        @param portfolio: If given, a list of dicts of arguments to `run` with
+        instead, with a `goal` to run in place of this one if it's given, the
+        same goal with its conjunctions in a different order say. Each is run
+        in a process of its own, and the results of whichever finds one first
+        are the ones that come back, as it finds them, see
+        `microkanren.parallel.Portfolio`. Which one that was is
+        `lastSearch.winner`.
+        @param budget: A `Budget` of steps, seconds and waiting branches, that
+        stops the search early once it's used up, or is cancelled. The results
+        found by then are all that come back, and `budget.exhausted` says why.
         """
-        if results is None:
-            runner = self.__run__(state)
-            while True:
-                try:
-                    self.lastState = runner.__next__()
-                    if self.lastState.valid:
-                        yield self.lastState
-                except StopIteration:
-                    return
+        if maxStreams is not None and (strategy != INTERLEAVE or workers is not None):
+            raise ValueError("Only an interleaving search has a maxStreams, not %s." % strategy)
+        if cost is not None and strategy not in (PRIORITY, BEST_FIRST):
+            raise ValueError("Only a priority search has a cost, not %s." % strategy)
+        if portfolio is not None:
+            runs = [_entrant(self, state, results, budget, options) for options in portfolio]
+            self.lastSearch = parallel.Portfolio(runs, results, initializer=_separateIds, budget=budget)
+            runner = self.lastSearch.run()
+        elif workers is not None:
+            strategy = strategy if strategy in (PRIORITY, BEST_FIRST) else DEPTH_FIRST
+            self.lastSearch = parallel.ParallelSearch(self, state, _expand, _valid, workers, strategy, depth, cost,
+                                                      initializer=_separateIds, budget=budget)
+            runner = self.lastSearch.run()
+        elif strategy in (DEPTH_FIRST, ITERATIVE_DEEPENING):
+            self.lastSearch = TrailSearch(self, state, _expand, _valid, strategy, depth, budget=budget)
+            runner = self.lastSearch.run()
         else:
-            runner = self.__run__(state)
-            for index in range(0, results):
-                try:
-                    self.lastState = runner.__next__()
-                    if self.lastState.valid:
-                        yield self.lastState
-                except StopIteration:
-                    return
+            self.lastSearch = Search(self, state, _expand, _valid, strategy, depth, maxStreams, cost, budget)
+            runner = self.lastSearch.run()
+        for result in runner if results is None else itertools.islice(runner, results):
+            self.lastState = result
+            yield result
 
 
+def _entrant(goal, state, results, budget, options):
+    """A function that runs `goal` with `options`, for a Portfolio."""
+    options = dict(options)
+    goal = options.pop('goal', goal)
+    return lambda: goal.run(state, results, budget=budget, **options)
+
+def _expand(goal, state):
+    """Tells a `Search` what kind of goal `goal` is.
+    """
+    if isinstance(goal, Conj):
+        return (CONJ, goal.goals, state)
+    elif isinstance(goal, Disj):
+        return (DISJ, goal.goals, state)
+    elif isinstance(goal, Fresh) and not isinstance(goal, Call):
+        return (FRESH, goal.getFunctionGoal(), state)
+    else:
+        return (LEAF, goal.__run__(state), state)
+
+def _valid(state):
+    return state.valid
+
 class Relation(Goal, abc.ABC):
     """An abstract class for goals that represent relations between values.
     """
@@ -231,6 +460,9 @@ class Eq(Relation):
         # Same variable means they're equal.
         if varq(left) and varq(right) and left.id == right.id:
             yield state.update()
+        # Two different variables become aliases of each other.
+        elif varq(left) and varq(right):
+            yield state.alias(left, right)
         # If just one is a variable, then adds the other as its value.
         elif varq(left):
             yield state.ext_s({left: right})
@@ -419,22 +651,11 @@ class Disj(Connective):
             return "EMPTY DISJ"
 
     def __run__(self, state):
-        goals = self.goals
-        # Each goal generates its own state stream based on the same start state.
-        stateStreams = [goal.run(state) for goal in goals]
-        newStreams = []
-        while stateStreams:
-            # Read in a state from each stream in turn
-            # If a stream is empty, then drop it from the list.
-            for stateStream in stateStreams:
-                try:
-                    result = stateStream.__next__()
-                    newStreams.append(stateStream)
-                    yield result
-                except StopIteration:
-                    pass
-            stateStreams=newStreams
-            newStreams=[]
+        """Each goal generates its own state stream based on the same start state,
+        and a state is read from each stream in turn. The `Search` does the
+        reading, see `Goal.run`.
+        """
+        return Search(self, state, _expand, _valid).run()
 
 class Conj(Connective):
     """Conj, logical and, takes a list of goals as parameters, and will stream the states it's handed in through all of them. If
@@ -454,36 +675,190 @@ class Conj(Connective):
         """When pulling states from the goals, it does it using the same pattern as described in:
                http://webyrd.net/scheme-2013/papers/HemannMuKanren2013.pdf
         this ensures that even if one of the goals generates an infinite number of states, all of
-        them will eventually trickle through.
+        them will eventually trickle through. The `Search` does the pulling, see `Goal.run`.
         """
-        if(len(self.goals) == 0):
-            yield state
-            return
+        return Search(self, state, _expand, _valid).run()
 
-        if(len(self.goals) == 1):
-            yield from self.goals[0].run(state)
-            return
 
-        anyStreams = True
-        goals = self.goals
-        goalStreams = [[goals[0].run(state)]] + [[] for i in range(0, len(goals))]
-        while anyStreams:
-            anyStreams = False
-            for goalStreamIndex in range(0, len(goals)):
-                newStreams = []
-                stateStreams = goalStreams[goalStreamIndex]
-
-                for stateStream in stateStreams:
-                    try:
-                        nextState = stateStream.__next__()
-                        newStreams.append(stateStream)
-                        if (goalStreamIndex + 1) == len(goals):
-                            yield nextState
-                        else:
-                            newStream = goals[goalStreamIndex + 1].run(nextState)
-                            goalStreams[goalStreamIndex + 1].append(newStream)
-                    except StopIteration:
-                        pass
-                if anyStreams or newStreams:
-                    anyStreams = True
-                goalStreams[goalStreamIndex] = newStreams
+# Marks a variable that wasn't bound before, in a Trail.
+_UNBOUND = object()
+
+class Trail(object):
+    """The bindings of a depth first search, changed in place.
+
+    Rather than a new State for each binding, every binding goes into one
+    dictionary, and what was there before goes onto the trail. Backing up to an
+    earlier choice is just a matter of taking bindings back off the trail until
+    it's as long as it was then, as in the Warren Abstract Machine.
+    """
+    __slots__ = ('state', 'bindings', 'trail')
+
+    def __init__(self, state):
+        """
+        @param state: The State to start from. Snapshots share its memo stats.
+        """
+        self.state = state
+        self.bindings = dict(state.substitution.items())
+        self.trail = []
+
+    def mark(self):
+        """Where the trail is up to, to be handed to `undo` later."""
+        return len(self.trail)
+
+    def undo(self, mark):
+        """Take back every binding made since `mark`."""
+        trail = self.trail
+        bindings = self.bindings
+        while len(trail) > mark:
+            (variable, previous) = trail.pop()
+            if previous is _UNBOUND:
+                del bindings[variable]
+            else:
+                bindings[variable] = previous
+
+    def bind(self, variable, value):
+        self.trail.append((variable, self.bindings.get(variable, _UNBOUND)))
+        self.bindings[variable] = value
+
+    def walk(self, term):
+        bindings = self.bindings
+        while varq(term):
+            value = bindings.get(term, term)
+            if value is term:
+                break
+            term = value
+        return term
+
+    def unify(self, left, right):
+        """Unify `left` and `right` the same way `Eq` does, binding variables in
+        place.
+
+        Only variables, strings, lists, tuples and values without a length are
+        handled here. Dictionaries and sets can unify more than one way, so
+        they're left to `Eq` itself.
+        @return: True if they unify, False if they don't, or None if it has to be
+        left to `Eq`. Nothing is bound unless it's True.
+        """
+        mark = len(self.trail)
+        pairs = [(left, right)]
+        while pairs:
+            (left, right) = pairs.pop()
+            left = self.walk(left)
+            right = self.walk(right)
+            if left is right:
+                continue
+            elif varq(left):
+                self.bind(left, right)
+            elif varq(right):
+                self.bind(right, left)
+            elif isinstance(left, str):
+                if left != right:
+                    self.undo(mark)
+                    return False
+            elif isinstance(left, (list, tuple)) and isinstance(right, (list, tuple)):
+                if len(left) > 0 and len(left) == len(right):
+                    # Backwards, so they come off the stack in order.
+                    pairs.extend(reversed(list(zip(left, right))))
+                elif left != right:
+                    self.undo(mark)
+                    return False
+            elif hasattr(left, '__len__') or hasattr(right, '__len__'):
+                self.undo(mark)
+                return None
+            elif left != right:
+                self.undo(mark)
+                return False
+        return True
+
+    def load(self, state):
+        """Make the bindings match `state`, as handed back by a goal that was run
+        on a snapshot.
+        @return: False if the state isn't valid.
+        """
+        if not state.valid:
+            return False
+        substitution = state.substitution
+        for variable in [variable for variable in self.bindings if variable not in substitution]:
+            self.trail.append((variable, self.bindings.pop(variable)))
+        bindings = self.bindings
+        for (variable, value) in substitution.items():
+            if bindings.get(variable, _UNBOUND) is not value:
+                self.bind(variable, value)
+        return True
+
+    def snapshot(self):
+        """A State with the bindings as they are now."""
+        return self.state.update(PMap(self.bindings))
+
+class TrailSearch(Search):
+    """A depth first `Search` over ukanren goals that keeps its bindings in a
+    `Trail`.
+
+    `Conj`, `Disj`, `Fresh` and most `Eq` goals are worked through without making
+    any States at all. Any other goal is run on a snapshot of the bindings, and
+    the trail is made to match each state it gives back. A State is only made
+    for each answer.
+    """
+    def runFrontier(self, frontier, bound=None):
+        """
+        @param frontier: An empty Frontier, which holds
+        `(mark, goal, states, continuation, depth)` for each choice still to
+        be made.
+        @param bound: The deepest a branch is followed, or None.
+        @return: A generator of `(state, depth)` for every answer.
+        """
+        trail = Trail(self.state)
+        if not self.state.valid:
+            return
+        budget = self.budget
+        self.frontier = frontier
+        frontier.push((0, self.goal, None, None, 0))
+        while len(frontier):
+            (mark, goal, states, continuation, depth) = frontier.pop()
+            trail.undo(mark)
+            if states is not None:
+                state = next(states, None)
+                if state is None:
+                    continue
+                frontier.push((mark, None, states, continuation, depth))
+                if not trail.load(state):
+                    continue
+            while True:
+                if goal is None:
+                    if continuation is None:
+                        yield (trail.snapshot(), depth)
+                        break
+                    (goal, continuation) = continuation
+                if budget is not None:
+                    budget.step(self)
+                kind = type(goal)
+                if kind is Eq:
+                    unified = trail.unify(goal.left, goal.right)
+                    if unified is None:
+                        frontier.push((trail.mark(), None, self.leaf(goal, trail), continuation, depth))
+                        break
+                    elif not unified:
+                        break
+                    goal = None
+                elif isinstance(goal, Conj):
+                    for conjunct in reversed(goal.goals):
+                        continuation = (conjunct, continuation)
+                    goal = None
+                elif isinstance(goal, Disj) or (isinstance(goal, Fresh) and not isinstance(goal, Call)):
+                    if bound is not None and depth >= bound:
+                        self.cutOff = True
+                        break
+                    elif isinstance(goal, Disj):
+                        mark = trail.mark()
+                        frontier.extend([(mark, disjunct, None, continuation, depth + 1) for disjunct in goal.goals])
+                        break
+                    (goal, depth) = (goal.getFunctionGoal(), depth + 1)
+                else:
+                    frontier.push((trail.mark(), None, self.leaf(goal, trail), continuation, depth))
+                    break
+
+    def leaf(self, goal, trail):
+        """The states from running `goal` on a snapshot of the bindings, each
+        counted against the budget if there is one."""
+        states = iter(goal.__run__(trail.snapshot()))
+        return states if self.budget is None else self.budget.metered(states, self)
@@ -1,6 +1,12 @@
 import itertools
 import types
+import weakref
+from collections.abc import Set
 from inspect import signature
+from microkanren import parallel
+from microkanren.persistent import PMap, PSet, PVector
+from microkanren.search import Search, Suspension, CONJ, DISJ, FRESH, LEAF, INTERLEAVE, DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY, BEST_FIRST
+from microkanren.search import Budget, STEPS, DEADLINE, STATES, CANCELLED
 
 """UrConstraintKanren
 
@@ -36,8 +42,23 @@ class Link(object):
     100 values, or `'cake'` may be all there is. This is very hard to represent
     using Python lists, but in this style of linked list can be represented like
     this: `Link('cake', LogicVariable(0))`
+
+    Searches build a great many of these, so they use `__slots__`. Better
+    still, ground Links (ones with no LogicVariables anywhere in them) are
+    hash-consed, but only once they're compared with another Link of the same
+    hash: from then on they share one Link for that ground list, see
+    `interned`, so telling them apart again is just a matter of checking if
+    those are the same object. Interning every Link as it was made cost more
+    than twice the memory of the Link itself, for lists that mostly never get
+    compared at all.
     """
-    def __init__(self, head=None, tail=()):
+    __slots__ = ('_link', '_hash', '_ground', '_canonical', '__weakref__')
+
+    # Every ground Link that's been interned and is still in use, keyed by
+    # what it's made of.
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, head=None, tail=()):
         """For practical purposes this is a traditional value and pointer style
         of linked list. The head is the value the tail is the pointer.  If the
         tail is set to None, then it's a single value list, if the head is set
@@ -48,15 +69,68 @@ class Link(object):
         have to be a link, but can be another value, creating a `dotted pair`,
         similar to a tuple in Python.
 
+        This is `__new__` rather than `__init__` so that there's only ever
+        one empty list.
+
         @param head: The value for the link.
         @param tail: The rest of the list, if any, or another value.
         """
         if head is None:
+            existing = cls._interned.get((cls,))
+            if existing is not None:
+                return existing
+            self = object.__new__(cls)
             self._link = ()
-        elif isinstance(tail, Link) and tail.is_empty():
-            self._link = (head, ())
-        else:
-            self._link = (head, tail)
+            self._hash = None
+            self._ground = True
+            self._canonical = True
+            cls._interned[(cls,)] = self
+            return self
+        if isinstance(tail, Link) and tail.is_empty():
+            tail = ()
+        self = object.__new__(cls)
+        self._link = (head, tail)
+        self._hash = None
+        self._ground = _is_ground(head) and _is_ground(tail)
+        # The Link this one was interned as, True if it's this one, and None
+        # until it's interned.
+        self._canonical = None
+        return self
+
+    def interned(self):
+        """The one Link shared by every interned Link equal to this one, and
+        of the same types, interning it and its tail if they aren't yet. Only
+        plain ground Links are interned, anything else is its own.
+
+        @return: A Link equal to this one.
+        """
+        link = self
+        pending = []
+        while type(link) is Link and link._canonical is None and link._ground:
+            pending.append(link)
+            link = link._link[1]
+        for link in reversed(pending):
+            (head, tail) = link._link
+            if type(tail) is Link and tail._canonical is not None:
+                tail = tail.interned()
+            # The types are part of the key so `1`, `1.0` and `True`, which
+            # Python considers equal, still get Links of their own.
+            key = (Link, type(head), head, type(tail), tail)
+            existing = Link._interned.get(key)
+            if existing is None:
+                Link._interned[key] = link
+                link._canonical = True
+            else:
+                link._canonical = existing
+        return self._canonical if isinstance(self._canonical, Link) else self
+
+    def __reduce__(self):
+        """Pickling goes back through `Link(head, tail)`, so that an empty
+        Link loaded in another process is the empty Link there too.
+        """
+        if self.is_empty():
+            return (type(self), ())
+        return (type(self), self._link)
 
     def __eq__(self, other):
         """Equality here tests first for if both qualify as empty lists. As
@@ -67,21 +141,42 @@ class Link(object):
         then it's just not equal, as opposed to being a type error like it is in
         other languages.
 
+        Two ground Links with different hashes can't be equal, so there's no
+        need to look inside them at all. If the hashes match they're interned,
+        and if they're then the same Link they're equal. Otherwise they can
+        only be equal when Python thinks values of different types are equal,
+        like `1` and `1.0`, so then they're compared value by value.
+
+        Rather than recursing down the heads and tails, the pairs still to be
+        compared are kept on a stack, so very long lists don't run out of
+        Python's recursion limit.
+
         @param other: The value being compared for equality.
         @return: True if both are equal, false otherwise.
         """
-        if other == () and self.is_empty():
-            return True
-        if not isinstance(other, Link):
-            return False
-        elif self.is_empty():
-            return other.is_empty()
-        elif other.is_empty():
-            return False
-        elif self.head == other.head:
-            return self.tail == other.tail
-        else:
-            return False
+        pairs = [(self, other)]
+        while pairs:
+            (left, right) = pairs.pop()
+            if left is right:
+                continue
+            elif not isinstance(left, Link):
+                if not left == right:
+                    return False
+            elif not isinstance(right, Link):
+                if not (right == () and left.is_empty()):
+                    return False
+            else:
+                same = _ground_equality(left, right) if left._ground and right._ground else None
+                if same is not None:
+                    if not same:
+                        return False
+                elif left.is_empty() or right.is_empty():
+                    if not (left.is_empty() and right.is_empty()):
+                        return False
+                else:
+                    pairs.append((left.tail, right.tail))
+                    pairs.append((left.head, right.head))
+        return True
 
     def __repr__(self):
         """I want to make it crystal clear to anyone using this code when
@@ -95,11 +190,11 @@ class Link(object):
             return "()"
         point_to = self
         str_repr = "(%s" % repr(self.head)
-        while isinstance(point_to.tail, type(self)):
+        while isinstance(point_to.tail, Link):
             point_to = point_to.tail
             str_repr += " "
             str_repr += "%s" % repr(point_to.head)
-        if point_to.tail is ():
+        if point_to.tail == ():
             str_repr += ")"
         else:
             str_repr += " . %s)" % repr(point_to.tail)
@@ -108,11 +203,23 @@ class Link(object):
     def __hash__(self):
         """In order to use a list as a dictionary key, it needs to have a hash
         value. Just adding the hashes of head and tail is easy to implement and
-        understand.
+        understand. Since a Link never changes, it's only worked out once.
+
+        The hash of a Link depends on the hash of its tail, so the tails that
+        haven't been hashed yet are found first and then hashed from the end of
+        the list back to this one.
 
         @return: A reasonably unique hash.
         """
-        return self._link.__hash__()
+        if self._hash is None:
+            unhashed = []
+            link = self
+            while type(link) is Link and link._hash is None:
+                unhashed.append(link)
+                link = link.tail
+            for link in reversed(unhashed):
+                link._hash = link._link.__hash__()
+        return self._hash
 
     def __contains__(self, elem):
         """Returns true if `elem` is part of the list that this link is the
@@ -131,12 +238,12 @@ class Link(object):
         this Link.
         @return: True if this Link contains `elem`, false otherwise.
         """
-        if self.head == elem:
-            return True
-        elif isinstance(self.tail, type(self)):
-            return self.tail.__contains__(elem)
-        else:
-            return self.tail == elem
+        link = self
+        while not link.head == elem:
+            if not isinstance(link.tail, Link):
+                return link.tail == elem
+            link = link.tail
+        return True
 
     @property
     def head(self):
@@ -158,21 +265,199 @@ class Link(object):
         """
         return self._link == ()  # self.head is None and self.tail is ()
 
+def _ground_equality(left, right):
+    """Compare two ground Links without looking inside them, if that can
+    be done.
+
+    @return: False if they're different, True if they're interned as the same
+    Link, and None if they'll have to be compared value by value.
+    """
+    try:
+        if hash(left) != hash(right):
+            return False
+    except TypeError:  # Something in the list can't be hashed.
+        return None
+    if left.interned() is right.interned():
+        return True
+    return None
+
+def _is_ground(value):
+    """Checks if a value is ground, as far as interning Links goes: it isn't a
+    LogicVariable and, if it's a Link, it's a ground one.
+
+    @param value: The value to check.
+    @return: True if the value is ground, False otherwise.
+    """
+    if isinstance(value, Link):
+        return value._ground
+    return not isinstance(value, LogicVariable)
+
 def list_to_links(lst):
     """Linked Lists are a neat, elegant data structure...
     And a pain to code by hand.
 
+    Lists inside `lst` are converted too. Each list still being converted
+    sits on a stack along with the values converted from it so far, and once
+    all its values are done it's linked up back to front.
+
     @param lst: The python list structure to convert.
     @return: A linked list converted from the `lst`.`
     """
     assert isinstance(lst, list), "Only lists can be convernted to Links."
-    if lst == []:
-        return Link()
-    else:
-        if isinstance(lst[0], list):
-            return Link(list_to_links(lst[0]), list_to_links(lst[1:]))
+    stack = [(lst, [])]
+    while True:
+        (current, done) = stack[-1]
+        if len(done) < len(current):
+            value = current[len(done)]
+            if isinstance(value, list):
+                stack.append((value, []))
+            else:
+                done.append(value)
         else:
-            return Link(lst[0], list_to_links(lst[1:]))
+            stack.pop()
+            link = Link()
+            for value in reversed(done):
+                link = Link(value, link)
+            if not stack:
+                return link
+            stack[-1][1].append(link)
+
+class Chunk(Link):
+    """A Link whose known values are kept together in a tuple, rather than one
+    Link per value.
+
+    Walking a long list one Link at a time is slow, and that's what has to
+    happen to find its length, or the value at some position. A Chunk knows how
+    many values it holds, and can find any of them, without walking anywhere.
+    After its values it can end the way any Link can: with the empty list,
+    another Link, a value for a dotted pair, or, most usefully, a
+    LogicVariable standing for a rest of the list we don't know yet:
+
+        list_to_chunk(['Dodo', 'Mouse', 'Duck'], var(0))
+
+    Everywhere else it behaves just like the Links it stands for. Its `tail`
+    is another Chunk that shares the same tuple, starting one value further
+    along, so taking it apart head by head doesn't copy anything.
+    """
+    __slots__ = ('_items', '_offset', '_rest', '_hashes')
+
+    def __new__(cls, items, rest=(), offset=0):
+        """Chunks should be made with `list_to_chunk`, which takes care of
+        empty lists and lists inside the list.
+
+        @param items: A tuple of at least one value.
+        @param rest: What comes after the values, () if nothing.
+        @param offset: How many of `items` come before this Chunk's head.
+        """
+        assert offset < len(items), "Chunks can't be empty."
+        if isinstance(rest, Link) and rest.is_empty():
+            rest = ()
+        self = object.__new__(cls)
+        self._canonical = None
+        self._items = items
+        self._offset = offset
+        self._rest = rest
+        self._ground = all(_is_ground(item) for item in items[offset:]) and _is_ground(rest)
+        # The hashes of every Chunk sharing `items`, worked out once for all
+        # of them the first time any is hashed.
+        self._hashes = []
+        self._hash = None
+        if self._ground:
+            try:
+                self._hash = self.__hash__()
+            except TypeError:  # Something in the list can't be hashed.
+                self._ground = False
+        return self
+
+    def _view(self, offset):
+        view = object.__new__(type(self))
+        view._canonical = None
+        view._items = self._items
+        view._offset = offset
+        view._rest = self._rest
+        view._ground = self._ground
+        view._hashes = self._hashes
+        view._hash = self._hashes[offset] if self._hashes else None
+        return view
+
+    def __reduce__(self):
+        return (type(self), (self._items[self._offset:], self._rest))
+
+    def __hash__(self):
+        """The same hash as the Links this Chunk stands for. The hash of a
+        Link is the hash of its `(head, tail)`, so these are worked out from
+        the last value back to the first.
+
+        @return: A reasonably unique hash.
+        """
+        if self._hash is None:
+            hashes = self._hashes
+            if not hashes:
+                items = self._items
+                hashes.extend([None] * len(items))
+                tail = _Hash(hash(self._rest))
+                for index in reversed(range(len(items))):
+                    tail = _Hash(hash((items[index], tail)))
+                    hashes[index] = tail.value
+            self._hash = hashes[self._offset]
+        return self._hash
+
+    @property
+    def head(self):
+        return self._items[self._offset]
+
+    @property
+    def tail(self):
+        if self._offset + 1 == len(self._items):
+            return self._rest
+        return self._view(self._offset + 1)
+
+    @property
+    def rest(self):
+        """What comes after all of this Chunk's values."""
+        return self._rest
+
+    def is_empty(self):
+        return False
+
+    def known_length(self):
+        """@return: The number of values in this Chunk, not counting `rest`.
+        """
+        return len(self._items) - self._offset
+
+    def known(self, index):
+        """The value at `index` in this Chunk.
+
+        @param index: A number less than `known_length()`.
+        @return: The value at that position.
+        """
+        return self._items[self._offset + index]
+
+class _Hash(object):
+    """Stands in for a value that's already been hashed, so a Chunk can hash
+    `(head, tail)` pairs without making the tails.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return self.value
+
+def list_to_chunk(lst, rest=()):
+    """Much like `list_to_links`, but the values of `lst` are kept together in
+    a Chunk. Lists inside `lst` are converted with `list_to_links`.
+
+    @param lst: The python list structure to convert.
+    @param rest: What comes after the values of `lst`, often a LogicVariable.
+    @return: A Chunk, or `rest` if `lst` is empty.
+    """
+    assert isinstance(lst, list), "Only lists can be converted to Chunks."
+    if not lst:
+        return Link() if rest == () else rest
+    items = tuple([list_to_links(value) if isinstance(value, list) else value for value in lst])
+    return Chunk(items, rest)
 
 class LogicVariable(object):
     """This is a minor deviation from how most of the papers handle
@@ -185,6 +470,8 @@ class LogicVariable(object):
     By making this a class you'll be able to see the name that was attached to,
     I promise this will make exploration easier and more interesting.
     """
+    __slots__ = ('id', 'name')
+
     def __init__(self, identifier, name=None):
         """Logic Variables should only be instantiated using `call_fresh` in
         general usage.  If you instantiate one by hand you're asking for
@@ -232,11 +519,179 @@ class LogicVariable(object):
         """
         return self.id
 
+class Substitution(Set):
+    """The values of the `eq` constraint. In FEMC, and in the rest of this file,
+    it's thought of as a set of `(variable, value)` pairs, and that's exactly
+    how it reads from the outside: you can iterate over it, test membership and
+    compare it with a plain set.
+
+    The trouble with a plain frozenset is that finding the value of a variable
+    means looking at every pair, and every new binding copies the whole set.
+    Instead the pairs are kept in a persistent map keyed by the variable's
+    `id`, so a lookup is a single hash and a new binding shares all of the
+    storage of the substitution it came from.
+    """
+    __slots__ = ('_bindings', '_ranks', '_shortcuts')
+    _empty = PMap()
+
+    def __init__(self, pairs=()):
+        """@param pairs: An iterable of `(variable, value)` pairs. Each variable
+        may only have one value.
+        """
+        bindings = self._empty
+        for (variable, value) in pairs:
+            bound = bindings.get(variable.id)
+            assert bound is None or bound[1] == value, "%s has more than one value." % repr(variable)
+            bindings = bindings.set(variable.id, (variable, value))
+        self._bindings = bindings
+        # Variables bound to each other form a union-find forest, `_ranks` keeps
+        # its trees shallow and `_shortcuts` holds compressed paths, both keyed
+        # by variable id. Neither of them changes which pairs are in the set.
+        self._ranks = PMap()
+        self._shortcuts = PMap()
+
+    @classmethod
+    def _from_iterable(cls, pairs):
+        """Lets the set operators, eg. `|`, build a Substitution."""
+        return cls(pairs)
+
+    def __iter__(self):
+        return self._bindings.values()
+
+    def __len__(self):
+        return len(self._bindings)
+
+    def __contains__(self, pair):
+        try:
+            (variable, value) = pair
+        except (TypeError, ValueError):
+            return False
+        if not varq(variable):
+            return False
+        bound = self._bindings.get(variable.id)
+        return bound is not None and bound[1] == value
+
+    __hash__ = Set._hash
+
+    def __repr__(self):
+        return "Substitution({%s})" % ", ".join([repr(pair) for pair in self])
+
+    def lookup(self, variable):
+        """@param variable: A LogicVariable.
+        @return: The value `variable` is bound to, or `variable` itself if it
+        isn't bound to anything.
+        """
+        bound = self._bindings.get(variable.id)
+        return variable if bound is None else bound[1]
+
+    def ext(self, variable, value):
+        """@return: A new Substitution with `variable` bound to `value`."""
+        return self._extend(self._bindings.set(variable.id, (variable, value)), self._ranks)
+
+    def _extend(self, bindings, ranks):
+        """Everything in this substitution is still in the new one, so its
+        compressed paths still hold."""
+        substitution = Substitution.__new__(type(self))
+        substitution._bindings = bindings
+        substitution._ranks = ranks
+        substitution._shortcuts = self._shortcuts
+        return substitution
+
+    def alias(self, left, right):
+        """Bind two unbound variables to each other, by rank, so the shallower
+        tree is pointed at the deeper one. If they're the same rank then `left`
+        is bound to `right`.
+
+        @return: A new Substitution with the variables bound.
+        """
+        leftRank = self._ranks.get(left.id, 0)
+        rightRank = self._ranks.get(right.id, 0)
+        if leftRank > rightRank:
+            return self._extend(self._bindings.set(right.id, (right, left)), self._ranks)
+        elif leftRank == rightRank:
+            ranks = self._ranks.set(right.id, rightRank + 1)
+            return self._extend(self._bindings.set(left.id, (left, right)), ranks)
+        else:
+            return self._extend(self._bindings.set(left.id, (left, right)), self._ranks)
+
+    def walk(self, term):
+        """Follow `term` until reaching a value that isn't a variable, or a
+        variable with no value. Every variable that took more than one step to
+        get through is given a shortcut to the end of its chain.
+
+        @param term: A LogicVariable.
+        @return: The value of `term`.
+        """
+        bindings = self._bindings
+        visited = []
+        shortcut = self._shortcuts.get(term.id)
+        if shortcut is not None:
+            visited.append(term)
+            term = shortcut
+        bound = bindings.get(term.id)
+        while bound is not None and varq(bound[1]):
+            visited.append(term)
+            term = bound[1]
+            bound = bindings.get(term.id)
+        if len(visited) > 1:
+            shortcuts = self._shortcuts
+            for variable in visited:
+                shortcuts = shortcuts.set(variable.id, term)
+            self._shortcuts = shortcuts
+        return term if bound is None else bound[1]
+
+class DenseSubstitution(Substitution):
+    """The same as a Substitution, but the bindings are kept in a PVector
+    indexed directly by the variable's `id` rather than in a hash map.
+
+    Since `call_fresh` and friends hand out identifiers in order from
+    `State.count`, the ids used in any one run are packed tightly together, so
+    a vector wastes almost no space, and each step of a walk is a few tuple
+    lookups rather than a hash. A new binding copies less than it does in a
+    Substitution, about a third as much for the few hundred variables of a
+    hanoi search, see `benchmark_substitution` in run_benchmarks.py.
+
+    Which substitution gets used is decided by the State a run starts from,
+    every new binding is added to the substitution already there:
+
+        run_x(lambda x: ...)(State({"eq": DenseSubstitution()}))
+    """
+    __slots__ = ()
+    _empty = PVector()
+
+    def __init__(self, pairs=()):
+        pairs = list(pairs)
+        assert all(isinstance(variable.id, int) for (variable, value) in pairs), \
+            "DenseSubstitution needs integer variable ids."
+        super().__init__(pairs)
+
+    def ext(self, variable, value):
+        assert isinstance(variable.id, int), "DenseSubstitution needs integer variable ids."
+        return super().ext(variable, value)
+
+class ConstraintStore(dict):
+    """The constraints of a State, by name. It's a plain dictionary, but one
+    that's never changed once it's made: `set` makes a new store instead, which
+    shares the Substitution and PSets of every other constraint with this one.
+    There are only ever a handful of kinds of constraint, so that's cheap, and
+    the constraints of each kind are never copied.
+    """
+    __slots__ = ()
+
+    def set(self, name, values):
+        """@return: A new ConstraintStore with `values` as the constraint
+        `name`."""
+        store = ConstraintStore(self)
+        store[name] = values
+        return store
+
+_NO_ARGS = PSet()
+
 class State(object):
     """This contains the total state of a logic system at any point in time.
     This will consist of:
-        constraints: A dictionary of constraints by name, each of which will
-           contain the values to be tested by the constraint.
+        constraints: A ConstraintStore of constraints by name, each of which
+           will contain the values to be tested by the constraint.
         constraintFunctions: This is just a bit redundant, it contains a
            dictionary of constraint functions, also by name. It's matched with
            `constraints` as the function to be executed on each of the set
@@ -244,42 +699,77 @@ class State(object):
         count: Tracks the number of new LogicVariables that have been
            instantiated in this logic system and is used when selecting
            an identifier for new LogicVariables when instantiated.
+        watchers: The constraints each unbound LogicVariable is watched by,
+           so when it gets a value only those constraints need checking again.
+        woken: The ids of the watched LogicVariables that have been given a
+           value since the constraints were last applied.
 
     One major deviation in this module from FEMC is I've chosen not to pre-bake
     any kind of constraint into the State, they are discovered at the time that
     goals are processed.  I chose this because it makes it relatively easy to
     understand how new constraints are added.
-    """
 
+    The constraints of each kind are kept in a persistent set, a PSet (see
+    `microkanren.persistent`), so that a goal adding one to a new State
+    shares all the rest with the old State, rather than copying them.
+    """
+    __slots__ = ('id', 'parentId', 'count', 'constraints', 'constraintFunctions', 'watchers', 'woken')
     nextId = 0
 
-    def __init__(self, constraints={}, constraintFunctions={}, count=0, parentId=None):
+    def __init__(self, constraints={}, constraintFunctions={}, count=0, parentId=None, watchers=None, woken=None):
         """In most of your usage, you'll instantiate State as empty, but will
         have to worry about adding new constraints and functions if you write
         a custom constraint. Fortunately we have functions further down to make
         that easier.
 
         @param constraints: A dictionary containing constraint names, each of
-        which points to a frozenset of arguments to be passed to the constraint
-        to determine if the constraint is met.
+        which points to a set of arguments to be passed to the constraint
+        to determine if the constraint is met. The one exception is `eq`, which
+        is kept as a Substitution, though it can be given as any set of pairs.
             eg {"eq":frozenset({(var(0, 'rabbit'), 'white'),
                                 (var(1, 'queen'), 'red')})
+        The sets are kept as PSets, in a ConstraintStore. Given the
+        ConstraintStore of another State it's used just as it is.
         @param constraintFunctions: This allows us to add new kinds of
         constraint to the logic system on the fly. It will be a dictionary with
         the name of the constraint as key and the function as value.
             eg {'eq': <function <lambda> at 0x7f2529f7c950>}
         @param count: The number of LogicVariables that have been instantiated
         in the State.
+        @param watchers: A PMap from the id of each LogicVariable to the
+        constraints watching it, as `(name, args)` pairs. Every goal that makes
+        a new State from an old one passes it along, along with `woken`. If it
+        isn't given it's worked out from `constraints`.
+        @param woken: A frozenset of the ids of LogicVariables whose
+        constraints are due to be checked. None means every constraint is due,
+        which is where a State given its constraints, but not its watchers,
+        starts.
         """
         assert count >= 0
         self.id = State.nextId
         State.nextId += 1
         self.parentId = parentId
         self.count = count
-        self.constraints = {}
+        if not isinstance(constraints, ConstraintStore):
+            store = ConstraintStore()
+            for constraint in constraints:
+                if constraint == "eq":
+                    values = constraints[constraint]
+                    if not isinstance(values, Substitution):
+                        values = Substitution(values)
+                else:
+                    values = PSet(constraints[constraint])
+                store[constraint] = values
+            constraints = store
+        self.constraints = constraints
         self.constraintFunctions = constraintFunctions
-        for constraint in constraints:
-            self.constraints[constraint] = frozenset(constraints[constraint])
+        if watchers is None:
+            watchers = _index(self.constraints)
+        if woken is None and len(self.constraints) == ("eq" in self.constraints):
+            # Nothing but `eq`, so there's nothing to check.
+            woken = frozenset()
+        self.watchers = watchers
+        self.woken = woken
 
     def __eq__(self, other):
         """When comparing two states for equality, we only compare the count and
@@ -357,37 +847,55 @@ def walk(term, substitution):
     values until term doesn't contain any LogicVariables that are on the left
     side in the substitution.
 
+    Each step of the walk is a single lookup in the Substitution, and chains of
+    variables are compressed as they're walked. If it's handed any other set of
+    pairs it's converted to a Substitution first.
+
     @param term: The original term to search for.
+    @param substitution: A Substitution, or set of `(variable, value)` pairs.
     @return: A literal value or LogicVariable depending on what the substitution
     contains.
     """
-    if varq(term):
-        values = [value for (t, value) in substitution if t == term]
-        assert len(values) <= 1
-        if values == []:
-            return term
-        elif varq(values[0]):
-            return walk(values[0], substitution)
-        else:
-            return values[0]
-    else:
+    if not varq(term):
         return term
+    if not isinstance(substitution, Substitution):
+        substitution = Substitution(substitution)
+    return substitution.walk(term)
 
 def deep_walk(term, substitution):
+    """Walks `term` and, if it's a Link, everything inside it, so that the
+    result has no LogicVariables that have values in the substitution.
+
+    Links being rebuilt sit on a stack with the values walked from them so far
+    and what's left of them to walk, which keeps long or deeply nested lists
+    from hitting the recursion limit. Ground Links have nothing to walk, so
+    they're kept just as they are.
+
+    @param term: The term to walk.
+    @param substitution: A Substitution, or set of `(variable, value)` pairs.
+    @return: `term` with every variable that has a value replaced by it.
+    """
     value = walk(term, substitution)
-    if isinstance(value, Link):
-        tail = value
-        lst = []
-        while not (tail.is_empty() or varq(tail)):
-            head = deep_walk(tail.head, substitution)
-            lst.append(head)
-            tail = walk(tail.tail, substitution)
-        lst.reverse()
-        for val in lst:
-            tail = Link(val, tail)
-        return tail
-    else:
+    if not isinstance(value, Link) or value._ground:
         return value
+    stack = [([], value)]
+    while True:
+        (heads, rest) = stack[-1]
+        if isinstance(rest, Link) and not rest._ground:
+            stack[-1] = (heads, walk(rest.tail, substitution))
+            head = walk(rest.head, substitution)
+            if isinstance(head, Link) and not head._ground:
+                stack.append(([], head))
+            else:
+                heads.append(head)
+        else:
+            stack.pop()
+            link = rest
+            for head in reversed(heads):
+                link = Link(head, link)
+            if not stack:
+                return link
+            stack[-1][0].append(link)
 
 def ext_s(variable, value, substitution):
     """ext_s is a helper function for eq, without checking for duplicates or
@@ -396,10 +904,13 @@ def ext_s(variable, value, substitution):
 
     @param variable: A LogicVariable
     @param value: A value that can either be a LogicVariable or literal.
-    @param substitution: A set of tuples indicating equality for LogicVariables.
-    @return: A new substitution with variable and value set as being equal.
+    @param substitution: A Substitution, or set of tuples indicating equality
+    for LogicVariables.
+    @return: A new Substitution with variable and value set as being equal.
     """
-    return substitution | {(variable, value)}
+    if not isinstance(substitution, Substitution):
+        substitution = Substitution(substitution)
+    return substitution.ext(variable, value)
 
 # The state when there is a contradiction in terms.
 mzero = iter([])
@@ -412,9 +923,9 @@ def unit(state):
     """
     yield state
 
-def unify(left, right, substitution):
+def unify(left, right, substitution, bound=None):
     """unify is a helper function and the core for eq. unify will
-    recursively look up both `left` and `right` in substitution using the `walk`
+    look up both `left` and `right` in substitution using the `walk`
     function.
 
     After getting each of their associated values, they are compared.
@@ -432,30 +943,49 @@ def unify(left, right, substitution):
     @param right: The right term in an equality goal.
     @param substitution: A set of paired terms in the form {(left, right)} which
     assert that left == right.
+    @param bound: If given, a list that each variable given a value is
+    appended to.
     @return: A valid substitution if `left` and `right` unify, False otherwise.
+
+    The pairs of terms still to be unified are kept on a stack, heads before
+    tails, rather than recursing, so long lists unify in a loop.
     """
-    leftValue = walk(left, substitution)
-    rightValue = walk(right, substitution)
-    if varq(leftValue) and varq(rightValue) and vareq(leftValue, rightValue):
-        return substitution
-    elif varq(leftValue):
-        return ext_s(leftValue, right, substitution)
-    elif varq(rightValue):
-        return ext_s(rightValue, left, substitution)
-    elif isinstance(leftValue, Link) and isinstance(rightValue, Link):
-        if leftValue.is_empty():
-            return substitution if rightValue.is_empty() else False
-        elif rightValue.is_empty():
-            return False
-        headSub = unify(leftValue.head, rightValue.head, substitution)
-        if headSub is not False:
-            return unify(leftValue.tail, rightValue.tail, headSub)
-        else:
+    pairs = [(left, right)]
+    while pairs:
+        (left, right) = pairs.pop()
+        leftValue = walk(left, substitution)
+        rightValue = walk(right, substitution)
+        if leftValue is rightValue:
+            continue
+        elif varq(leftValue) and varq(rightValue) and vareq(leftValue, rightValue):
+            continue
+        elif varq(leftValue) and varq(rightValue):
+            if not isinstance(substitution, Substitution):
+                substitution = Substitution(substitution)
+            substitution = substitution.alias(leftValue, rightValue)
+            if bound is not None:
+                bound.append(rightValue if substitution.lookup(leftValue) is leftValue else leftValue)
+        elif varq(leftValue):
+            substitution = ext_s(leftValue, right, substitution)
+            if bound is not None:
+                bound.append(leftValue)
+        elif varq(rightValue):
+            substitution = ext_s(rightValue, left, substitution)
+            if bound is not None:
+                bound.append(rightValue)
+        elif isinstance(leftValue, Link) and isinstance(rightValue, Link):
+            if leftValue._ground and rightValue._ground:
+                if not leftValue == rightValue:
+                    return False
+            elif leftValue.is_empty() or rightValue.is_empty():
+                if not (leftValue.is_empty() and rightValue.is_empty()):
+                    return False
+            else:
+                pairs.append((leftValue.tail, rightValue.tail))
+                pairs.append((leftValue.head, rightValue.head))
+        elif not leftValue == rightValue:
             return False
-    elif leftValue == rightValue:
-        return substitution
-    else:
-        return False
+    return substitution
 
 def generate(goal):
     """generate is used to simplify writing goals.  It's intended that when we
@@ -469,25 +999,79 @@ def generate(goal):
     @return: A stream of states.
     """
     def generate_help(state):
-        if isinstance(state, types.GeneratorType):
-            for genState in state:
-                result = goal(genState)
-                if isinstance(result, State):
-                    yield result
-                else:
-                    for new_result in result:
-                        yield new_result
+        if not isinstance(state, State):
+            return _each(goal, state)
+        result = goal(state)
+        if isinstance(result, State):
+            return unit(result)
         else:
-            result = goal(state)
-            try:
-                for genState in result:
-                    yield genState
-            except TypeError as err: # This is a hack because iterators are a pain to check for.
-                yield result
-            except:
-                raise
+            return result
     return generate_help
 
+def _each(goal, states):
+    """Feeds each state in the stream `states` to `goal` in turn.
+
+    @param goal: A goal that may or may not yield a stream of states.
+    @param states: A stream of states.
+    @return: A stream of states.
+    """
+    for genState in states:
+        result = goal(genState)
+        if isinstance(result, State):
+            yield result
+        else:
+            yield from result
+
+def connective(kind, value):
+    """Makes a goal the search engine (see `microkanren.search`) can take apart
+    for itself, rather than running it to get a stream of states. This is what
+    `conj`, `disj` and `call_fresh` are built on.
+
+    Called with a state, the goal returns a Suspension, which runs a search when
+    it's iterated over. When the search finds one coming out of another goal it
+    carries on with it in the same loop, so however deep a relation recurses
+    there's only ever one search running.
+
+    @param kind: CONJ, DISJ or FRESH from `microkanren.search`.
+    @param value: For CONJ and DISJ, the goals being combined. For FRESH, a
+    function that takes new LogicVariables and returns a goal.
+    @return: A goal.
+    """
+    def connective_help(state):
+        if isinstance(state, State):
+            return Suspension(connective_help, state, _expand)
+        else:
+            return _each(connective_help, state)
+    connective_help.connective = (kind, value)
+    return connective_help
+
+def _parameters(function):
+    """The names of the parameters of `function`, which are used to name the
+    LogicVariables handed to it. Looking in the code object is a good deal
+    quicker than `signature`, which matters when it's done for every fresh
+    goal in a search.
+    """
+    code = getattr(function, '__code__', None)
+    if code is None:
+        return list(signature(function).parameters)
+    return code.co_varnames[:code.co_argcount]
+
+def _expand(goal, state):
+    """Tells a `Search` what kind of goal `goal` is.
+    """
+    tag = getattr(goal, 'connective', None)
+    if tag is None:
+        result = goal(state)
+        return (LEAF, unit(result) if isinstance(result, State) else result, state)
+    (kind, value) = tag
+    if kind is FRESH:
+        count = state.count
+        newVars = [var(number, name) for (number, name) in zip(itertools.count(count), _parameters(value))]
+        newState = State(state.constraints, state.constraintFunctions, count + len(newVars), state.id,
+                         state.watchers, state.woken)
+        return (FRESH, value(*newVars), newState)
+    return (kind, value, state)
+
 def eq(left, right):
     """eq is the first and most common constraint.  It constrains `left` and
     `right` to be the same value.
@@ -498,20 +1082,87 @@ def eq(left, right):
     """
     def eqHelp(state):
         substitution = state.constraints.get("eq", frozenset())
-        unified = unify(left, right, substitution)
-        if isinstance(unified, frozenset):
-            constraints = {**state.constraints, **{"eq":unified}}
-            constraint_funcs = {**state.constraintFunctions, **{"eq":eq}}
-            return State(constraints, constraint_funcs, state.count, state.id)
+        bound = []
+        unified = unify(left, right, substitution, bound)
+        if unified is not False:
+            constraints = state.constraints.set("eq", unified)
+            constraint_funcs = _register(state.constraintFunctions, "eq", eq)
+            woken = state.woken
+            watched = [variable.id for variable in bound if variable.id in state.watchers]
+            if watched and woken is not None:
+                woken = woken.union(watched)
+            return State(constraints, constraint_funcs, state.count, state.id, state.watchers, woken)
         else:
             return mzero
     return generate(eqHelp)
 
+def _register(constraintFunctions, name, function):
+    """Add `function` to `constraintFunctions` as `name`, which only needs a
+    new dictionary the first time, every State after that can share it.
+    """
+    if constraintFunctions.get(name) is function:
+        return constraintFunctions
+    return {**constraintFunctions, name:function}
+
+def _free_variables(term, substitution):
+    """Every unbound LogicVariable in `term`, looking inside Links, tuples and
+    lists, as it is in `substitution`.
+
+    @return: A list of LogicVariables, which may have repeats.
+    """
+    variables = []
+    terms = [term]
+    while terms:
+        term = terms.pop()
+        if varq(term):
+            term = walk(term, substitution)
+        if varq(term):
+            variables.append(term)
+        elif isinstance(term, Chunk):
+            terms.extend(term._items[term._offset:])
+            terms.append(term._rest)
+        elif isinstance(term, Link):
+            if not term._ground and not term.is_empty():
+                terms.append(term.tail)
+                terms.append(term.head)
+        elif isinstance(term, (tuple, list)):
+            terms.extend(term)
+    return variables
+
+def _watch(watchers, name, args, substitution):
+    """Add the constraint `name` with `args` to the watchers of each of the
+    unbound variables in `args`.
+
+    @return: The new watchers.
+    """
+    entry = (name, args)
+    for variable in _free_variables(args, substitution):
+        watching = watchers.get(variable.id, frozenset())
+        if entry not in watching:
+            watchers = watchers.set(variable.id, watching | {entry})
+    return watchers
+
+def _index(constraints):
+    """The watchers for all of `constraints`, for a State that wasn't given
+    them."""
+    substitution = constraints.get("eq", frozenset())
+    watchers = PMap()
+    for name in constraints:
+        if name != "eq":
+            for args in constraints[name]:
+                watchers = _watch(watchers, name, args, substitution)
+    return watchers
+
 def make_constraint(state, fails, function, *args):
     """A small helper function for constructing new constraints, it takes care
     most of the standard chores of adding the new function and terms to the
     State.
 
+    The constraint is also added to the watchers of the variables in `args`
+    that don't have values yet. It'll be checked again when any of them gets
+    one, see `applyConstraints`, and not before, so the constraint should
+    check everything it can right away.
+
     @param state: The state that's changing.
     @param fails: If false, then the state is invalid an mzero is returned, this
     is used to simplify the constraint itself.
@@ -521,26 +1172,68 @@ def make_constraint(state, fails, function, *args):
     """
     if fails:
         return mzero
+    elif function is eq:
+        return eq(*args)(state)
     else:
         name = function.__name__
-        constraint = state.constraints.get(name, frozenset())
-        constraints = {**state.constraints, **{name:constraint | {args}}}
-        constraint_funcs = {**state.constraintFunctions, name:function}
-        return unit(State(constraints, constraint_funcs, state.count, state.id))
+        constraint = state.constraints.get(name, _NO_ARGS)
+        constraints = state.constraints.set(name, constraint.add(args))
+        constraint_funcs = _register(state.constraintFunctions, name, function)
+        substitution = state.constraints.get("eq", frozenset())
+        watchers = _watch(state.watchers, name, args, substitution)
+        return unit(State(constraints, constraint_funcs, state.count, state.id, watchers, state.woken))
+
+def drop_constraint(state, function, *args):
+    """The other way round from `make_constraint`, for a constraint that's
+    been met for good, or replaced by another. It won't be checked again.
+
+    @param state: The state that's changing.
+    @param function: The constraint function the constraint was added with.
+    @param *args: Its arguments.
+    @return: A State without the constraint, which is `state` if it wasn't
+    there to begin with.
+    """
+    name = function.__name__
+    constraint = state.constraints.get(name, _NO_ARGS)
+    if args not in constraint:
+        return state
+    constraints = state.constraints.set(name, constraint.remove(args))
+    return State(constraints, state.constraintFunctions, state.count, state.id, state.watchers, state.woken)
 
 def neq(left, right):
     """Asserts that the `left` value is not equal to the `right` value.
 
+    Rather than keeping `left` and `right` as they are, neq tries to unify
+    them, which says what it would take for them to be equal. If they can't
+    be, there's nothing to keep, and if they already are, it fails. Otherwise
+    the variables that would have to be bound, and what to, are all that's
+    kept. Each of these is a disequality that only has to be checked again
+    once one of those variables is bound, when it's replaced by whatever's
+    left of it.
+
     @param left: A literal or LogicVariable
     @param right: A literal or LogicVariable
     @return: A function that takes a state and returns a stream of states.
     """
     def neqHelp(state):
         substitution = state.constraints.get("eq", frozenset())
-        leftValue = walk(left, substitution)
-        rightValue = walk(right, substitution)
-        fails = any([leftValue == rightValue])
-        return make_constraint(state, fails, neq, left, right)
+        bound = []
+        unified = unify(left, right, substitution, bound)
+        if unified is not False and not bound:
+            return mzero
+        args = None
+        if unified is not False:
+            lefts = Link()
+            rights = Link()
+            for variable in reversed(bound):
+                lefts = Link(variable, lefts)
+                rights = Link(unified.lookup(variable), rights)
+            args = (lefts.head, rights.head) if len(bound) == 1 else (lefts, rights)
+        if args != (left, right):
+            state = drop_constraint(state, neq, left, right)
+        if args is None:
+            return unit(state)
+        return make_constraint(state, False, neq, *args)
     return generate(neqHelp)
 
 def absento(elem, lst):
@@ -557,61 +1250,126 @@ def absento(elem, lst):
 def call_fresh(function):
     """call_fresh is used to instantiate new variables in the logic system.
 
+    The new variable is named after the argument of `function`, and it's id is
+    the next one free in the state the goal is run against.
+
     @param function: A single arity function that returns a goal.
     @return: The goal returned by function.
     """
-
-    def call_fresh_help(state):
-        count = state.count
-        # Gets the names of the argument for 'function'
-        name = list(signature(function).parameters)[0]
-        new_var = var(count, name)
-        goal = function(new_var)
-        newState = State(state.constraints, state.constraintFunctions, count+1, state.id)
-        succeeds = False
-        for state_ in goal(newState):
-            succeeds = True
-            yield state_
-    return generate(call_fresh_help)
-
-def call(f):
-    def deep_get(val, state):
-        constraints = state.constraints
-        eq = constraints.get('eq', frozenset())
-        return deep_walk(var, eq)
-
+    return connective(FRESH, function)
+
+def call(f, strategy=INTERLEAVE, depth=None, cost=None, budget=None, propagation=None):
+    """Run the goal `f` returns, given a fresh variable for each of its
+    arguments, and apply the constraints to each state it succeeds in.
+
+    @param f: A function that takes logic variables and returns a goal.
+    @param strategy: How to search for states, one of INTERLEAVE (fair, and the
+    default), DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY or BEST_FIRST.
+    @param depth: The deepest, counted in disjunctions and fresh goals, any
+    strategy but INTERLEAVE will look for states.
+    @param cost: For PRIORITY and BEST_FIRST, a function taking a state and its
+    depth and returning what it costs. Cheapest goes first.
+    @param budget: A `Budget` that stops the search early once it's used up,
+    or is cancelled. The states found by then are all that come out, and
+    `budget.exhausted` says why.
+    @param propagation: A `PropagationStats` to count how much work applying
+    the constraints to each state took.
+    @return: A function that takes a state and streams the states it succeeds in.
+    """
     def call_help(state):
-        c = state.count
-        params = signature(f).parameters
-        arg_count = len(params)
-        new_c = c + arg_count
-        ids_and_params = zip(range(c, new_c), params)
-        new_vars = [var(number, name) for (number, name) in ids_and_params]
-        fun = f(*new_vars)
-        newState = State(state.constraints, state.constraintFunctions, new_c, state.id)
-        state_generator = fun(newState)
-        stateStreams = [state_generator]
-        newStreams = []
-        while stateStreams:
-            for stateStream in stateStreams:
-                try:
-                    resultBase = stateStream.__next__()
-                    baseArgResults = [deep_get(var, resultBase) for var in new_vars]
-                    resultStream = applyConstraints(resultBase)
-                    for result in resultStream:
-                        argResults = [deep_get(var, result) for var in new_vars]
-                        if baseArgResults == argResults:
-                            yield result
-                        else:
-                            newStreams.append(unit(result))
-                    newStreams.append(stateStream)
-                except StopIteration:
-                        pass
-            stateStreams = newStreams
-            newStreams = []
+        (new_vars, fun, newState) = _call_setup(f, state)
+        state_generator = iter(Search(fun, newState, _expand, strategy=strategy, depth=depth, cost=cost, budget=budget).run())
+        return constrained(state_generator, propagation)
 
     return call_help
 
+def _call_setup(f, state):
+    """Give `f` a fresh variable for each of its arguments.
+
+    @return: The new variables, the goal `f` returns, and a state that counts
+    the new variables.
+    """
+    c = state.count
+    params = signature(f).parameters
+    arg_count = len(params)
+    new_c = c + arg_count
+    ids_and_params = zip(range(c, new_c), params)
+    new_vars = [var(number, name) for (number, name) in ids_and_params]
+    fun = f(*new_vars)
+    newState = State(state.constraints, state.constraintFunctions, new_c, state.id, state.watchers, state.woken)
+    return (new_vars, fun, newState)
+
+def constrained(state_generator, stats=None):
+    """Apply the constraints to each state from `state_generator`, as `call`
+    does.
+
+    @param state_generator: A stream of states.
+    @param stats: A `PropagationStats` to count in, if any.
+    @return: A stream of the states that meet their constraints.
+    """
+    for state in state_generator:
+        yield from applyConstraints(state, stats)
+
+def run_parallel(f, state=State(), workers=None, strategy=DEPTH_FIRST, depth=None, cost=None, budget=None):
+    """Like `call`, but with the search split between a pool of processes,
+    see `microkanren.parallel`. States can't always be pickled, their
+    constraints hold goals, so what comes back is the value of each of `f`'s
+    arguments.
+
+    @param f: A function that takes logic variables and returns a goal.
+    @param state: The state to start in.
+    @param workers: How many processes to use, by default one for each core.
+    @param strategy: How each process searches, DEPTH_FIRST, PRIORITY or
+    BEST_FIRST.
+    @param depth: As for `call`.
+    @param cost: As for `call`.
+    @param budget: As for `call`, see `microkanren.parallel` for how it's
+    shared between the processes.
+    @return: A stream of lists, the values of `f`'s arguments in each state it
+    succeeds in, in the order they're found.
+    """
+    (new_vars, fun, newState) = _call_setup(f, state)
+
+    def finish(states):
+        for result in constrained(states):
+            substitution = result.constraints.get('eq', frozenset())
+            yield [deep_walk(new_var, substitution) for new_var in new_vars]
+
+    return parallel.ParallelSearch(fun, newState, _expand, workers=workers, strategy=strategy, depth=depth, cost=cost,
+                                   finish=finish, budget=budget).run()
+
+def run_portfolio(f, configurations, results=None, state=State(), budget=None):
+    """Race `call` with each of `configurations` in a process of its own, see
+    `microkanren.parallel.Portfolio`, and keep the answers of whichever gets
+    there first, as it finds them. As with `run_parallel`, what comes back is
+    the value of each of `f`'s arguments.
+
+    @param f: A function that takes logic variables and returns a goal.
+    @param configurations: A list of dicts of `strategy`, `depth` and `cost`
+    to `call` with, and an `f` to call in place of the first, that gives the
+    same goal with its conjunctions in a different order say.
+    @param results: The most answers to take from the winner, None for all of
+    them.
+    @param state: The state to start in.
+    @param budget: As for `call`, each process having its own copy, see
+    `microkanren.parallel.Portfolio`.
+    @return: A stream of lists, the values of `f`'s arguments in the states
+    the winner succeeded in.
+    """
+    def entrant(options):
+        options = dict(options)
+        g = options.pop('f', f)
+
+        def values():
+            (new_vars, fun, newState) = _call_setup(g, state)
+            for result in constrained(iter(Search(fun, newState, _expand, budget=budget, **options).run())):
+                substitution = result.constraints.get('eq', frozenset())
+                yield [deep_walk(new_var, substitution) for new_var in new_vars]
+
+        return values
+
+    return parallel.Portfolio([entrant(options) for options in configurations], results, budget=budget).run()
+
 
 def disj(g1, g2):
     """Take two relations, pass the state to each of them separately, yield a
@@ -623,12 +1381,7 @@ def disj(g1, g2):
     @return: A function that reads a stream of states and outputs the states
     yielded from each realation.
     """
-
-    def disj_help(state):
-        state_1 = State(state.constraints, state.constraintFunctions, state.count, state.id)
-        state_2 = State(state.constraints, state.constraintFunctions, state.count, state.id)
-        yield from mplus(g1(state_1), g2(state_2))
-    return generate(disj_help)
+    return connective(DISJ, (g1, g2))
 
 def conj(g1, g2):
     """Take two relations, pass the state to the first relation, then pass each
@@ -639,10 +1392,7 @@ def conj(g1, g2):
     @param g2: A relation.
     @return: A function that streams a state through both g1 and g2.
     """
-    def conj_help(state):
-        state_ = State(state.constraints, state.constraintFunctions, state.count, state.id)
-        yield from bind(g1, g2)(state_)
-    return generate(conj_help)
+    return connective(CONJ, (g1, g2))
 
 def for_all(value, goal):
     """Given a `value` that may be a Logic Varible or Link and an Arity-1 `goal` that has not had
@@ -743,25 +1493,76 @@ def between_all(value, goal):
             return mzero
     return generate(between_all_help)
 
-def applyConstraints(state):
-    """For the given state, consecutively applies all of it's exiting
-    constraints to determine if a change in the state breaks one of the existing
-    constraints.
+class PropagationStats(object):
+    """Counts the work `applyConstraints` did to get its states.
+    """
+    __slots__ = ('answers', 'rounds', 'checks')
+
+    def __init__(self):
+        self.answers = 0
+        # Each time the woken constraints of a state were run.
+        self.rounds = 0
+        # Constraints run, over all the rounds.
+        self.checks = 0
+
+    def __repr__(self):
+        return "PropagationStats(answers=%i, rounds=%i, checks=%i)" % (self.answers, self.rounds, self.checks)
+
+    def roundsPerAnswer(self):
+        return self.rounds / self.answers if self.answers else 0.0
+
+def _due(state):
+    """The constraints to check in `state`, as `(name, args)` pairs."""
+    if state.woken is None:
+        return [(name, args) for name in state.constraints if name != "eq" for args in state.constraints[name]]
+    due = set()
+    for identifier in state.woken:
+        due.update(state.watchers.get(identifier, ()))
+    # Those that have been dropped since they were watched are done with.
+    return [(name, args) for (name, args) in due if args in state.constraints.get(name, _NO_ARGS)]
+
+def applyConstraints(state, stats=None):
+    """For the given state, consecutively applies the constraints watching
+    the variables that have been given values since they were last applied,
+    to determine if a change in the state breaks one of the existing
+    constraints. The rest can't have changed, so aren't looked at.
+
+    Checking a constraint can give more variables values, which wakes up
+    their constraints in turn. Each state that comes out of a round of checks
+    is put on a stack to have its own woken constraints checked, and only
+    once a state has none left, so nothing has changed, is it done.
 
     @param state: The state getting verified.
+    @param stats: A `PropagationStats` to count in, if any.
     @return: A stream of states resulting from the application of the
     constraints.
     """
-    goal = unit
-    if isinstance(state, State):
-        for constraint in state.constraints:
-            newgoal = state.constraintFunctions[constraint]
-            for args in state.constraints[constraint]:
-                goal = bind(goal, newgoal(*args))
-        yield from goal(state)
-    else:
+    if not isinstance(state, State):
         for stateFromGen in state:
-            yield from applyConstraints(stateFromGen)
+            yield from applyConstraints(stateFromGen, stats)
+        return
+    pending = [iter((state,))]
+    while pending:
+        try:
+            state = next(pending[-1])
+        except StopIteration:
+            pending.pop()
+            continue
+        due = _due(state)
+        if not due:
+            if stats is not None:
+                stats.answers += 1
+            yield state
+            continue
+        goal = unit
+        for (name, args) in due:
+            goal = bind(goal, state.constraintFunctions[name](*args))
+        if stats is not None:
+            stats.rounds += 1
+            stats.checks += len(due)
+        checked = State(state.constraints, state.constraintFunctions, state.count, state.id, state.watchers,
+                        frozenset())
+        pending.append(iter(goal(checked)))
 
 def mplus(state_stream1, state_stream2):
     """mplus is a monad thing, don't worry about the name.
@@ -783,7 +1584,7 @@ def mplus(state_stream1, state_stream2):
     @param state_stream2: A stream of zero or more states.
     @return: The combined states from state_stream1 and state_stream2
     """
-    stateStreams = [state_stream1, state_stream2]
+    stateStreams = [iter(state_stream1), iter(state_stream2)]
     newStreams = []
     while stateStreams:
         for stateStream in stateStreams:
@@ -804,30 +1605,4 @@ def bind(goal1, goal2):
     @return: A new goal that given a state will yield the results of applying
     goal1 to that state, then threading the results through goal2.
     """
-    def bind_help(state):
-        goals = [goal1, goal2]
-        stateStreams = []
-        newStreams = []
-        for state in goal1(state):
-            stateStreams += [goal2(unit(state))]
-            for stateStream in stateStreams:
-                try:
-                    result = stateStream.__next__()
-                    yield result
-                    newStreams.append(stateStream)
-                except StopIteration:
-                        pass
-            stateStreams = newStreams
-            newStreams = []
-        while stateStreams:
-            for stateStream in stateStreams:
-                try:
-                    result = stateStream.__next__()
-                    yield result
-                    newStreams.append(stateStream)
-                except StopIteration:
-                        pass
-            stateStreams = newStreams
-            newStreams = []
-
-    return bind_help
+    return connective(CONJ, (goal1, goal2))
@@ -32,6 +32,8 @@ class Link(object):
     or `'cake'` may be all there is. This is very hard to represent using Python lists,
     but in this style of linked list can be represented like this: `Link('cake', LogicVariable(0))`
     """
+    __slots__ = ('head', 'tail')
+
     def __init__(self, head=None, tail=None):
         self.head = head
         if isinstance(tail, type(self)) and tail.is_empty():
@@ -79,6 +81,8 @@ class LogicVariable(object):
     This is terrible for clarity, and makes it hard to attach other data to your
     variable, like a name.
     """
+    __slots__ = ('id', 'name')
+
     def __init__(self, identifier, name=None):
         self.id = identifier
         self.name = name
@@ -100,6 +104,8 @@ class LogicVariable(object):
         return self.id
 
 class State(object):
+    __slots__ = ('count', 'substitution')
+
     def __init__(self, substitution={}, count=0):
         assert count >= 0
         assert len(substitution) <= count
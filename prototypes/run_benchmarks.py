@@ -0,0 +1,205 @@
+import os
+import time
+import sys
+import tracemalloc
+from towers_of_hanoi import *
+import microkanren.ukanren as ukanren
+import microkanren.urkanren as urkanren
+from microkanren.tabling import tabled
+
+"""Benchmarks
+
+Rough timings for comparing implementations against each other. None of these
+are precise, they're here so that when something is changed we can see if it
+made things better or worse on the problems we actually care about.
+"""
+
+def time_hanoi(start_state):
+    """Time how long it takes to find the first solution to the three disc
+    Towers of Hanoi, starting from `start_state`.
+
+    @param start_state: The State to start the search from.
+    @return: The number of seconds it took.
+    """
+    first_state = list_to_links([[0, 1, 2], [], []])
+    last_state = list_to_links([[], [], [0, 1, 2]])
+    start = time.time()
+    for res in run_x(lambda x: solve_hanoi(first_state, x, last_state))(start_state):
+        break
+    return time.time() - start
+
+def time_chain(substitution, length):
+    """Bind a chain of `length` variables, then walk from the far end of it.
+
+    @return: The number of seconds it took.
+    """
+    start = time.time()
+    for number in range(length):
+        substitution = ext_s(var(number), var(number + 1), substitution)
+    substitution = ext_s(var(length), 'Alice', substitution)
+    for number in range(length):
+        walk(var(number), substitution)
+    return time.time() - start
+
+def make_substitutions(empty, count):
+    """A chain of substitutions starting from `empty`, each binding one more
+    variable than the last, all kept alive."""
+    substitutions = [empty]
+    for number in range(count - 1):
+        substitutions.append(substitutions[-1].ext(var(number), 'Alice'))
+    return substitutions
+
+def peak_hanoi(start_state):
+    """The most memory the search in `time_hanoi` has allocated at once, in
+    bytes."""
+    tracemalloc.start()
+    time_hanoi(start_state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def benchmark_substitution():
+    print("== Substitution backends ==")
+    for (name, empty) in [("Substitution", Substitution()), ("DenseSubstitution", DenseSubstitution())]:
+        print("%s:" % name)
+        print("  chain of 2000: %.3fs" % time_chain(empty, 2000))
+        for count in (500, 5000):
+            # Once first, so what's allocated the first time round isn't counted.
+            make_substitutions(empty, count)
+            print("  bytes per binding, %i variables: %.0f" % (count, bytes_per(lambda count: make_substitutions(empty, count), count)))
+        print("  hanoi, 3 discs: %.3fs" % time_hanoi(State({"eq": empty})))
+        print("  hanoi, 3 discs, peak: %.0f KiB" % (peak_hanoi(State({"eq": empty})) / 1024))
+
+def time_planned_hanoi(discs):
+    """Time how long a best first search over `plan_hanoi` takes to find the
+    shortest solution for `discs` discs.
+
+    @return: The number of seconds it took, and the number of moves.
+    """
+    first_state = list_to_links([list(range(discs)), [], []])
+    last_state = list_to_links([[], [], list(range(discs))])
+    start = time.time()
+    for (path,) in run_x(lambda path: plan_hanoi(first_state, path, last_state, discs),
+                         BEST_FIRST, heuristic=lambda path: hanoi_cost(path, discs))(State()):
+        return (time.time() - start, link_length(path) - 1)
+
+def benchmark_planning(most=6):
+    print("== Hanoi, best first ==")
+    for discs in range(3, most + 1):
+        print("  %i discs: %.3fs, %i moves" % ((discs,) + time_planned_hanoi(discs)))
+
+def tea_party(seats):
+    """A ukanren goal with one answer for every way of seating the guests in
+    `seats` chairs, some of them more than once."""
+    guests = ['Alice', 'Mad Hatter', 'March Hare', 'The Dormouse']
+    chairs = ukanren.lvars(seats)
+    table = ukanren.LVar('table')
+    choices = [ukanren.Disj(*[ukanren.Eq(chair, guest) for guest in guests]) for chair in chairs]
+    return (table, ukanren.Conj(*(choices + [ukanren.Eq(table, chairs)])))
+
+def time_strategy(run, seats=7):
+    """Time finding every answer to `tea_party`.
+
+    @param run: A function taking the goal and returning its answers.
+    @return: The number of seconds it took, and the peak bytes allocated.
+    """
+    (table, goal) = tea_party(seats)
+    tracemalloc.start()
+    start = time.time()
+    for state in run(goal):
+        state[table]
+    seconds = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (seconds, peak)
+
+def benchmark_strategies():
+    print("== ukanren search strategies ==")
+    runs = [(ukanren.INTERLEAVE, lambda goal: goal.run()),
+            ("depth-first, persistent states", lambda goal: ukanren.Search(goal, ukanren.State(), ukanren._expand, ukanren._valid, ukanren.DEPTH_FIRST).run()),
+            ("depth-first, trail", lambda goal: goal.run(strategy=ukanren.DEPTH_FIRST))]
+    for (name, run) in runs:
+        (seconds, peak) = time_strategy(run)
+        print("  %s: %.3fs, peak %.0f KiB" % (name, seconds, peak / 1024))
+
+def benchmark_parallel(seats=7):
+    print("== ukanren in parallel, %i cores ==" % (os.cpu_count() or 1))
+    runs = [("depth-first", lambda goal: goal.run(strategy=ukanren.DEPTH_FIRST)),
+            ("depth-first, in parallel", lambda goal: goal.run(strategy=ukanren.DEPTH_FIRST, workers=os.cpu_count()))]
+    for (name, run) in runs:
+        (table, goal) = tea_party(seats)
+        start = time.time()
+        answers = sum(1 for state in run(goal))
+        print("  %s: %.3fs, %i answers" % (name, time.time() - start, answers))
+
+def benchmark_tabling(rooms=14):
+    """Every room reachable from the first, in a corridor where each room leads
+    to the next two, with and without tabling."""
+    print("== Tabling ==")
+    doors = [(room, room + step) for room in range(rooms) for step in (1, 2)]
+    def dooro(here, there):
+        return ukanren.Disj(*[ukanren.Conj(ukanren.Eq(here, a), ukanren.Eq(there, b)) for (a, b) in doors])
+    def routeo(here, there):
+        return ukanren.Disj(dooro(here, there), ukanren.Fresh(lambda middle: ukanren.Conj(dooro(here, middle), routeo(middle, there))))
+    @tabled
+    def tabled_routeo(here, there):
+        return ukanren.Disj(dooro(here, there), ukanren.Fresh(lambda middle: ukanren.Conj(dooro(here, middle), tabled_routeo(middle, there))))
+    there = ukanren.LVar('there')
+    for (name, relation) in [("plain", routeo), ("tabled", tabled_routeo)]:
+        start = time.time()
+        answers = len({state[there] for state in relation(0, there).run()})
+        print("  %s: %.3fs, %i rooms" % (name, time.time() - start, answers))
+    print("  %s" % tabled_routeo.tables.stats)
+
+def bytes_per(make, count=20000):
+    """Measure the memory allocated by `make` per object it creates.
+
+    @param make: A function taking a count, that creates and returns that
+    many objects.
+    @return: The average number of bytes allocated per object.
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = make(count)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum([stat.size_diff for stat in after.compare_to(before, 'filename')])
+    return allocated / count
+
+def make_ukanren_states(count):
+    """A chain of ukanren States, each adding one binding to the last."""
+    states = [ukanren.State()]
+    for variable in ukanren.lvars(count - 1):
+        states.append(states[-1].ext_s({variable: 'Alice'}))
+    return states
+
+def make_urconstraintkanren_states(count):
+    """A chain of urconstraintkanren States, each adding one binding to the last."""
+    states = [State()]
+    for number in range(count - 1):
+        states.extend(eq(var(number), 'Alice')(states[-1]))
+    return states
+
+def make_urkanren_states(count):
+    return [urkanren.State({}, number) for number in range(count)]
+
+def make_links(count):
+    return list_to_links(list(range(count)))
+
+def benchmark_memory():
+    print("== Memory ==")
+    print("  ukanren LVar: %.0f bytes" % bytes_per(ukanren.lvars))
+    print("  ukanren State: %.0f bytes" % bytes_per(make_ukanren_states))
+    print("  urconstraintkanren LogicVariable: %.0f bytes" % bytes_per(lambda count: [var(n) for n in range(count)]))
+    print("  urconstraintkanren State: %.0f bytes" % bytes_per(make_urconstraintkanren_states, 5000))
+    print("  urconstraintkanren Link: %.0f bytes" % bytes_per(make_links, 5000))
+    print("  urkanren State: %.0f bytes" % bytes_per(make_urkanren_states))
+    print("  urkanren Link: %.0f bytes" % bytes_per(lambda count: [urkanren.Link(n) for n in range(count)]))
+
+if __name__ == "__main__":
+    benchmark_memory()
+    benchmark_substitution()
+    benchmark_strategies()
+    benchmark_parallel()
+    benchmark_tabling()
+    benchmark_planning()
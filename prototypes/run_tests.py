@@ -3,6 +3,11 @@ import unittest
 from test.ukanren import *
 from test.collections import *
 from test.urconstraintkanren import *
+from test.persistent import *
+from test.search import *
+from test.parallel import *
+from test.tabling import *
+from test.ordering import *
 
 if __name__ == "__main__":
     unittest.main()
@@ -4,7 +4,6 @@ from towers_of_hanoi import *
 
 st = State()
 
-sys.setrecursionlimit(3700)
 
 first_state = list_to_links([[0,1,2], [], []])
 first = Link(Link(), first_state);
@@ -0,0 +1,88 @@
+import os.path
+import sys
+import unittest
+from microkanren.urconstraintkanren import *
+from microkanren.ordering import *
+
+def values(f, *names):
+    """Run `f` through `call`, and return the value of each of its arguments
+    in each state."""
+    results = []
+    for state in call(f)(State()):
+        substitution = state.constraints.get("eq", frozenset())
+        results.append([deep_walk(var(number, name), substitution) for (number, name) in enumerate(names)])
+    return results
+
+class Test_Ordering(unittest.TestCase):
+    def test_bounds(self):
+        state = next(iter(conj(lt(3, var(0)), lt(var(0), 9))(State({}, {}, 1))))
+        self.assertEqual(ordering_of(state).bounds(var(0)), (4, 8))
+        self.assertEqual(len(state.constraints['lt']), 2)
+
+    def test_bounds_through_chain(self):
+        (tweedledum, tweedledee, raven) = (var(0), var(1), var(2))
+        state = next(iter(conj(lt(tweedledum, tweedledee), conj(lt(tweedledee, raven), lt(1, tweedledum)))(State({}, {}, 3))))
+        self.assertEqual(ordering_of(state).bounds(raven), (4, None))
+        state = next(iter(lt(raven, 10)(state)))
+        self.assertEqual(ordering_of(state).bounds(tweedledum), (2, 7))
+
+    def test_loop_fails(self):
+        self.assertEqual(values(lambda hatter, hare: conj(lt(hatter, hare), lt(hare, hatter)), 'hatter', 'hare'), [])
+        self.assertEqual(values(lambda hatter, hare, dormouse: conj(lt(hatter, hare), conj(le(hare, dormouse), le(dormouse, hatter))),
+                                'hatter', 'hare', 'dormouse'), [])
+        self.assertEqual(values(lambda hatter: lt(hatter, hatter), 'hatter'), [])
+
+    def test_le_loop_is_fine(self):
+        self.assertEqual(len(values(lambda hatter, hare: conj(le(hatter, hare), le(hare, hatter)), 'hatter', 'hare')), 1)
+
+    def test_pinned(self):
+        self.assertEqual(values(lambda dum, dee: conj(lt(3, dum), conj(lt(dum, dee), lt(dee, 6))), 'dum', 'dee'), [[4, 5]])
+        self.assertEqual(values(lambda dum: conj(le(3, dum), le(dum, 3)), 'dum'), [[3]])
+
+    def test_squeezed_out(self):
+        self.assertEqual(values(lambda dum, dee: conj(lt(3, dum), conj(lt(dum, dee), lt(dee, 5))), 'dum', 'dee'), [])
+
+    def test_bound_later(self):
+        self.assertEqual(values(lambda dum, dee: conj(lt(dum, dee), conj(eq(dee, 4), eq(dum, 4))), 'dum', 'dee'), [])
+        self.assertEqual(values(lambda dum, dee: conj(lt(dum, dee), conj(eq(dee, 4), eq(dum, 3))), 'dum', 'dee'), [[3, 4]])
+        self.assertEqual(values(lambda dum, dee: conj(lt(dum, dee), eq(dum, dee)), 'dum', 'dee'), [])
+
+    def test_bound_later_tightens(self):
+        self.assertEqual(values(lambda dum, dee, raven: conj(lt(dum, dee), conj(lt(dee, raven), conj(eq(raven, 5), lt(2, dum)))),
+                                'dum', 'dee', 'raven'), [[3, 4, 5]])
+
+    def test_gt(self):
+        self.assertEqual(values(lambda queen: conj(gt(queen, 7), gt(9, queen)), 'queen'), [[8]])
+
+    def test_long_chain(self):
+        cards = [var(number) for number in range(500)]
+        state = next(iter(lt(0, cards[0])(State({}, {}, len(cards)))))
+        for (less, more) in zip(cards, cards[1:]):
+            state = next(iter(lt(less, more)(state)))
+        self.assertEqual(ordering_of(state).bounds(cards[-1]), (500, None))
+        self.assertEqual(list(lt(cards[-1], cards[0])(state)), [])
+
+    def test_long_chain_backwards(self):
+        cards = [var(number) for number in range(500)]
+        state = State({}, {}, len(cards))
+        for (less, more) in reversed(list(zip(cards, cards[1:]))):
+            state = next(iter(lt(less, more)(state)))
+        state = next(iter(lt(0, cards[0])(state)))
+        self.assertEqual(ordering_of(state).bounds(cards[-1]), (500, None))
+        self.assertEqual(list(lt(cards[-1], cards[0])(state)), [])
+        self.assertEqual(list(le(cards[250], cards[249])(state)), [])
+        self.assertEqual(len(list(le(cards[0], cards[-1])(state))), 1)
+
+    def test_chains_joined_in_the_middle(self):
+        cards = [var(number) for number in range(400)]
+        state = State({}, {}, len(cards))
+        for (less, more) in list(zip(cards[:200], cards[1:200])) + list(zip(cards[200:], cards[201:])):
+            state = next(iter(lt(less, more)(state)))
+        state = next(iter(le(cards[199], cards[200])(state)))
+        self.assertEqual(list(lt(cards[-1], cards[0])(state)), [])
+        self.assertEqual(list(le(cards[-1], cards[0])(state)), [])
+        state = next(iter(lt(9, cards[0])(state)))
+        self.assertEqual(ordering_of(state).bounds(cards[-1]), (408, None))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import itertools
+import os.path
+import sys
+import threading
+import time
+import unittest
+from microkanren.search import *
+from microkanren.parallel import *
+from test.search import succeed, fail, expand
+from microkanren import ukanren
+from microkanren import urconstraintkanren
+
+def gather(goal, **options):
+    return sorted(run(goal, (), expand, workers=2, **options))
+
+class Test_Parallel(unittest.TestCase):
+    def test_same_answers(self):
+        goal = ('conj', (('disj', (succeed('tea'), succeed('cake'), succeed('jam'))),
+                         ('disj', (succeed('Hatter'), succeed('Hare'), fail()))))
+        expected = sorted(Search(goal, (), expand).run())
+        self.assertEqual(len(expected), 6)
+        self.assertEqual(gather(goal), expected)
+        self.assertEqual(gather(goal, strategy=PRIORITY), expected)
+
+    def test_no_choices(self):
+        self.assertEqual(sorted(run(succeed('Walrus'), (), expand, workers=2)), [('Walrus',)])
+        self.assertEqual(sorted(run(fail(), (), expand, workers=2)), [])
+
+    def test_skewed_tree(self):
+        def oysters(number):
+            if number == 0:
+                return succeed('Oyster')
+            return ('disj', (fail(), ('conj', (oysters(number - 1), ('disj', (succeed('Walrus'), succeed('Carpenter')))))))
+        goal = ('disj', (fail(), fail(), oysters(12)))
+        expected = sorted(Search(goal, (), expand, strategy=DEPTH_FIRST).run())
+        self.assertEqual(len(expected), 2 ** 12)
+        search = ParallelSearch(goal, (), expand, workers=3)
+        self.assertEqual(sorted(search.run()), expected)
+        self.assertEqual(sum(stats.answers for stats in search.stats), 2 ** 12)
+        self.assertEqual(sum(stats.taken for stats in search.stats), sum(stats.given for stats in search.stats))
+        self.assertEqual(gather(goal, depth=5), sorted(Search(goal, (), expand, strategy=DEPTH_FIRST, depth=5).run()))
+
+    def test_leaves_with_many_states(self):
+        def many(goal, state):
+            if goal[0] == 'many':
+                return (LEAF, iter([state + (name,) for name in goal[1]]), state)
+            return expand(goal, state)
+        def courtiers(number):
+            if number == 0:
+                return succeed('Queen')
+            return ('conj', (('many', ('Two', 'Five', 'Seven')), ('disj', (fail(), ('fresh', lambda: courtiers(number - 1))))))
+        for strategy in (DEPTH_FIRST, PRIORITY, BEST_FIRST):
+            expected = sorted(Search(courtiers(5), (), many, strategy=strategy).run())
+            self.assertEqual(len(expected), 3 ** 5)
+            self.assertEqual(sorted(run(courtiers(5), (), many, workers=3, strategy=strategy)), expected)
+
+    def test_endless_answers_come_as_found(self):
+        slow = lambda: iter(time.sleep(60) or [])
+        race = Portfolio([slow, lambda: itertools.count()])
+        start = time.time()
+        self.assertEqual(list(itertools.islice(race.run(), 5)), [0, 1, 2, 3, 4])
+        self.assertEqual(race.winner, 1)
+        self.assertLess(time.time() - start, 30)
+
+    def test_no_answers_wins_when_finished(self):
+        race = Portfolio([lambda: iter(time.sleep(60) or ['Hare']), lambda: iter([])])
+        self.assertEqual(list(race.run()), [])
+        self.assertEqual(race.winner, 1)
+
+    def test_finish(self):
+        goal = ('disj', (succeed('Dee'), succeed('Dum'), succeed('Raven')))
+        self.assertEqual(gather(goal, finish=lambda states: (len(state[0]) for state in states)), [3, 3, 5])
+
+    def test_stop_early(self):
+        def forever(name):
+            return ('disj', (succeed(name), ('fresh', lambda: forever(name))))
+        goal = ('disj', (forever('Queen'), forever('King'), forever('Knave')))
+        answers = list(itertools.islice(run(goal, (), expand, workers=2), 20))
+        self.assertEqual(len(answers), 20)
+
+    def test_worker_errors(self):
+        def mad(goal, state):
+            if goal == 'Hatter':
+                raise ValueError("Why is a raven like a writing desk?")
+            return expand(goal, state)
+        goal = ('disj', (succeed('Hare'), 'Hatter', succeed('Dormouse')))
+        with self.assertRaises(ValueError):
+            list(run(goal, (), mad, workers=2))
+
+class Test_Portfolio(unittest.TestCase):
+    def test_first_to_finish_wins(self):
+        slow = lambda: iter(time.sleep(60) or [])
+        quick = lambda: iter(['Hare', 'Hatter'])
+        race = Portfolio([slow, quick])
+        start = time.time()
+        self.assertEqual(list(race.run()), ['Hare', 'Hatter'])
+        self.assertEqual(race.winner, 1)
+        self.assertLess(time.time() - start, 30)
+
+    def test_results(self):
+        race = Portfolio([lambda: itertools.count(), lambda: iter(time.sleep(60) or [])], results=3)
+        self.assertEqual(list(race.run()), [0, 1, 2])
+        self.assertEqual(race.winner, 0)
+
+    def test_finish(self):
+        race = Portfolio([lambda: iter(['Dee', 'Dum'])], finish=lambda states: (len(state) for state in states))
+        self.assertEqual(list(race.run()), [3, 3])
+
+    def test_errors(self):
+        def mad():
+            raise ValueError("Why is a raven like a writing desk?")
+        race = Portfolio([mad, lambda: iter(['Raven'])])
+        self.assertEqual(list(race.run()), ['Raven'])
+        self.assertEqual(race.winner, 1)
+        with self.assertRaises(ValueError):
+            list(Portfolio([mad, mad]).run())
+
+class Test_Parallel_Budget(unittest.TestCase):
+    def forever(self, name):
+        return ('disj', (succeed(name), ('fresh', lambda: self.forever(name))))
+
+    def test_steps(self):
+        budget = Budget(steps=200)
+        goal = ('disj', (self.forever('Queen'), self.forever('King')))
+        self.assertGreater(len(list(run(goal, (), expand, workers=2, budget=budget))), 0)
+        self.assertEqual(budget.exhausted, STEPS)
+
+    def test_cancel(self):
+        budget = Budget()
+        threading.Timer(0.2, budget.cancel).start()
+        list(run(self.forever('Queen'), (), expand, workers=2, budget=budget))
+        self.assertEqual(budget.exhausted, CANCELLED)
+
+    def test_portfolio_partial_results(self):
+        guest = ukanren.LVar()
+        def count_up(number=0):
+            return ukanren.Disj(ukanren.Eq(guest, number), ukanren.Fresh(lambda: count_up(number + 1)))
+        budget = Budget(seconds=0.2)
+        goal = count_up()
+        answers = list(goal.run(portfolio=[{'strategy': DEPTH_FIRST}, {'strategy': INTERLEAVE}], budget=budget))
+        self.assertGreater(len(answers), 0)
+        self.assertEqual(answers[0][guest], 0)
+        self.assertIsNotNone(goal.lastSearch.winner)
+        self.assertEqual(budget.exhausted, DEADLINE)
+
+class Test_Parallel_Kanrens(unittest.TestCase):
+    def test_ukanren_workers(self):
+        guest = ukanren.LVar()
+        goal = ukanren.Disj(ukanren.Disj(ukanren.Eq(guest, 'Hatter'), ukanren.Eq(guest, 'Hare')),
+                            ukanren.Disj(ukanren.Eq(guest, 'Dormouse'), ukanren.Eq(guest, 'Alice')))
+        result = [state[guest] for state in goal.run(strategy=DEPTH_FIRST, workers=2)]
+        self.assertCountEqual(result, ['Hatter', 'Hare', 'Dormouse', 'Alice'])
+        self.assertEqual(sum(stats.answers for stats in goal.lastSearch.stats), 4)
+
+    def test_urconstraintkanren_run_parallel(self):
+        uk = urconstraintkanren
+        def seats(first, second):
+            return uk.conj(uk.disj(uk.eq(first, 'Dee'), uk.eq(first, 'Dum')),
+                           uk.conj(uk.disj(uk.eq(second, 'Dee'), uk.eq(second, 'Dum')), uk.neq(first, second)))
+        result = list(uk.run_parallel(seats, workers=2))
+        self.assertCountEqual(result, [['Dee', 'Dum'], ['Dum', 'Dee']])
+
+    def test_ukanren_portfolio(self):
+        guest = ukanren.LVar()
+        def rabbit_hole():
+            return ukanren.Disj(ukanren.Fail(), ukanren.Fresh(lambda: rabbit_hole()))
+        goal = ukanren.Disj(rabbit_hole(), ukanren.Eq(guest, 'Alice'))
+        result = list(goal.run(results=1, portfolio=[{'strategy': DEPTH_FIRST}, {'strategy': INTERLEAVE}]))
+        self.assertEqual([state[guest] for state in result], ['Alice'])
+        self.assertEqual(goal.lastSearch.winner, 1)
+        reordered = ukanren.Disj(ukanren.Eq(guest, 'Alice'), rabbit_hole())
+        result = list(goal.run(results=1, portfolio=[{'strategy': DEPTH_FIRST, 'goal': reordered}]))
+        self.assertEqual([state[guest] for state in result], ['Alice'])
+
+    def test_urconstraintkanren_run_portfolio(self):
+        uk = urconstraintkanren
+        def rabbit_hole():
+            return uk.disj(uk.eq('down', 'up'), uk.call_fresh(lambda deeper: rabbit_hole()))
+        reordered = lambda guest: uk.disj(uk.eq(guest, 'Alice'), rabbit_hole())
+        result = list(uk.run_portfolio(lambda guest: uk.disj(rabbit_hole(), uk.eq(guest, 'Alice')),
+                                       [{'strategy': DEPTH_FIRST}, {'strategy': DEPTH_FIRST, 'f': reordered}], results=1))
+        self.assertEqual(result, [['Alice']])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os.path
+import sys
+import unittest
+from microkanren.persistent import *
+
+class Test_PMap_Fixtures(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sizes = PMap({'Alice': 'small', 'Queen': 'large'})
+
+class Test_PMap(Test_PMap_Fixtures):
+    def test_empty(self):
+        result = PMap()
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result, {})
+        self.assertNotIn('Alice', result)
+
+    def test_from_dict(self):
+        self.assertEqual(self.sizes, {'Alice': 'small', 'Queen': 'large'})
+        self.assertEqual(self.sizes['Alice'], 'small')
+        self.assertEqual(len(self.sizes), 2)
+
+    def test_set_leaves_original(self):
+        grown = self.sizes.set('Alice', 'large')
+        self.assertEqual(grown['Alice'], 'large')
+        self.assertEqual(self.sizes['Alice'], 'small')
+        self.assertEqual(len(grown), 2)
+
+    def test_set_same_value_is_same_map(self):
+        self.assertIs(self.sizes.set('Queen', 'large'), self.sizes)
+
+    def test_missing_key(self):
+        with self.assertRaises(KeyError):
+            self.sizes['Cheshire']
+        self.assertIsNone(self.sizes.get('Cheshire'))
+
+    def test_remove(self):
+        result = self.sizes.remove('Queen')
+        self.assertEqual(result, {'Alice': 'small'})
+        self.assertIs(result.remove('Queen'), result)
+        self.assertEqual(len(self.sizes), 2)
+
+    def test_merge(self):
+        result = self.sizes.merge({'Alice': 'tall', 'Dodo': 'medium'})
+        self.assertEqual(result, {'Alice': 'tall', 'Queen': 'large', 'Dodo': 'medium'})
+
+    def test_many_keys(self):
+        pmap = PMap()
+        for number in range(2000):
+            pmap = pmap.set(number, number * 2)
+        self.assertEqual(len(pmap), 2000)
+        self.assertEqual(pmap, {number: number * 2 for number in range(2000)})
+        for number in range(0, 2000, 2):
+            pmap = pmap.remove(number)
+        self.assertEqual(pmap, {number: number * 2 for number in range(1, 2000, 2)})
+
+    def test_colliding_hashes(self):
+        class Collides(object):
+            def __init__(self, name):
+                self.name = name
+            def __hash__(self):
+                return 7
+        (tweedledum, tweedledee) = (Collides('Dum'), Collides('Dee'))
+        pmap = PMap({tweedledum: 'rattle', tweedledee: 'crow', 7: 'seven'})
+        self.assertEqual(pmap[tweedledum], 'rattle')
+        self.assertEqual(pmap[tweedledee], 'crow')
+        self.assertEqual(pmap[7], 'seven')
+        self.assertEqual(pmap.remove(tweedledum), {tweedledee: 'crow', 7: 'seven'})
+
+class Test_PSet(unittest.TestCase):
+    def test_empty(self):
+        result = PSet()
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result, frozenset())
+        self.assertNotIn('Alice', result)
+
+    def test_add_leaves_original(self):
+        guests = PSet({'Hatter', 'Hare'})
+        grown = guests.add('Alice')
+        self.assertEqual(grown, {'Hatter', 'Hare', 'Alice'})
+        self.assertEqual(guests, {'Hatter', 'Hare'})
+        self.assertIs(grown.add('Alice'), grown)
+
+    def test_remove(self):
+        guests = PSet({'Hatter', 'Hare', 'Dormouse'})
+        result = guests.remove('Dormouse')
+        self.assertEqual(result, {'Hatter', 'Hare'})
+        self.assertIs(result.remove('Dormouse'), result)
+        self.assertIn('Dormouse', guests)
+
+    def test_set_operators(self):
+        guests = PSet({'Hatter', 'Hare'})
+        self.assertEqual(guests | {'Alice'}, {'Hatter', 'Hare', 'Alice'})
+        self.assertIsInstance(guests | {'Alice'}, PSet)
+        self.assertEqual(hash(guests), hash(frozenset({'Hatter', 'Hare'})))
+
+    def test_many_values(self):
+        pset = PSet()
+        for number in range(2000):
+            pset = pset.add(number)
+        self.assertEqual(pset, set(range(2000)))
+
+class Test_PVector(unittest.TestCase):
+    def test_empty(self):
+        result = PVector()
+        self.assertEqual(len(result), 0)
+        self.assertIsNone(result.get(3))
+        self.assertNotIn(3, result)
+
+    def test_set_leaves_original(self):
+        first = PVector().set(3, 'Dum')
+        second = first.set(3, 'Dee')
+        self.assertEqual(first[3], 'Dum')
+        self.assertEqual(second[3], 'Dee')
+        self.assertEqual(len(second), 1)
+
+    def test_sparse_and_ordered(self):
+        vector = PVector({5000: 'Raven', 2: 'Dee', 40: 'Dum'})
+        self.assertEqual(list(vector.items()), [(2, 'Dee'), (40, 'Dum'), (5000, 'Raven')])
+        self.assertEqual(len(vector), 3)
+        with self.assertRaises(KeyError):
+            vector[41]
+
+    def test_many_indexes(self):
+        vector = PVector()
+        for index in range(3000):
+            vector = vector.set(index, index * 2)
+        self.assertEqual(list(vector.values()), [index * 2 for index in range(3000)])
+        self.assertEqual(vector, PVector((index, index * 2) for index in range(3000)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,315 @@
+import itertools
+import threading
+import time
+import os.path
+import sys
+import unittest
+from microkanren.search import *
+
+# A very small kanren for trying out the engine on its own. States are tuples
+# of the names of the goals that have succeeded, goals are tuples of a kind and
+# what's in it.
+def succeed(name):
+    return ('leaf', name)
+
+def fail():
+    return ('leaf', None)
+
+def expand(goal, state):
+    (kind, value) = goal
+    if kind == 'conj':
+        return (CONJ, value, state)
+    elif kind == 'disj':
+        return (DISJ, value, state)
+    elif kind == 'fresh':
+        return (FRESH, value(), state)
+    elif kind == 'suspend':
+        return (LEAF, Suspension(value, state, expand), state)
+    elif value is None:
+        return (LEAF, iter([]), state)
+    else:
+        return (LEAF, iter([state + (value,)]), state)
+
+def names(goal, count=None):
+    states = Search(goal, (), expand).run()
+    return [state for (index, state) in zip(range(count or sys.maxsize), states)]
+
+class Test_Search(unittest.TestCase):
+    def test_leaf(self):
+        self.assertEqual(names(succeed('Alice')), [('Alice',)])
+        self.assertEqual(names(fail()), [])
+
+    def test_empty(self):
+        self.assertEqual(names(('conj', ())), [()])
+        self.assertEqual(names(('disj', ())), [])
+
+    def test_conj(self):
+        goal = ('conj', (succeed('Tweedledum'), succeed('Tweedledee')))
+        self.assertEqual(names(goal), [('Tweedledum', 'Tweedledee')])
+        self.assertEqual(names(('conj', (succeed('Tweedledum'), fail()))), [])
+
+    def test_disj_order(self):
+        goal = ('disj', (succeed('Walrus'), ('disj', (succeed('Carpenter'), succeed('Oyster')))))
+        self.assertEqual(names(goal), [('Walrus',), ('Carpenter',), ('Oyster',)])
+
+    def test_conj_of_disj(self):
+        goal = ('conj', (('disj', (succeed('tea'), succeed('cake'))),
+                         ('disj', (succeed('Hatter'), succeed('Hare')))))
+        self.assertEqual(names(goal), [('tea', 'Hatter'), ('tea', 'Hare'), ('cake', 'Hatter'), ('cake', 'Hare')])
+
+    def test_conj_goes_a_level_at_a_time(self):
+        goal = ('conj', (('disj', (succeed('tea'), succeed('cake'))),
+                         ('disj', (succeed('Hatter'), succeed('Hare'), succeed('Dormouse'))),
+                         ('disj', (succeed('sings'), succeed('sleeps')))))
+        self.assertEqual(names(goal), [('tea', 'Hatter', 'sings'), ('tea', 'Hatter', 'sleeps'), ('tea', 'Hare', 'sings'),
+                                       ('cake', 'Hatter', 'sings'), ('tea', 'Hare', 'sleeps'), ('cake', 'Hatter', 'sleeps'),
+                                       ('tea', 'Dormouse', 'sings'), ('cake', 'Hare', 'sings'), ('tea', 'Dormouse', 'sleeps'),
+                                       ('cake', 'Hare', 'sleeps'), ('cake', 'Dormouse', 'sings'), ('cake', 'Dormouse', 'sleeps')])
+
+    def test_infinite_stream_is_fair(self):
+        def forever(name):
+            return ('disj', (succeed(name), ('fresh', lambda: forever(name))))
+        goal = ('disj', (forever('Queen'), forever('King')))
+        self.assertEqual(names(goal, 4), [('Queen',), ('King',), ('Queen',), ('King',)])
+
+    def test_deep_recursion(self):
+        def count_down(number):
+            return succeed('Dodo') if number == 0 else ('fresh', lambda: count_down(number - 1))
+        depth = sys.getrecursionlimit() * 10
+        self.assertEqual(names(count_down(depth)), [('Dodo',)])
+
+    def test_deep_conj(self):
+        def many(number):
+            return succeed(number) if number == 0 else ('conj', (succeed(number), ('fresh', lambda: many(number - 1))))
+        depth = sys.getrecursionlimit() * 2
+        self.assertEqual(len(names(many(depth))[0]), depth + 1)
+
+    def test_suspension(self):
+        goal = ('conj', (succeed('Mock Turtle'), ('suspend', succeed('Gryphon'))))
+        self.assertEqual(names(goal), [('Mock Turtle', 'Gryphon')])
+        self.assertEqual(list(Suspension(succeed('Gryphon'), (), expand)), [('Gryphon',)])
+
+    def test_invalid_states_dropped(self):
+        goal = ('conj', (('disj', (succeed('Cheshire'), succeed('Dinah'))), succeed('grin')))
+        states = Search(goal, (), expand, valid=lambda state: 'Dinah' not in state).run()
+        self.assertEqual(list(states), [('Cheshire', 'grin')])
+
+class Test_Strategies(unittest.TestCase):
+    def strategy_names(self, goal, strategy, depth=None, count=None):
+        states = Search(goal, (), expand, strategy=strategy, depth=depth).run()
+        return [state for (index, state) in zip(range(count or sys.maxsize), states)]
+
+    def test_depth_first_order(self):
+        goal = ('conj', (('disj', (succeed('tea'), succeed('cake'))),
+                         ('disj', (succeed('Hatter'), succeed('Hare')))))
+        expected = [('tea', 'Hatter'), ('tea', 'Hare'), ('cake', 'Hatter'), ('cake', 'Hare')]
+        self.assertEqual(self.strategy_names(goal, DEPTH_FIRST), expected)
+        self.assertEqual(self.strategy_names(goal, ITERATIVE_DEEPENING), expected)
+
+    def test_depth_first_is_not_fair(self):
+        def forever(name):
+            return ('disj', (succeed(name), ('fresh', lambda: forever(name))))
+        goal = ('disj', (forever('Queen'), forever('King')))
+        self.assertEqual(self.strategy_names(goal, DEPTH_FIRST, count=3), [('Queen',)] * 3)
+
+    def test_depth_limit(self):
+        def forever(name):
+            return ('disj', (succeed(name), ('fresh', lambda: forever(name))))
+        goal = ('disj', (forever('Queen'), forever('King')))
+        self.assertEqual(self.strategy_names(goal, DEPTH_FIRST, depth=3), [('Queen',), ('King',)])
+
+    def test_iterative_deepening_finds_shallow_first(self):
+        def falls(number):
+            return succeed('Alice') if number == 0 else ('fresh', lambda: falls(number - 1))
+        def forever():
+            return ('fresh', forever)
+        goal = ('disj', (forever(), ('disj', (falls(5), succeed('Dinah')))))
+        self.assertEqual(self.strategy_names(goal, ITERATIVE_DEEPENING, count=2), [('Dinah',), ('Alice',)])
+
+    def test_iterative_deepening_stops(self):
+        goal = ('disj', (succeed('Walrus'), ('disj', (succeed('Carpenter'), succeed('Oyster')))))
+        self.assertEqual(self.strategy_names(goal, ITERATIVE_DEEPENING), [('Walrus',), ('Carpenter',), ('Oyster',)])
+        self.assertEqual(self.strategy_names(goal, ITERATIVE_DEEPENING, depth=1), [('Walrus',)])
+
+    def test_depth_first_deep_recursion(self):
+        def count_down(number):
+            return succeed('Dodo') if number == 0 else ('conj', (succeed(number), ('fresh', lambda: count_down(number - 1))))
+        depth = sys.getrecursionlimit() * 2
+        self.assertEqual(len(self.strategy_names(count_down(depth), DEPTH_FIRST)[0]), depth + 1)
+
+    def test_depth_first_suspension_and_valid(self):
+        goal = ('conj', (('disj', (succeed('Cheshire'), succeed('Dinah'))), ('suspend', succeed('grin'))))
+        states = Search(goal, (), expand, valid=lambda state: 'Dinah' not in state, strategy=DEPTH_FIRST).run()
+        self.assertEqual(list(states), [('Cheshire', 'grin')])
+
+class Test_Priority(unittest.TestCase):
+    def forever(self, name):
+        return ('disj', (succeed(name), ('fresh', lambda: self.forever(name))))
+
+    def test_shallowest_first(self):
+        def falls(number):
+            return succeed('Alice') if number == 0 else ('fresh', lambda: falls(number - 1))
+        goal = ('disj', (falls(3), succeed('Dinah')))
+        self.assertEqual(list(Search(goal, (), expand, strategy=PRIORITY).run()), [('Dinah',), ('Alice',)])
+
+    def test_complete_with_infinite_branches(self):
+        goal = ('disj', (self.forever('Queen'), self.forever('King')))
+        states = list(itertools.islice(Search(goal, (), expand, strategy=PRIORITY).run(), 6))
+        self.assertEqual(states, [('Queen',), ('King',)] * 3)
+
+    def test_endless_leaf_does_not_starve(self):
+        def endless(goal, state):
+            if goal == 'Hatter':
+                return (LEAF, itertools.repeat(state + ('tea',)), state)
+            return expand(goal, state)
+        goal = ('disj', ('Hatter', ('fresh', lambda: succeed('Alice'))))
+        states = Search(goal, (), endless, strategy=PRIORITY).run()
+        self.assertIn(('Alice',), list(itertools.islice(states, 5)))
+
+    def test_cost(self):
+        goal = ('disj', (succeed('Caterpillar'), succeed('Mouse'), succeed('Eaglet')))
+        search = Search(goal, (), expand, strategy=PRIORITY, cost=lambda state, depth: -len(state))
+        self.assertEqual(list(search.run()), [('Caterpillar',), ('Mouse',), ('Eaglet',)])
+        goal = ('conj', (('disj', (succeed('Caterpillar'), succeed('Mouse'))), ('disj', (fail(), succeed('Eaglet')))))
+        cost = lambda state, depth: 0 if 'Mouse' in state else depth
+        self.assertEqual(list(Search(goal, (), expand, strategy=PRIORITY, cost=cost).run()), [('Mouse', 'Eaglet'), ('Caterpillar', 'Eaglet')])
+
+    def test_depth_limit(self):
+        goal = ('disj', (self.forever('Queen'), self.forever('King')))
+        self.assertEqual(list(Search(goal, (), expand, strategy=PRIORITY, depth=3).run()), [('Queen',), ('King',)])
+
+    def test_no_cost_is_dropped(self):
+        goal = ('disj', (succeed('Caterpillar'), succeed('Mouse'), succeed('Eaglet')))
+        for strategy in (PRIORITY, BEST_FIRST):
+            search = Search(goal, (), expand, strategy=strategy, cost=lambda state, depth: None if depth else 0)
+            self.assertEqual(list(search.run()), [])
+            self.assertEqual(len(search.frontier), 0)
+        goal = ('disj', (self.forever('Queen'), self.forever('King')))
+        cost = lambda state, depth: None if depth > 4 else depth
+        self.assertEqual(list(Search(goal, (), expand, strategy=PRIORITY, cost=cost).run()), [('Queen',), ('King',)] * 2)
+
+    def test_best_first_chooses_at_disjunctions(self):
+        def falls(number):
+            return succeed('Alice') if number == 0 else ('fresh', lambda: falls(number - 1))
+        goal = ('disj', (falls(3), succeed('Dinah')))
+        self.assertEqual(list(Search(goal, (), expand, strategy=BEST_FIRST).run()), [('Alice',), ('Dinah',)])
+        cost = lambda state, depth: 0 if 'tarts' in state else 1
+        goal = ('conj', (('disj', (succeed('pepper'), succeed('tarts'))), ('disj', (succeed('Knave'), succeed('Queen')))))
+        states = list(Search(goal, (), expand, strategy=BEST_FIRST, cost=cost).run())
+        self.assertEqual(states[:2], [('tarts', 'Knave'), ('tarts', 'Queen')])
+
+class Test_Steal(unittest.TestCase):
+    def test_stack_gives_oldest_task(self):
+        stack = Stack()
+        stack.push(Stream(iter([]), None, 0, ('Dinah',)))
+        stack.extend([Task(('Dee',), None, None, 1), Task(('Dum',), None, None, 1)])
+        self.assertEqual(stack.steal().state, ('Dum',))
+        self.assertEqual(stack.pop().state, ('Dee',))
+        self.assertIsNone(stack.steal())
+        self.assertEqual(len(stack), 1)
+
+    def test_priority_queue_gives_a_dear_task(self):
+        queue = PriorityQueue()
+        for (name, depth) in [('Queen', 0), ('Knave', 2), ('King', 1)]:
+            queue.push(Task((name,), None, None, depth))
+        self.assertEqual(queue.steal().state, ('Knave',))
+        self.assertEqual([queue.pop().state for index in range(len(queue))], [('Queen',), ('King',)])
+        self.assertIsNone(queue.steal())
+
+class Test_Max_Streams(unittest.TestCase):
+    def test_same_answers_when_finite(self):
+        goal = ('conj', (('disj', (succeed('tea'), succeed('cake'), succeed('jam'))),
+                         ('disj', (succeed('Hatter'), succeed('Hare')))))
+        search = Search(goal, (), expand, maxStreams=1)
+        self.assertCountEqual(list(search.run()), names(goal))
+        self.assertEqual(search.stats.peak, 1)
+        self.assertEqual(search.stats.live, 0)
+        self.assertGreater(search.stats.deferred, 0)
+
+    def test_live_streams_capped(self):
+        def forever(name):
+            return ('disj', (succeed(name), ('fresh', lambda: forever(name))))
+        goal = ('conj', (forever('Queen'), forever('King')))
+        search = Search(goal, (), expand, maxStreams=3)
+        states = search.run()
+        for index in range(200):
+            next(states)
+        self.assertEqual(search.stats.peak, 3)
+        unlimited = Search(goal, (), expand)
+        states = unlimited.run()
+        for index in range(200):
+            next(states)
+        self.assertGreater(unlimited.stats.peak, 3)
+
+class Test_Budget(unittest.TestCase):
+    def forever(self, name):
+        return ('disj', (succeed(name), ('fresh', lambda: self.forever(name))))
+
+    def test_steps(self):
+        budget = Budget(steps=50)
+        states = list(Search(self.forever('Queen'), (), expand, budget=budget).run())
+        self.assertGreater(len(states), 0)
+        self.assertEqual(budget.exhausted, STEPS)
+        self.assertEqual(budget.used, 51)
+
+    def test_every_strategy(self):
+        for strategy in (INTERLEAVE, DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY, BEST_FIRST):
+            budget = Budget(steps=100)
+            goal = ('disj', (self.forever('Queen'), self.forever('King')))
+            self.assertGreater(len(list(Search(goal, (), expand, strategy=strategy, budget=budget).run())), 0)
+            self.assertEqual(budget.exhausted, STEPS)
+
+    def test_endless_leaf(self):
+        def endless(goal, state):
+            if goal == 'Hatter':
+                return (LEAF, itertools.repeat(state + ('tea',)), state)
+            return expand(goal, state)
+        budget = Budget(steps=20)
+        states = list(Search('Hatter', (), endless, strategy=DEPTH_FIRST, budget=budget).run())
+        self.assertEqual(len(states), 19)
+        self.assertEqual(budget.exhausted, STEPS)
+
+    def test_states(self):
+        def branches(number):
+            return ('disj', tuple(('fresh', lambda: branches(number + 1)) for index in range(3)))
+        budget = Budget(states=200)
+        self.assertEqual(list(Search(branches(0), (), expand, strategy=PRIORITY, budget=budget).run()), [])
+        self.assertEqual(budget.exhausted, STATES)
+
+    def test_states_never_exceeded(self):
+        def branches(number):
+            return ('disj', tuple(('fresh', lambda: branches(number + 1)) for index in range(3)))
+        for strategy in (INTERLEAVE, DEPTH_FIRST, PRIORITY, BEST_FIRST):
+            waiting = []
+            def counting(goal, state):
+                waiting.append(search.live())
+                return expand(goal, state)
+            budget = Budget(states=50)
+            goal = branches(0) if strategy != INTERLEAVE else ('conj', (self.forever('Queen'), self.forever('King')))
+            search = Search(goal, (), counting, strategy=strategy, budget=budget)
+            list(search.run())
+            self.assertEqual(budget.exhausted, STATES)
+            self.assertLessEqual(max(waiting), 50)
+
+    def test_deadline(self):
+        budget = Budget(seconds=0.1)
+        start = time.time()
+        list(Search(self.forever('Queen'), (), expand, strategy=DEPTH_FIRST, budget=budget).run())
+        self.assertEqual(budget.exhausted, DEADLINE)
+        self.assertLess(time.time() - start, 5)
+
+    def test_cancel_from_another_thread(self):
+        budget = Budget()
+        threading.Timer(0.1, budget.cancel).start()
+        states = Search(self.forever('Queen'), (), expand, budget=budget).run()
+        self.assertGreater(sum(1 for state in states), 0)
+        self.assertEqual(budget.exhausted, CANCELLED)
+
+    def test_finishing_first(self):
+        budget = Budget(steps=100, seconds=60, states=100)
+        goal = ('disj', (succeed('Dee'), succeed('Dum')))
+        self.assertEqual(list(Search(goal, (), expand, budget=budget).run()), [('Dee',), ('Dum',)])
+        self.assertIsNone(budget.exhausted)
+
+if __name__ == "__main__":
+    unittest.main()
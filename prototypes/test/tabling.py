@@ -0,0 +1,86 @@
+import os.path
+import sys
+import unittest
+from microkanren.ukanren import *
+from microkanren.tabling import *
+
+# Which rooms of the White Rabbit's house lead to which.
+doors = [('hall', 'stairs'), ('stairs', 'bedroom'), ('bedroom', 'hall'), ('bedroom', 'window'), ('garden', 'hall')]
+
+def dooro(here, there):
+    return Disj(*[Conj(Eq(here, a), Eq(there, b)) for (a, b) in doors])
+
+@tabled
+def routeo(here, there):
+    # Calls itself first, which would never stop without the table.
+    return Disj(dooro(here, there), Fresh(lambda middle: Conj(routeo(here, middle), dooro(middle, there))))
+
+@tabled
+def eveno(number):
+    return Disj(Eq(number, 0), Fresh(lambda less: Conj(oddo(less), nexto(less, number))))
+
+@tabled
+def oddo(number):
+    return Fresh(lambda less: Conj(eveno(less), nexto(less, number)))
+
+def nexto(less, more):
+    return Disj(*[Conj(Eq(less, number), Eq(more, number + 1)) for number in range(7)])
+
+@tabled
+def twino(dee, dum):
+    return Eq(dee, dum)
+
+class Test_Tabling(unittest.TestCase):
+    def setUp(self):
+        for relation in (routeo, eveno, oddo, twino):
+            relation.tables.clear()
+        (self.here, self.there) = (LVar('here'), LVar('there'))
+
+    def test_left_recursion_with_cycles(self):
+        result = {state[self.there] for state in routeo('hall', self.there).run()}
+        self.assertEqual(result, {'hall', 'stairs', 'bedroom', 'window'})
+        result = {(state[self.here], state[self.there]) for state in routeo(self.here, self.there).run()}
+        self.assertEqual(len(result), 16)
+        self.assertNotIn(('window', 'hall'), result)
+
+    def test_same_answers_with_any_strategy(self):
+        expected = {'hall', 'stairs', 'bedroom', 'window'}
+        for strategy in (INTERLEAVE, DEPTH_FIRST, PRIORITY):
+            routeo.tables.clear()
+            self.assertEqual({state[self.there] for state in routeo('garden', self.there).run(strategy=strategy)}, expected)
+
+    def test_tables_are_reused(self):
+        list(routeo('hall', self.there).run())
+        runs = routeo.tables.stats.runs
+        result = list(routeo('hall', LVar('elsewhere')).run())
+        self.assertEqual(len(result), 4)
+        self.assertEqual(routeo.tables.stats.runs, runs)
+        self.assertEqual(routeo.tables.stats.hits, 1)
+        self.assertEqual(routeo.tables.stats.tables, 1)
+        self.assertGreater(routeo.tables.stats.hitRate(), 0)
+
+    def test_variants(self):
+        list(routeo(self.here, self.there).run())
+        list(routeo(LVar(), LVar()).run())
+        self.assertEqual(routeo.tables.stats.tables, 1)
+        result = {state[self.here] for state in routeo(self.here, self.here).run()}
+        self.assertEqual(result, {'hall', 'stairs', 'bedroom'})
+        self.assertEqual(routeo.tables.stats.tables, 2)
+
+    def test_mutual_recursion(self):
+        self.assertEqual(sorted(state[self.here] for state in eveno(self.here).run()), [0, 2, 4, 6])
+        self.assertEqual(sorted(state[self.here] for state in oddo(self.here).run()), [1, 3, 5, 7])
+        self.assertEqual([state[self.here] for state in eveno(5).run()], [])
+
+    def test_answers_with_variables(self):
+        result = list(twino(self.here, [self.there, 'rattle']).run())
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0][self.here], [result[0][self.there], 'rattle'])
+        self.assertTrue(varq(result[0][self.there]))
+
+    def test_unhashable_arguments(self):
+        with self.assertRaises(TypeError):
+            list(twino({'drink me'}, self.there).run())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -75,6 +75,61 @@ class Test_State(Test_Fixtures):
         self.assertFalse(newState.valid)
         self.assertEqual(str(newState), "State Invalid")
 
+class Test_State_Aliases(Test_Fixtures):
+    def test_alias_same_rank_left_to_right(self):
+        (rose, tulip) = lvars(2)
+        newState = State().alias(rose, tulip)
+        self.assertEqual(newState.substitution, {rose: tulip})
+
+    def test_alias_keeps_chains_short(self):
+        flowers = lvars(200)
+        newState = State()
+        for (flower, nextFlower) in zip(flowers, flowers[1:]):
+            newState = list(Eq(flower, nextFlower).run(newState))[0]
+        deepest = 0
+        for flower in flowers:
+            depth = 0
+            while varq(newState.substitution.get(flower)):
+                flower = newState.substitution[flower]
+                depth += 1
+            deepest = max(depth, deepest)
+        self.assertLessEqual(deepest, 1)
+
+    def test_walk_compresses_without_changing_substitution(self):
+        (rose, tulip, daisy) = lvars(3)
+        newState = State({rose: tulip, tulip: daisy, daisy: 'red'})
+        self.assertEqual(newState.walk(rose), 'red')
+        self.assertEqual(newState.substitution, {rose: tulip, tulip: daisy, daisy: 'red'})
+        self.assertEqual(newState.ext_s({self.var1: 'white'})[rose], 'red')
+
+class Test_State_Memo(Test_Fixtures):
+    def test_off_by_default(self):
+        self.assertIsNone(State().memoStats)
+
+    def test_counts_hits(self):
+        newState = State({self.var1: 'Alice'}, memoize=True)
+        party = [self.var1, 'Dinah']
+        self.assertEqual(newState.reify(party), ['Alice', 'Dinah'])
+        self.assertEqual(newState.reify(party), ['Alice', 'Dinah'])
+        self.assertEqual(newState.memoStats.hits, 1)
+
+    def test_derived_state_sees_new_bindings(self):
+        (cat, mouse) = lvars(2)
+        newState = State(memoize=True)
+        party = [cat, mouse]
+        self.assertEqual(newState.reify(party), [cat, mouse])
+        withCat = newState.ext_s({cat: 'Dinah'})
+        self.assertEqual(withCat.reify(party), ['Dinah', mouse])
+        self.assertIs(withCat.memoStats, newState.memoStats)
+
+    def test_ground_results_are_inherited(self):
+        newState = State({self.var1: 'Alice'}, memoize=True)
+        party = [self.var1, 'Dinah']
+        newState.reify(party)
+        hits = newState.memoStats.hits
+        self.assertEqual(newState.ext_s({self.var2: 'Dinah'}).reify(party), ['Alice', 'Dinah'])
+        self.assertEqual(newState.memoStats.hits, hits + 1)
+
 class Test_Fail(Test_Fixtures):
     def test_valid_state_fails(self):
         newState = State()
@@ -316,6 +371,112 @@ class Test_Goal(Test_Fixtures):
         self.assertEqual(len(hasTea), 1)
         self.assertEqual(len(hasCake), 1)
 
+class Test_Goal_Strategies(Test_Fixtures):
+    def seats(self, strategy, depth=None):
+        guests = Fresh(lambda first, second: Conj(
+            Disj(Eq(first, 'Mad Hatter'), Eq(first, 'March Hare')),
+            Disj(Eq(second, 'The Dormouse'), Eq(second, 'Alice')),
+            Eq([first, second], self.var1)))
+        return [st[self.var1] for st in guests.run(strategy=strategy, depth=depth)]
+
+    def test_same_answers(self):
+        expected = [['Mad Hatter', 'The Dormouse'], ['Mad Hatter', 'Alice'], ['March Hare', 'The Dormouse'], ['March Hare', 'Alice']]
+        self.assertEqual(self.seats(DEPTH_FIRST), expected)
+        self.assertEqual(self.seats(ITERATIVE_DEEPENING), expected)
+        self.assertCountEqual(self.seats(INTERLEAVE), expected)
+
+    def test_priority(self):
+        expected = [['Mad Hatter', 'The Dormouse'], ['Mad Hatter', 'Alice'], ['March Hare', 'The Dormouse'], ['March Hare', 'Alice']]
+        self.assertCountEqual(self.seats(PRIORITY), expected)
+        goal = Conj(Disj(Eq(self.var1, 'Dee'), Eq(self.var1, 'Dum')), Disj(Eq(self.var2, 'rattle'), Eq(self.var2, 'crow')))
+        result = list(goal.run(strategy=PRIORITY, cost=lambda state, depth: 0 if state[self.var1] == 'Dum' else depth))
+        self.assertEqual([(st[self.var1], st[self.var2]) for st in result], [('Dum', 'rattle'), ('Dum', 'crow'), ('Dee', 'rattle'), ('Dee', 'crow')])
+
+    def test_depth_limit(self):
+        self.assertEqual(self.seats(DEPTH_FIRST, 2), [])
+        self.assertEqual(len(self.seats(DEPTH_FIRST, 3)), 4)
+
+    def test_answers_are_states(self):
+        result = list(Disj(Eq(self.var1, 'Dee'), Eq(self.var1, 'Dum')).run(strategy=DEPTH_FIRST))
+        self.assertEqual(result, [State({self.var1: 'Dee'}), State({self.var1: 'Dum'})])
+
+    def test_unused_options(self):
+        goal = Disj(Eq(self.var1, 'Dee'), Eq(self.var1, 'Dum'))
+        for strategy in (DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY):
+            self.assertRaises(ValueError, list, goal.run(strategy=strategy, maxStreams=2))
+        for strategy in (INTERLEAVE, DEPTH_FIRST, ITERATIVE_DEEPENING):
+            self.assertRaises(ValueError, list, goal.run(strategy=strategy, cost=lambda state, depth: depth))
+        self.assertRaises(ValueError, list, goal.run(maxStreams=2, workers=2))
+
+    def test_max_streams(self):
+        def count_up(x, number=0):
+            return Disj(Eq(x, number), Fresh(lambda: count_up(x, number + 1)))
+        goal = Conj(count_up(self.var1), Disj(Eq(self.var2, 'Dee'), Eq(self.var2, 'Dum')))
+        result = list(goal.run(results=50, maxStreams=2))
+        self.assertEqual(len(result), 50)
+        self.assertLessEqual(goal.lastSearch.stats.peak, 2)
+
+class Test_Goal_Budget(Test_Fixtures):
+    def count_up(self, number=0):
+        return Disj(Eq(self.var1, number), Fresh(lambda: self.count_up(number + 1)))
+
+    def test_partial_results(self):
+        for strategy in (INTERLEAVE, DEPTH_FIRST, ITERATIVE_DEEPENING, PRIORITY):
+            budget = Budget(steps=200)
+            result = [state[self.var1] for state in self.count_up().run(strategy=strategy, budget=budget)]
+            self.assertGreater(len(result), 0)
+            self.assertEqual(result[0], 0)
+            self.assertEqual(budget.exhausted, STEPS)
+
+    def test_endless_relation(self):
+        class countingo(Relation):
+            def __init__(self, x):
+                super().__init__()
+                self.x = x
+            def __run__(self, state):
+                number = 0
+                while True:
+                    yield from Eq(self.x, number).run(state)
+                    number += 1
+        for strategy in (INTERLEAVE, DEPTH_FIRST):
+            budget = Budget(steps=100)
+            self.assertGreater(len(list(countingo(self.var1).run(strategy=strategy, budget=budget))), 0)
+            self.assertEqual(budget.exhausted, STEPS)
+
+    def test_within_budget(self):
+        budget = Budget(steps=100)
+        self.assertEqual(len(list(Disj(Eq(self.var1, 'Dee'), Eq(self.var1, 'Dum')).run(strategy=DEPTH_FIRST, budget=budget))), 2)
+        self.assertIsNone(budget.exhausted)
+
+class Test_Trail(Test_Fixtures):
+    def test_bind_and_undo(self):
+        trail = Trail(State({self.var2: 'Raven'}))
+        mark = trail.mark()
+        self.assertTrue(trail.unify([self.var1, 'Dum'], ['Dee', 'Dum']))
+        self.assertEqual(trail.snapshot(), State({self.var1: 'Dee', self.var2: 'Raven'}))
+        trail.undo(mark)
+        self.assertEqual(trail.snapshot(), State({self.var2: 'Raven'}))
+
+    def test_failure_binds_nothing(self):
+        trail = Trail(State())
+        self.assertFalse(trail.unify([self.var1, 'Dee'], ['Dum', 'Raven']))
+        self.assertEqual(trail.snapshot(), State())
+
+    def test_leaves_collections_to_eq(self):
+        trail = Trail(State())
+        self.assertIsNone(trail.unify(self.changes, {self.var1: 'smaller', 'eat me': 'bigger'}))
+        result = list(Eq({self.var1: 'smaller', 'eat me': 'bigger'}, self.changes).run(strategy=DEPTH_FIRST))
+        self.assertEqual(result, [State({self.var1: 'drink me'})])
+
+    def test_other_goals_on_snapshots(self):
+        goal = Conj(Eq(self.var1, 'Walrus'), Succeed(), Disj(Fail(), Eq(self.var2, 'Carpenter')))
+        self.assertEqual(list(goal.run(strategy=DEPTH_FIRST)), [State({self.var1: 'Walrus', self.var2: 'Carpenter'})])
+
+    def test_deep_recursion(self):
+        def count_down(number, x):
+            return Eq(x, 'Dodo') if number == 0 else Fresh(lambda y: Conj(Eq(x, y), count_down(number - 1, y)))
+        result = list(count_down(sys.getrecursionlimit() * 2, self.var1).run(strategy=DEPTH_FIRST))
+        self.assertEqual(result[0][self.var1], 'Dodo')
 
 if __name__ == "__main__":
     print("This test suite depends on macros to execute, so can't be")
@@ -44,6 +44,123 @@ class Test_Link(Test_Link_Fixtures):
     def test_empty_link_is_none(self):
         self.assertTrue(Link() == ())
 
+class Test_Link_Long(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.length = sys.getrecursionlimit() * 20
+        cls.bottle = var(cls.length, "bottle")
+        cls.drink_me = list_to_links(list(range(cls.length)))
+        cls.unlabeled = list_to_links(list(range(cls.length - 1)) + [cls.bottle])
+
+    def test_equal(self):
+        self.assertEqual(self.drink_me, list_to_links(list(range(self.length))))
+        self.assertNotEqual(self.drink_me, self.unlabeled)
+        self.assertEqual(hash(self.unlabeled), hash(self.unlabeled))
+
+    def test_contains(self):
+        self.assertIn(self.length - 1, self.drink_me)
+        self.assertNotIn(self.length, self.drink_me)
+
+    def test_repr(self):
+        self.assertTrue(repr(self.drink_me).endswith(" %i)" % (self.length - 1)))
+
+    def test_unify_and_deep_walk(self):
+        substitution = unify(self.unlabeled, self.drink_me, Substitution())
+        self.assertEqual(walk(self.bottle, substitution), self.length - 1)
+        walked = deep_walk(self.unlabeled, substitution)
+        self.assertEqual(walked, self.drink_me)
+        self.assertIs(walked.interned(), self.drink_me.interned())
+
+    def test_nested(self):
+        nested = list_to_links([[1, [2, []]], 3])
+        self.assertEqual(nested, Link(Link(1, Link(Link(2, Link(Link())))), Link(3)))
+
+class Test_Link_Interning(Test_Link_Fixtures):
+    def test_ground_lists_are_shared(self):
+        racers = list_to_links(["Dodo", "Mouse", "Duck"])
+        self.assertIsNot(racers, self.caucus_racers)
+        self.assertEqual(racers, self.caucus_racers)
+        self.assertIs(racers.interned(), self.caucus_racers.interned())
+        self.assertIs(racers.tail.interned(), self.caucus_racers.tail.interned())
+        self.assertIs(Link(), Link())
+
+    def test_interned_when_compared(self):
+        racers = list_to_links(["Lory", "Eaglet"])
+        again = list_to_links(["Lory", "Eaglet"])
+        self.assertEqual(racers, again)
+        self.assertIs(racers.interned(), again.interned())
+        self.assertNotEqual(racers, list_to_links(["Lory", "Duck"]))
+
+    def test_unground_lists_are_not_shared(self):
+        racer = LogicVariable(0, "racer")
+        first = Link("Dodo", Link(racer))
+        second = Link("Dodo", Link(racer))
+        self.assertIsNot(first, second)
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, self.caucus_racers)
+
+    def test_equal_values_of_different_types(self):
+        self.assertIsNot(Link(1), Link(True))
+        self.assertIsNot(Link(1).interned(), Link(True).interned())
+        self.assertEqual(Link(1), Link(1.0))
+        self.assertNotEqual(Link(1), Link(2.0))
+
+    def test_unhashable_values(self):
+        first = Link(["Dodo"])
+        self.assertEqual(first, Link(["Dodo"]))
+        self.assertIsNot(first, Link(["Dodo"]))
+
+    def test_pickled_lists_are_interned(self):
+        import pickle
+        loaded = pickle.loads(pickle.dumps(self.tea_partiers))
+        self.assertEqual(loaded, self.tea_partiers)
+        self.assertIs(loaded.interned(), self.tea_partiers.interned())
+        self.assertIs(pickle.loads(pickle.dumps(Link())), Link())
+
+class Test_Chunk(Test_Link_Fixtures):
+    def test_same_as_links(self):
+        racers = list_to_chunk(["Dodo", "Mouse", "Duck"])
+        self.assertIsInstance(racers, Chunk)
+        self.assertEqual(racers, self.caucus_racers)
+        self.assertEqual(self.caucus_racers, racers)
+        self.assertEqual(hash(racers), hash(self.caucus_racers))
+        self.assertEqual(str(racers), "('Dodo' 'Mouse' 'Duck')")
+        self.assertNotEqual(racers, self.tea_partiers)
+
+    def test_empty(self):
+        self.assertIs(list_to_chunk([]), Link())
+        self.assertEqual(list_to_chunk([], var(0)), var(0))
+
+    def test_tail(self):
+        racers = list_to_chunk(["Dodo", "Mouse", "Duck"])
+        self.assertEqual(racers.head, "Dodo")
+        self.assertEqual(racers.tail, Link("Mouse", Link("Duck")))
+        self.assertEqual(racers.tail.tail.tail, ())
+        self.assertIn("Duck", racers)
+
+    def test_known(self):
+        racers = list_to_chunk(["Dodo", "Mouse", "Duck"], var(0, "more"))
+        self.assertEqual(racers.known_length(), 3)
+        self.assertEqual(racers.tail.known_length(), 2)
+        self.assertEqual(racers.tail.known(1), "Duck")
+        self.assertEqual(racers.rest, var(0, "more"))
+        self.assertEqual(str(racers), "('Dodo' 'Mouse' 'Duck' . var(0, 'more'))")
+
+    def test_unify_and_deep_walk(self):
+        more = var(0, "more")
+        racers = list_to_chunk(["Dodo", "Mouse"], more)
+        substitution = unify(racers, self.caucus_racers, Substitution())
+        self.assertEqual(walk(more, substitution), Link("Duck"))
+        self.assertEqual(deep_walk(racers, substitution), self.caucus_racers)
+
+    def test_nested(self):
+        self.assertEqual(list_to_chunk([["Dodo", "Mouse", "Duck"]]), Link(self.caucus_racers))
+
+    def test_pickle(self):
+        import pickle
+        racers = list_to_chunk(["Dodo", "Mouse", "Duck"])
+        self.assertEqual(pickle.loads(pickle.dumps(racers.tail)), Link("Mouse", Link("Duck")))
+
 class Test_LogicVariable_Fixtures(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -124,6 +241,59 @@ class Test_Walk(Test_State_Fixtures):
         result = walk(var(1), self.with_one.constraints["eq"])
         self.assertEqual(result, var(1))
 
+class Test_Substitution(Test_State_Fixtures):
+    def test_reads_as_set(self):
+        substitution = self.with_two.constraints["eq"]
+        self.assertIsInstance(substitution, Substitution)
+        self.assertEqual(substitution, {(var(0), 'Dum'), (var(1), 'Dee')})
+        self.assertEqual({(var(0), 'Dum'), (var(1), 'Dee')}, substitution)
+        self.assertIn((var(1), 'Dee'), substitution)
+        self.assertNotIn((var(1), 'Dum'), substitution)
+        self.assertEqual(len(substitution), 2)
+
+    def test_lookup(self):
+        substitution = self.alice_linked.constraints["eq"]
+        self.assertEqual(substitution.lookup(var(1)), var(0))
+        self.assertEqual(substitution.lookup(var(2)), var(2))
+
+    def test_ext_leaves_original(self):
+        substitution = self.with_one.constraints["eq"]
+        extended = substitution.ext(var(1), 'Dee')
+        self.assertEqual(extended, self.with_two.constraints["eq"])
+        self.assertEqual(substitution, {(var(0), 'Dum')})
+
+    def test_one_value_per_variable(self):
+        with self.assertRaises(AssertionError):
+            Substitution({(var(0), 'Dum'), (var(0), 'Dee')})
+
+    def test_alias_by_rank(self):
+        substitution = unify(var(0), var(1), Substitution())
+        self.assertEqual(substitution, {(var(0), var(1))})
+        substitution = unify(var(2), var(0), substitution)
+        self.assertEqual(substitution, {(var(0), var(1)), (var(2), var(1))})
+
+    def test_walk_long_chain(self):
+        substitution = Substitution([(var(n), var(n + 1)) for n in range(5000)] + [(var(5000), 'Alice')])
+        self.assertEqual(walk(var(0), substitution), 'Alice')
+
+class Test_DenseSubstitution(Test_State_Fixtures):
+    def test_same_as_substitution(self):
+        dense = DenseSubstitution({(var(0), 'Dum'), (var(1), 'Dee')})
+        self.assertEqual(dense, self.with_two.constraints["eq"])
+        self.assertEqual(walk(var(1), dense), 'Dee')
+
+    def test_stays_dense(self):
+        dense = ext_s(var(1), 'Dee', DenseSubstitution())
+        self.assertIsInstance(dense, DenseSubstitution)
+        self.assertIsInstance(dense | {(var(2), 'Raven')}, DenseSubstitution)
+
+    def test_selected_by_start_state(self):
+        start = State({"eq": DenseSubstitution()})
+        states = list(call_fresh(lambda rattle: eq(rattle, 'old'))(start))
+        self.assertEqual(len(states), 1)
+        self.assertIsInstance(states[0].constraints["eq"], DenseSubstitution)
+        self.assertEqual(states[0].constraints["eq"], {(var(0), 'old')})
+
 class Test_ext_s(Test_State_Fixtures):
     def test_extend_substitution(self):
         substitution_with_dee = ext_s(var(1), 'Dee', self.with_one.constraints["eq"])
@@ -328,6 +498,24 @@ class Test_call_fresh_Fixtures(unittest.TestCase):
         cls.spoilt = State({"eq": {(var(0, 'rattle'), 'old')}}, {"eq":eq}, 1)
 
 class Test_call_fresh(Test_call_fresh_Fixtures):
+    def test_deep_recursion(self):
+        def count_down(rattle, number):
+            if number == 0:
+                return eq(rattle, 'old')
+            return call_fresh(lambda crow: conj(eq(crow, rattle), count_down(crow, number - 1)))
+        states = list(call_fresh(lambda rattle: count_down(rattle, sys.getrecursionlimit() * 2))(self.empty))
+        self.assertEqual(len(states), 1)
+        self.assertEqual(walk(var(0), states[0].constraints["eq"]), 'old')
+
+    def test_budget(self):
+        def count_up(rattle, number=0):
+            return disj(eq(rattle, number), call_fresh(lambda crow: count_up(rattle, number + 1)))
+        for strategy in (INTERLEAVE, DEPTH_FIRST):
+            budget = Budget(steps=100)
+            states = list(call(lambda rattle: count_up(rattle), strategy, budget=budget)(self.empty))
+            self.assertGreater(len(states), 0)
+            self.assertEqual(budget.exhausted, STEPS)
+
     def test_successful(self):
         states = list(call_fresh(lambda rattle: eq(rattle, 'old'))(self.empty))
         self.assertEqual(len(states), 1)
@@ -353,6 +541,48 @@ class Test_neq(Test_State_Fixtures):
         states = list(call_fresh(lambda rattle: conj(neq(rattle, 'new'), eq(rattle, 'new')))(self.empty))
         self.assertEqual(len(states), 0)
 
+    def test_normalized(self):
+        rattle = var(0, 'rattle')
+        states = list(neq(list_to_links([rattle, 'crow']), list_to_links(['new', 'crow']))(State({}, {}, 1)))
+        self.assertEqual(len(states), 1)
+        self.assertEqual(states[0].constraints['neq'], {(rattle, 'new')})
+
+    def test_never_equal(self):
+        states = list(neq(list_to_links(['old', 'crow']), list_to_links(['new', 'crow']))(self.empty))
+        self.assertEqual(len(states), 1)
+        self.assertNotIn('neq', states[0].constraints)
+
+    def test_list_fails(self):
+        states = list(call(lambda rattle: conj(neq(list_to_links([rattle, 'crow']), list_to_links(['new', 'crow'])),
+                                               eq(rattle, 'new')))(self.empty))
+        self.assertEqual(len(states), 0)
+
+    def test_dropped_when_met(self):
+        states = list(call(lambda rattle: conj(neq(rattle, 'new'), eq(rattle, 'old')))(self.empty))
+        self.assertEqual(len(states), 1)
+        self.assertEqual(states[0].constraints['neq'], frozenset())
+
+    def test_narrowed(self):
+        (dum, dee) = (var(0, 'dum'), var(1, 'dee'))
+        boys = neq(list_to_links([dum, dee]), list_to_links(['rattle', 'crow']))
+        self.assertEqual(list(call(lambda: conj(boys, conj(eq(dum, 'rattle'), eq(dee, 'crow'))))(State({}, {}, 2))), [])
+        states = list(call(lambda: conj(boys, eq(dum, 'rattle')))(State({}, {}, 2)))
+        self.assertEqual(len(states), 1)
+        self.assertEqual(states[0].constraints['neq'], {(dee, 'crow')})
+        states = list(call(lambda: conj(boys, conj(eq(dum, 'rattle'), eq(dee, 'shawl'))))(State({}, {}, 2)))
+        self.assertEqual(len(states), 1)
+        self.assertEqual(states[0].constraints['neq'], frozenset())
+
+    def test_shares_store(self):
+        (rattle, shawl) = (var(0, 'rattle'), var(1, 'shawl'))
+        first = next(iter(neq(rattle, 'new')(State({}, {}, 2))))
+        second = next(iter(neq(shawl, 'old')(first)))
+        self.assertEqual(first.constraints['neq'], {(rattle, 'new')})
+        self.assertEqual(second.constraints['neq'], {(rattle, 'new'), (shawl, 'old')})
+        self.assertIs(second.constraintFunctions, first.constraintFunctions)
+        third = State(second.constraints, second.constraintFunctions, 3, second.id, second.watchers, second.woken)
+        self.assertIs(third.constraints, second.constraints)
+
     def test_valid_eq_same_var(self):
         states = list(call_fresh(lambda rattle: conj(neq(rattle, 'new'), eq(rattle, 'old')))(self.empty))
         self.assertEqual(len(states), 1)
@@ -390,6 +620,17 @@ class Test_absento(Test_State_Fixtures):
         states = list(call_fresh(lambda boys: conj(absento('raven', boys), eq(lst, boys)))(self.empty))
         self.assertEqual(len(states), 1)
 
+    def test_nothing_left_once_met(self):
+        lst = list_to_links(['dum', 'dee'])
+        states = list(call(lambda boys: conj(absento('raven', boys), eq(lst, boys)))(self.empty))
+        self.assertEqual(len(states), 1)
+        self.assertEqual(states[0].constraints['neq'], frozenset())
+
+    def test_fail_list_eq_applied(self):
+        lst = list_to_links(['dum', 'dee'])
+        states = list(call(lambda boys: conj(absento('dee', boys), eq(lst, boys)))(self.empty))
+        self.assertEqual(len(states), 0)
+
 class Test_trace(Test_State_Fixtures):
     def test_trace(self):
         (log, logFun) = logger()
@@ -445,6 +686,86 @@ class Test_between_all(Test_State_Fixtures):
         states = list(call_fresh(lambda elem: between_all(list_to_links([2, elem, 3]), eq))(State()))
         self.assertEqual(len(states), 0)
 
+class Notebook(object):
+    """Where the Dormouse writes down who it's been woken for."""
+    def __init__(self):
+        self.woken = []
+
+def dozes(value, notebook):
+    """A constraint that just notes each time it's checked."""
+    def dozes_help(state):
+        notebook.woken.append(value)
+        value_ = walk(value, state.constraints.get("eq", frozenset()))
+        return make_constraint(state, False, dozes, value_, notebook) if varq(value_) else unit(state)
+    return generate(dozes_help)
+
+class Test_applyConstraints(Test_State_Fixtures):
+    def test_only_wakes_watchers(self):
+        notebook = Notebook()
+        (hatter, hare) = (var(0, 'hatter'), var(1, 'hare'))
+        state = next(iter(conj(dozes(hatter, notebook), dozes(hare, notebook))(State({}, {}, 2))))
+        notebook.woken = []
+        state = next(iter(eq(hatter, 'tea')(state)))
+        self.assertEqual(state.woken, {hatter.id})
+        states = list(applyConstraints(state))
+        self.assertEqual(len(states), 1)
+        self.assertEqual(notebook.woken, [hatter])
+        self.assertEqual(states[0].woken, frozenset())
+        notebook.woken = []
+        self.assertEqual(list(applyConstraints(states[0])), states)
+        self.assertEqual(notebook.woken, [])
+
+    def test_follows_aliases(self):
+        notebook = Notebook()
+        (hatter, hare) = (var(0, 'hatter'), var(1, 'hare'))
+        state = next(iter(dozes(hatter, notebook)(State({}, {}, 2))))
+        state = next(applyConstraints(next(iter(eq(hatter, hare)(state)))))
+        notebook.woken = []
+        state = next(iter(eq(hare, 'tea')(state)))
+        list(applyConstraints(state))
+        self.assertEqual(len(notebook.woken), 1)
+
+    def test_wakes_inside_lists(self):
+        (rest, other) = (var(0, 'rest'), var(1, 'other'))
+        state = next(iter(between_all(Link(2, rest), eq)(State({}, {}, 2))))
+        self.assertEqual(list(applyConstraints(next(iter(eq(rest, Link(3))(state))))), [])
+        self.assertEqual(len(list(applyConstraints(next(iter(eq(rest, Link(2))(state)))))), 1)
+        self.assertEqual(next(iter(eq(other, 3)(state))).woken, frozenset())
+
+    def test_state_without_watchers(self):
+        spoilt = State({"eq": {(var(0, 'rattle'), 'new')}, "neq": {(var(0, 'rattle'), 'new')}},
+                       {"eq": eq, "neq": neq}, 1)
+        self.assertEqual(list(applyConstraints(spoilt)), [])
+
+    def test_propagation(self):
+        stats = PropagationStats()
+        states = list(call(lambda lst, elem: conj(between_all(lst, eq),
+                                                  conj(neq(elem, 3), eq(lst, list_to_links([2, elem])))),
+                           propagation=stats)(State()))
+        self.assertEqual(len(states), 1)
+        self.assertEqual(deep_walk(var(1, 'elem'), states[0].constraints['eq']), 2)
+        # Checking between_all wakes up neq.
+        self.assertEqual((stats.answers, stats.rounds), (1, 2))
+        self.assertEqual(stats.roundsPerAnswer(), 2.0)
+
+    def test_propagation_fails(self):
+        stats = PropagationStats()
+        states = list(call(lambda lst, elem: conj(between_all(lst, eq),
+                                                  conj(neq(elem, 2), eq(lst, list_to_links([2, elem])))),
+                           propagation=stats)(State()))
+        self.assertEqual(states, [])
+        self.assertEqual((stats.answers, stats.rounds), (0, 2))
+
+    def test_many_constraints(self):
+        boys = [var(number) for number in range(200)]
+        state = State({}, {}, len(boys))
+        for boy in boys:
+            state = next(iter(neq(boy, 'Raven')(state)))
+        state = next(iter(eq(boys[0], 'Dum')(state)))
+        self.assertEqual(len(state.woken), 1)
+        self.assertEqual(len(list(applyConstraints(state))), 1)
+        self.assertEqual(list(applyConstraints(next(iter(eq(boys[1], 'Raven')(state))))), [])
+
 
 if __name__ == "__main__":
     print("This test suite depends on macros to execute, so can't be")
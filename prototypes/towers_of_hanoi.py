@@ -1,39 +1,20 @@
 from microkanren.urconstraintkanren import *
-
-def deep_walk(term, substitution):
-    value = walk(term, substitution)
-    if isinstance(value, Link):
-        if value.is_empty():
-            return value
-        else:
-            return Link(deep_walk(value.head, substitution),
-                        deep_walk(value.tail, substitution))
-    else:
-        return value
+from microkanren.ordering import lt, gt, le
 
 def call_fresh_x(f):
     """Takes a *-arity function which returns a list of states.  It assigns the
     given argument an unassigned term.  It then returns a function that takes a
     state and returns a list of states."""
-    def call_fresh_help(state):
-        c = state.count
-        params = signature(f).parameters
-        arg_count = len(params)
-        new_c = c + arg_count
-        ids_and_params = zip(range(c, new_c), params)
-        new_vars = [var(number, name) for (number, name) in ids_and_params]
-        fun = f(*new_vars)
-        newState = State(state.constraints, state.constraintFunctions, new_c, state.id)
-        succeeds = False
-        for state_ in fun(newState):
-            succeeds = True
-            yield state_
-    return generate(call_fresh_help)
+    return connective(FRESH, f)
 
-def run_x(f):
+def run_x(f, strategy=INTERLEAVE, depth=None, cost=None, heuristic=None, budget=None):
     """Takes a *-arity function which returns a list of states.  It assigns the
     given argument an unassigned term.  It then returns a function that takes a
-    state and returns a list of states."""
+    state and returns a list of states.  `strategy`, `depth` and `cost` choose
+    how the states are searched for, as for `call`.  Instead of `cost`, a
+    `heuristic` can be given, which is handed the same terms as `f` and returns
+    the cost, so the cost can look at what they've been bound to.  A `budget`
+    stops the search early, as for `call`."""
     def call_fresh_help(state):
         c = state.count
         params = signature(f).parameters
@@ -42,8 +23,9 @@ def run_x(f):
         ids_and_params = zip(range(c, new_c), params)
         new_vars = [var(number, name) for (number, name) in ids_and_params]
         fun = f(*new_vars)
-        newState = State(state.constraints, state.constraintFunctions, new_c, state.id)
-        state_generator = call(fun)(newState)
+        newState = State(state.constraints, state.constraintFunctions, new_c, state.id, state.watchers, state.woken)
+        search_cost = cost if heuristic is None else heuristic(*new_vars)
+        state_generator = call(lambda: fun, strategy, depth, search_cost, budget)(newState)
         succeeds = False
         for gen_state in state_generator:
             succeeds = True
@@ -82,87 +64,6 @@ def conso(head, tail, lst):
     else:
         return (lambda state: mzero)
 
-def lt(less, more):
-    def ltWalk(term, lessThans):
-        """Given a term and a set of lessThan constraints, returns the highest known
-        literal that is still less than the term and a list of variable terms that are
-        also less than term."""
-        assert varq(term), "Can't walk a non-variable."
-        terms = set([term])
-        checkedTerms = set()
-        mostPlus = 1 # When calculating how much more anything else must be to
-                     #  be valid, each iteration deeper we go in terms, then the
-                     #  amount added must be one larger too.
-        while terms:
-            newTerms = {lesser if varq(lesser) else lesser + mostPlus for
-                        (lesser, greater) in lessThans if greater in terms}
-            checkedTerms = checkedTerms | terms
-            terms = newTerms
-            mostPlus += 1
-        literals = {literal for literal in checkedTerms if not varq(literal)}
-        terms = {term for term in checkedTerms if varq(term)}
-        # You want the maximum literal value because any value that is more than
-        #  term must by definition be larger than the highest number it could be
-        #  greater than plus one.
-        mostLiteral = max(literals) if literals else None
-        return (mostLiteral, terms)
-
-    def mtWalk(term, lessThans):
-        """Given a term and a set of lessThan constraints, returns the lowest known
-        literal that is still more than the term and a list of variable terms that are
-        also more than term."""
-        assert varq(term), "Can't walk a non-variable."
-        terms = set([term])
-        checkedTerms = set()
-        leastMinus = 1
-        while terms:
-            newTerms = {greater if varq(greater) else greater - leastMinus for
-                        (lesser, greater) in lessThans if lesser in terms}
-            checkedTerms = checkedTerms | terms
-            terms = newTerms
-            leastMinus += 1
-        literals = {literal for literal in checkedTerms if not varq(literal)}
-        terms = {term for term in checkedTerms if varq(term)}
-        # See above for why least
-        leastLiteral = min(literals) if literals else None
-        return (leastLiteral, terms)
-
-    def ltHelp(state):
-        substitution = state.constraints.get("eq", frozenset())
-        lessValue = walk(less, substitution)
-        moreValue = walk(more, substitution)
-        if not(varq(lessValue) or varq(moreValue)):
-            if lessValue < moreValue:
-                return state
-            else:
-                return mzero
-        lessThans = state.constraints.get("lt", frozenset())
-        if varq(lessValue):
-            (mostLiteral, leastSet) = ltWalk(lessValue, lessThans)
-            if not varq(moreValue) and mostLiteral is not None:
-                if mostLiteral + 1 == moreValue:
-                    return make_constraint(state, False, eq, less, mostLiteral)
-                else:
-                    return make_constraint(state, mostLiteral >= moreValue, lt, less, more)
-            else:
-                if moreValue in leastSet:
-                    return mzero
-        if varq(moreValue):
-            (leastLiteral, mostSet) = mtWalk(moreValue, lessThans)
-            if not varq(lessValue) and leastLiteral is not None:
-                if leastLiteral - 1 == lessValue:
-                    return make_constraint(state, False, eq, more, leastLiteral)
-                else:
-                    return make_constraint(state, lessValue >= leastLiteral, lt, less, more)
-            else:
-                if lessValue in mostSet:
-                    return mzero
-        return make_constraint(state, False, lt, less, more)
-    return generate(ltHelp)
-
-def gt(more, less):
-    return lt(less, more)
-
 def incro(augend, total):
     """Assert that when augend is increased by one, the result is total."""
     def incroHelp(state):
@@ -226,14 +127,19 @@ def leno(lst, length):
             var_number = state.count - 1
             for var_number in range(state.count, state.count + length_):
                 new_list = Link(var(var_number), new_list)
-            newState = State(state.constraints, state.constraintFunctions, var_number + 1, state.id)
+            newState = State(state.constraints, state.constraintFunctions, var_number + 1, state.id,
+                             state.watchers, state.woken)
             yield from eq(lst_, new_list)(newState)
         else:
             temp_lst = lst_
             size = 0
             while temp_lst != () and not varq(temp_lst) and not temp_lst.is_empty():
-                temp_lst = temp_lst.tail
-                size += 1
+                if isinstance(temp_lst, Chunk):
+                    size += temp_lst.known_length()
+                    temp_lst = temp_lst.rest
+                else:
+                    temp_lst = temp_lst.tail
+                    size += 1
             if varq(temp_lst):
                 yield from call_fresh(lambda len_rest: conj_x(addo(size, len_rest, length_),
                                                               leno(temp_lst, len_rest)))(state)
@@ -272,7 +178,14 @@ def indexo(lst, elem, index):
             curr_index = 0
             while temp_lst != () and not varq(temp_lst) and not temp_lst.is_empty():
                 if not varq(index_):
-                    if curr_index == index_:
+                    if isinstance(temp_lst, Chunk) and index_ >= curr_index + temp_lst.known_length():
+                        curr_index += temp_lst.known_length()
+                        temp_lst = temp_lst.rest
+                        continue
+                    elif isinstance(temp_lst, Chunk) and index_ >= curr_index:
+                        yield from eq(elem_, temp_lst.known(index_ - curr_index))(state)
+                        return
+                    elif curr_index == index_:
                         yield from eq(elem_, temp_lst.head)(state)
                         return
                     elif curr_index > index_:
@@ -394,7 +307,7 @@ def equal_except_from_to(list1, list2, toIndex, fromIndex):
                                indexo(list1, eqVal, eqIndex),
                                indexo(list2, eqVal, eqIndex)))
 
-def step_pair(stepBefore, stepAfter):
+def step_pair(stepBefore, stepAfter, discs=3):
     return conj_x(is_step(stepBefore),
                   is_step(stepAfter),
                   call_fresh_x(lambda actionBefore, actionFromIndex, actionToIndex, stateBefore, stateAfter:
@@ -410,13 +323,13 @@ def step_pair(stepBefore, stepAfter):
                                                    indexo(stateAfter, afterToStack, actionToIndex))),
                                       leno(stateBefore, 3),
                                       leno(stateAfter, 3),
-                                      hanoi_size(stateAfter, 3),
-                                      hanoi_size(stateBefore, 3))))
+                                      hanoi_size(stateAfter, discs),
+                                      hanoi_size(stateBefore, discs))))
 
-def hanoi_path(path):
-    return between_all(path, step_pair)
+def hanoi_path(path, discs=3):
+    return between_all(path, lambda stepBefore, stepAfter: step_pair(stepBefore, stepAfter, discs))
 
-def solve_hanoi(start_state, path, end_state):
+def solve_hanoi(start_state, path, end_state, discs=3):
     def walk_path(sub_path):
         return call_fresh_x(lambda last_action:
                             disj_x(eq(sub_path, Link(Link(last_action, end_state))),
@@ -432,5 +345,76 @@ def solve_hanoi(start_state, path, end_state):
     return call_fresh_x(lambda rest_path, last_action:
                         conj_x(conso(Link(Link(), start_state), rest_path, path),
                                walk_path(rest_path),
-                               hanoi_path(path)))
+                               hanoi_path(path, discs)))
+
+def plan_hanoi(start_state, path, end_state, discs=3):
+    """The same puzzle as `solve_hanoi`, but planned forwards: `path` is built
+    up from `start_state` one step at a time, each step a move from the towers
+    before it, never going back to towers it's already been through. Every
+    partial path ends with a known set of towers, which makes it something a
+    heuristic can judge, see `hanoi_cost`."""
+    start = Link(Link(), start_state)
+    def plan_from(step, towers, rest, seen):
+        return disj_x(conj_x(eq(towers, end_state), eq(rest, Link())),
+                      call_fresh_x(lambda next_step, next_rest, next_action, next_towers:
+                                   conj_x(conso(next_step, next_rest, rest),
+                                          step_pair(step, next_step, discs),
+                                          conso(next_action, next_towers, next_step),
+                                          *([neq(next_towers, old) for old in seen] +
+                                            [plan_from(next_step, next_towers, next_rest, seen + (next_towers,))]))))
+
+    return call_fresh_x(lambda rest:
+                        conj(eq(path, Link(start, rest)),
+                             plan_from(start, start_state, rest, (start_state,))))
+
+def link_length(link):
+    length = 0
+    while isinstance(link, Link) and not link.is_empty():
+        length += 1
+        link = link.tail
+    return length
+
+def hanoi_cost(path, discs=3):
+    """An A* cost for a BEST_FIRST search over `plan_hanoi`: the moves made so
+    far, plus the discs not yet on the last tower, each of which has at least
+    one move to go.
+
+    A branch that reaches towers another already got to in fewer moves, or in
+    as many moves by a different path, has nothing new to find. Its cost is
+    None, so the search drops it rather than keeping it in the queue.
+
+    @param path: The path given to `plan_hanoi`.
+    @param discs: How many discs there are.
+    @return: A function taking a state and a depth, and returning a cost or
+    None.
+    """
+    best = {}
+    def cost(state, depth):
+        substitution = state.constraints.get('eq', frozenset())
+        towers = []
+        node = walk(path, substitution)
+        while isinstance(node, Link) and not node.is_empty():
+            step = walk(node.head, substitution)
+            if not isinstance(step, Link):
+                break
+            towers.append(step.tail)
+            node = walk(node.tail, substitution)
+        for moves in reversed(range(len(towers))):
+            reached = deep_walk(towers[moves], substitution)
+            if isinstance(reached, Link) and reached._ground:
+                break
+        else:
+            return (discs, -depth)
+        (fewest, came_from) = best.get(reached, (None, None))
+        if fewest is None or moves <= fewest:
+            before = deep_walk(towers[moves - 1], substitution) if moves else None
+            if fewest is None or moves < fewest:
+                best[reached] = (moves, before)
+            elif before != came_from:
+                return None
+        else:
+            return None
+        left = discs - link_length(reached.tail.tail.head)
+        return (moves + left, -depth)
+    return cost
 
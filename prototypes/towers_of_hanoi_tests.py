@@ -292,6 +292,15 @@ class Test_Leno(Test_Conso_Fixtures):
         self.assertEqual(len(states), 1)
         self.assertEqual(states[0], [3])
 
+    def test_chunk_get_length(self):
+        states = list(run_x(lambda length: leno(list_to_chunk(['dum', 'dee']), length))(State()))
+        self.assertEqual(states, [[2]])
+
+    def test_chunk_open_tail(self):
+        states = list(run_x(lambda length: conj(eq(var(50), Link('Alice')),
+                                                leno(list_to_chunk(['dum', 'dee'], var(50)), length)))(State()))
+        self.assertEqual(states, [[3]])
+
 class Test_Indexo(Test_Conso_Fixtures):
     def test_indexo_const_just_one_passes(self):
         states = list(indexo(Link('Alice'), 'Alice', 0)(State()))
@@ -336,6 +345,15 @@ class Test_Indexo(Test_Conso_Fixtures):
         self.assertEqual(len(states), 1)
         self.assertEqual(states[0], [2])
 
+    def test_indexo_chunk(self):
+        party = list_to_chunk(['Hatter', 'Hare', 'Dormouse'])
+        states = list(run_x(lambda name: indexo(party, name, 2))(State()))
+        self.assertEqual(states, [['Dormouse']])
+        states = list(run_x(lambda index: indexo(party, 'Hare', index))(State()))
+        self.assertEqual(states, [[1]])
+        states = list(indexo(party, 'Hatter', 3)(State()))
+        self.assertEqual(len(states), 0)
+
     def test_indexo_more_than_one(self):
         states = list(run_x(lambda index: indexo(list_to_links(['Card', 'Queen', 'Card']), 'Card', index))(State()))
         self.assertEqual(len(states), 2)
@@ -453,5 +471,34 @@ class Test_Is_Step_Pair(Test_Hanoi_Fixtures):
         states = list(step_pair(step1, step2)(State()))
         self.assertEqual(len(states), 0)
 
+class Test_Plan_Hanoi(unittest.TestCase):
+    def plan(self, discs, strategy, heuristic=None):
+        start = list_to_links([list(range(discs)), [], []])
+        end = list_to_links([[], [], list(range(discs))])
+        for (path,) in run_x(lambda path: plan_hanoi(start, path, end, discs), strategy, heuristic=heuristic)(State()):
+            return path
+
+    def test_best_first(self):
+        path = self.plan(2, BEST_FIRST, lambda path: hanoi_cost(path, 2))
+        self.assertEqual(link_length(path), 4)
+        self.assertEqual(path.tail.tail.tail.head.tail, list_to_links([[], [], [0, 1]]))
+
+    def test_optimal_for_three(self):
+        path = self.plan(3, BEST_FIRST, lambda path: hanoi_cost(path, 3))
+        self.assertEqual(link_length(path), 8)
+
+    def test_cost(self):
+        path = var(0, 'path')
+        cost = hanoi_cost(path, 2)
+        start = Link(Link(), list_to_links([[0, 1], [], []]))
+        moved = Link(Link(0, 2), list_to_links([[1], [], [0]]))
+        state = State({'eq': {(path, list_to_links([start]))}}, {'eq': eq}, 1)
+        self.assertEqual(cost(state, 3), (0 + 2, -3))
+        state = State({'eq': {(path, list_to_links([start, moved]))}}, {'eq': eq}, 1)
+        self.assertEqual(cost(state, 5), (1 + 1, -5))
+        back = Link(Link(2, 0), list_to_links([[0, 1], [], []]))
+        state = State({'eq': {(path, list_to_links([start, moved, back]))}}, {'eq': eq}, 1)
+        self.assertIsNone(cost(state, 5))
+
 if __name__ == "__main__":
     unittest.main()